@@ -0,0 +1,125 @@
+"""
+Compara la latencia de realizar_transferencia_api en modo inline y en modo
+asíncrono (cola + worker process_transfers).
+
+En modo inline cada petición incluye la transacción que mueve el saldo; en
+modo asíncrono la petición solo valida e inserta la fila PENDIENTE y un worker
+en segundo plano procesa la cola por lotes. Se reporta p50/p99 de las
+peticiones, el tiempo hasta vaciar la cola y se verifica que el saldo total
+se conserve.
+
+Uso:
+    python benchmarks/bench_cola_transferencias.py --hilos 8 --peticiones 2000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+
+from entorno import base_temporal, crear_cuentas, iniciar_django, resumen_latencias
+
+
+def cliente(cuentas, cantidad, asincrona, semilla, latencias, candado):
+    from django.db import connection
+    from django.test import Client
+
+    azar = random.Random(semilla)
+    http = Client()
+    locales = []
+    try:
+        for _ in range(cantidad):
+            origen, destino = azar.sample(cuentas, 2)
+            cuerpo = json.dumps({
+                'cuenta_origen': origen.numero_cuenta,
+                'cuenta_destino': destino.numero_cuenta,
+                'monto': azar.randint(1, 100),
+                'asincrona': asincrona,
+            })
+            inicio = time.perf_counter()
+            respuesta = http.post('/transferencia/api/realizar/', cuerpo, content_type='application/json')
+            locales.append(time.perf_counter() - inicio)
+            assert respuesta.status_code in (201, 202, 400), respuesta.content
+    finally:
+        connection.close()
+        with candado:
+            latencias.extend(locales)
+
+
+def worker(detener):
+    from django.db import OperationalError, connection
+    from transferencia.motor import ReclamoPerdido, SaldoInsuficiente, procesar_reclamadas, reclamar_en_cola
+
+    try:
+        while True:
+            try:
+                reclamadas = reclamar_en_cola('bench', 500, timedelta(seconds=60))
+                procesar_reclamadas(reclamadas, 'bench')
+            except (SaldoInsuficiente, ReclamoPerdido, OperationalError):
+                continue
+            if not reclamadas:
+                if detener.is_set():
+                    return
+                time.sleep(0.01)
+    finally:
+        connection.close()
+
+
+def ejecutar(modo, args):
+    from django.db.models import Sum
+    from cuenta.models import Cuenta
+    from transferencia.models import Transferencia
+
+    asincrona = modo == 'asincrono'
+    with base_temporal({'timeout': 60}):
+        cuentas = crear_cuentas(args.cuentas, '1000000.00')
+        total_inicial = Cuenta.objects.aggregate(total=Sum('saldo_disponible'))['total']
+
+        detener = threading.Event()
+        hilo_worker = threading.Thread(target=worker, args=(detener,)) if asincrona else None
+        if hilo_worker:
+            hilo_worker.start()
+
+        latencias, candado = [], threading.Lock()
+        por_hilo = args.peticiones // args.hilos
+        hilos = [
+            threading.Thread(target=cliente, args=(cuentas, por_hilo, asincrona, i, latencias, candado))
+            for i in range(args.hilos)
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        fin_peticiones = time.perf_counter() - inicio
+
+        if hilo_worker:
+            detener.set()
+            hilo_worker.join()
+        fin_total = time.perf_counter() - inicio
+
+        total_final = Cuenta.objects.aggregate(total=Sum('saldo_disponible'))['total']
+        pendientes = Transferencia.objects.filter(estado='PENDIENTE').count()
+        resumen = resumen_latencias(latencias)
+        print(f"{modo:>10}: peticiones={len(latencias)} p50={resumen['p50_ms']}ms p99={resumen['p99_ms']}ms "
+              f"max={resumen['max_ms']}ms peticiones_por_segundo={len(latencias) / fin_peticiones:.1f} "
+              f"hasta_procesar_todo={fin_total:.2f}s pendientes={pendientes} "
+              f"saldo_conservado={total_inicial == total_final}")
+        return total_inicial == total_final and pendientes == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--peticiones', type=int, default=2000, help='total entre todos los hilos')
+    parser.add_argument('--cuentas', type=int, default=50)
+    args = parser.parse_args()
+
+    iniciar_django()
+    correcto = all([ejecutar('inline', args), ejecutar('asincrono', args)])
+    return 0 if correcto else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
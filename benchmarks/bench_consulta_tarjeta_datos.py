@@ -0,0 +1,109 @@
+"""
+Benchmark de consultar_tarjeta_por_datos_api a medida que crece la tabla de tarjetas.
+
+Inserta tarjetas por etapas (bulk_create, con huella_datos calculada) y en
+cada etapa mide consultas por últimos 4 dígitos, CVC y vencimiento a través
+de la vista: la mitad de tarjetas existentes y la mitad inexistentes. Con
+--comparar mide también el filtro anterior (sin huella, recorre la tabla).
+La latencia indexada debería mantenerse constante entre etapas.
+
+Uso:
+    python benchmarks/bench_consulta_tarjeta_datos.py --tamanos 10000,100000,1000000 --consultas 2000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from entorno import base_temporal, iniciar_django, resumen_latencias
+
+
+def insertar_tarjetas(desde, hasta, usuario, azar):
+    from tarjeta_credito.models import TarjetaCredito, formatear_numero_tarjeta, huella_datos_tarjeta
+
+    lote = []
+    for numero in range(desde, hasta):
+        numero_tarjeta = formatear_numero_tarjeta('5555', numero)
+        cvc = f'{azar.randint(0, 999):03d}'
+        vencimiento = date(2027, 1, 1) + timedelta(days=azar.randint(0, 365 * 3))
+        lote.append(TarjetaCredito(
+            usuario=usuario, numero_tarjeta=numero_tarjeta, ultimos_4_digitos=numero_tarjeta[-4:],
+            cvc=cvc, fecha_vencimiento=vencimiento,
+            huella_datos=huella_datos_tarjeta(numero_tarjeta[-4:], cvc, vencimiento),
+        ))
+        if len(lote) == 5000:
+            TarjetaCredito.objects.bulk_create(lote)
+            lote = []
+    TarjetaCredito.objects.bulk_create(lote)
+
+
+def medir_vista(muestras):
+    from django.test import Client
+
+    http = Client()
+    latencias, encontradas = [], 0
+    for ultimos_4, cvc, vencimiento in muestras:
+        cuerpo = json.dumps({'ultimos_4_digitos': ultimos_4, 'cvc': cvc, 'fecha_vencimiento': vencimiento.isoformat()})
+        inicio = time.perf_counter()
+        respuesta = http.post('/tarjeta-credito/api/consultar-datos/', cuerpo, content_type='application/json')
+        latencias.append(time.perf_counter() - inicio)
+        encontradas += respuesta.status_code == 200
+    return latencias, encontradas
+
+
+def medir_recorrido(muestras):
+    from tarjeta_credito.models import TarjetaCredito
+
+    latencias = []
+    for ultimos_4, cvc, vencimiento in muestras:
+        inicio = time.perf_counter()
+        TarjetaCredito.objects.filter(ultimos_4_digitos=ultimos_4, cvc=cvc, fecha_vencimiento=vencimiento).first()
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tamanos', default='10000,100000,1000000',
+                        help='cantidades acumuladas de tarjetas, separadas por coma')
+    parser.add_argument('--consultas', type=int, default=2000, help='consultas por etapa')
+    parser.add_argument('--comparar', action='store_true', help='medir también el filtro sin huella')
+    args = parser.parse_args()
+
+    iniciar_django()
+    import logging
+    # Las consultas de tarjetas inexistentes responden 404: sin un warning por cada una
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    from django.contrib.auth.models import User
+    from tarjeta_credito.models import TarjetaCredito
+
+    azar = random.Random(42)
+    with base_temporal():
+        usuario = User.objects.create(username='bench')
+        cantidad = 0
+        for tamano in (int(valor) for valor in args.tamanos.split(',')):
+            inicio = time.perf_counter()
+            insertar_tarjetas(cantidad + 1, tamano + 1, usuario, azar)
+            cantidad = tamano
+            carga = time.perf_counter() - inicio
+
+            existentes = list(
+                TarjetaCredito.objects.filter(pk__in=[azar.randint(1, cantidad) for _ in range(args.consultas // 2)])
+                .values_list('ultimos_4_digitos', 'cvc', 'fecha_vencimiento')
+            )
+            inexistentes = [('0000', '000', date(2020, 1, 1))] * (args.consultas - len(existentes))
+            muestras = existentes + inexistentes
+            azar.shuffle(muestras)
+
+            latencias, encontradas = medir_vista(muestras)
+            print(f'tarjetas={cantidad} carga={carga:.1f}s consultas={len(muestras)} encontradas={encontradas}')
+            print(f'  indexada (vista): {resumen_latencias(latencias)}')
+            if args.comparar:
+                recorrido = medir_recorrido(muestras[:max(1, args.consultas // 20)])
+                print(f'  sin huella (ORM): {resumen_latencias(recorrido)}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""
+Emisión de tarjetas por lotes (tarjeta_credito.emision.emitir_tarjetas).
+
+Crea los usuarios y emite una tarjeta para cada uno, separando el tiempo
+de cada etapa de un lote: reserva de números (con la consulta de
+colisiones), armado de las instancias, números con el dígito de Luhn por
+lotes, CVC/vencimiento/huella e inserción con bulk_create.
+
+Uso:
+    python benchmarks/bench_emision_tarjetas.py --tarjetas 100000
+"""
+import argparse
+import time
+from decimal import Decimal
+
+from entorno import base_temporal, iniciar_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tarjetas', type=int, default=100000)
+    parser.add_argument('--tamano-lote', type=int, default=1000)
+    args = parser.parse_args()
+
+    iniciar_django()
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from tarjeta_credito.emision import emitir_tarjetas
+    from tarjeta_credito.models import TarjetaCredito, asignador_tarjetas, numerar_tarjetas
+
+    with base_temporal():
+        User.objects.bulk_create([User(username=f'bench{i}') for i in range(2 * args.tarjetas)])
+        usuarios = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        solicitudes = [
+            (usuario_id, 'CABAL' if i % 2 else 'CREDICARD', Decimal('50000.00'))
+            for i, usuario_id in enumerate(usuarios)
+        ]
+
+        inicio = time.perf_counter()
+        emitir_tarjetas(solicitudes[:args.tarjetas], tamano_lote=args.tamano_lote)
+        total = time.perf_counter() - inicio
+        print(f'emitir_tarjetas: {args.tarjetas} tarjetas en {total:.1f} s ({args.tarjetas / total:.0f}/s)')
+
+        # Las mismas etapas por separado, con otros usuarios
+        etapas = dict.fromkeys(('reserva', 'instancias', 'numeros', 'datos', 'bulk_create'), 0.0)
+        restantes = solicitudes[args.tarjetas:]
+        for desde in range(0, len(restantes), args.tamano_lote):
+            lote = restantes[desde:desde + args.tamano_lote]
+            with transaction.atomic():
+                marca = time.perf_counter()
+                numeros = asignador_tarjetas.reservar(len(lote))
+                etapas['reserva'] += time.perf_counter() - marca
+                marca = time.perf_counter()
+                tarjetas = [
+                    TarjetaCredito(usuario_id=usuario_id, marca=marca_tarjeta,
+                                   limite_credito=limite, credito_disponible=limite)
+                    for usuario_id, marca_tarjeta, limite in lote
+                ]
+                etapas['instancias'] += time.perf_counter() - marca
+                marca = time.perf_counter()
+                numerar_tarjetas(tarjetas, numeros)
+                etapas['numeros'] += time.perf_counter() - marca
+                marca = time.perf_counter()
+                for tarjeta in tarjetas:
+                    tarjeta.completar_datos()
+                etapas['datos'] += time.perf_counter() - marca
+                marca = time.perf_counter()
+                TarjetaCredito.objects.bulk_create(tarjetas)
+                etapas['bulk_create'] += time.perf_counter() - marca
+        print('por etapa: ' + ' '.join(f'{nombre}={segundos:.2f}s' for nombre, segundos in etapas.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+"""
+Costo por petición de las métricas de nucleo.metricas.
+
+Mide por separado lo que agrega cada parte:
+- MetricasMiddleware sin la vista (inicio y cierre de la medición de una petición)
+- la medición de cada consulta a la base (execute_wrapper)
+- una consulta de transferencia completa por django.test.Client con y sin
+  MetricasMiddleware y la medición de consultas
+- armar la respuesta de /metrics con todas las rutas ya medidas
+
+Uso:
+    python benchmarks/bench_metricas.py --peticiones 5000 --repeticiones 5
+"""
+import argparse
+import time
+from decimal import Decimal
+
+from entorno import base_temporal, crear_cuentas, iniciar_django
+
+
+def medir(funcion, cantidad, repeticiones):
+    """Mejor tiempo por llamada, en microsegundos"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(cantidad):
+            funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / cantidad * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--peticiones', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=5, help='se informa la mejor repetición')
+    args = parser.parse_args()
+
+    iniciar_django()
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import Client, RequestFactory, override_settings
+    from django.conf import settings
+    from nucleo.metricas import MetricasMiddleware, _medicion_bd, _medir_consulta, agregadas, formatear
+    from transferencia.models import Transferencia
+
+    peticion = RequestFactory().get('/transferencia/api/consultar/X/')
+    peticion.resolver_match = None
+    respuesta = HttpResponse()
+    sola = MetricasMiddleware(lambda request: respuesta)
+    vacia = medir(lambda: respuesta, args.peticiones, args.repeticiones)
+    print(f'middleware sin vista: {medir(lambda: sola(peticion), args.peticiones, args.repeticiones) - vacia:.2f} us/petición')
+
+    with base_temporal():
+        origen, destino = crear_cuentas(2, '1000')
+        transferencia = Transferencia.objects.create(cuenta_origen=origen, cuenta_destino=destino, monto=Decimal('1'))
+        url = f'/transferencia/api/consultar/{transferencia.referencia}/'
+        cursor = connection.cursor()
+
+        def consulta():
+            cursor.execute('SELECT 1')
+
+        connection.ensure_connection()
+        token = _medicion_bd.set([0, 0.0])  # como dentro de una petición
+        con_medicion = medir(consulta, args.peticiones, args.repeticiones)
+        connection.execute_wrappers.remove(_medir_consulta)
+        sin_medicion = medir(consulta, args.peticiones, args.repeticiones)
+        _medicion_bd.reset(token)
+        print(f'medición de una consulta: {con_medicion - sin_medicion:.2f} us/consulta')
+
+        sin_middleware = [m for m in settings.MIDDLEWARE if m != 'nucleo.metricas.MetricasMiddleware']
+        with override_settings(MIDDLEWARE=sin_middleware):
+            cliente_sin = Client()
+            cliente_sin.get(url)  # carga la cadena de middleware sin MetricasMiddleware
+        cliente_con = Client()
+        cliente_con.get(url)
+
+        # Las variantes se alternan para que el calentamiento no favorezca a ninguna
+        sin_metricas = con_metricas = float('inf')
+        for _ in range(args.repeticiones):
+            sin_metricas = min(sin_metricas, medir(lambda: cliente_sin.get(url), args.peticiones, 1))
+            connection.execute_wrappers.append(_medir_consulta)
+            con_metricas = min(con_metricas, medir(lambda: cliente_con.get(url), args.peticiones, 1))
+            connection.execute_wrappers.remove(_medir_consulta)
+        print(f'consulta de transferencia: sin métricas={sin_metricas:.1f} us con métricas={con_metricas:.1f} us '
+              f'(+{con_metricas - sin_metricas:.1f} us, {(con_metricas - sin_metricas) / sin_metricas:.1%})')
+        print(f'/metrics: {medir(lambda: formatear(agregadas()), 100, args.repeticiones):.0f} us')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+"""
+Benchmark de retenciones concurrentes sobre una sola tarjeta "caliente".
+
+Varios hilos pagan con la misma tarjeta a través de pagar_con_tarjeta hasta
+agotar el crédito. Al final verifica que:
+  - credito_disponible nunca quedó negativo,
+  - la suma de las transacciones aprobadas no supera el límite,
+  - credito_disponible == limite_credito - suma de transacciones pendientes.
+Reporta autorizaciones por segundo y latencias p50/p99.
+
+Uso:
+    python benchmarks/bench_retencion_credito.py --hilos 8 --pagos 4000
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from entorno import base_temporal, iniciar_django, resumen_latencias
+
+
+def cliente(identificador, cantidad, semilla, resultados, latencias, candado):
+    from django.db import connection
+    from django.test import Client
+
+    azar = random.Random(semilla)
+    http = Client()
+    locales, latencias_locales = Counter(), []
+    try:
+        for _ in range(cantidad):
+            cuerpo = json.dumps({'id_tarjeta': identificador, 'monto': azar.randint(1, 200)})
+            inicio = time.perf_counter()
+            respuesta = http.post('/tarjeta-credito/pagar/', cuerpo, content_type='application/json')
+            latencias_locales.append(time.perf_counter() - inicio)
+            locales[respuesta.status_code] += 1
+    finally:
+        connection.close()
+        with candado:
+            resultados.update(locales)
+            latencias.extend(latencias_locales)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--pagos', type=int, default=4000, help='total entre todos los hilos')
+    parser.add_argument('--limite', default='100000.00', help='límite de crédito de la tarjeta')
+    args = parser.parse_args()
+
+    iniciar_django()
+    # Los rechazos por crédito insuficiente son esperados: sin un warning por cada 400
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    from django.contrib.auth.models import User
+    from django.db.models import Sum
+    from tarjeta_credito.models import TarjetaCredito, TransaccionTarjeta
+
+    with base_temporal({'timeout': 60}):
+        usuario = User.objects.create(username='bench')
+        limite = Decimal(args.limite)
+        tarjeta = TarjetaCredito.objects.create(usuario=usuario, limite_credito=limite, credito_disponible=limite)
+
+        resultados, latencias, candado = Counter(), [], threading.Lock()
+        por_hilo = args.pagos // args.hilos
+        hilos = [
+            threading.Thread(
+                target=cliente,
+                args=(str(tarjeta.identificador_unico), por_hilo, i, resultados, latencias, candado),
+            )
+            for i in range(args.hilos)
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        tarjeta.refresh_from_db()
+        aprobado = TransaccionTarjeta.objects.filter(tarjeta=tarjeta).aggregate(s=Sum('monto'))['s'] or Decimal('0')
+        procesados = sum(resultados.values())
+        print(f'hilos={args.hilos} pagos={procesados} limite={limite}')
+        print(f'duracion={duracion:.2f}s autorizaciones_por_segundo={procesados / duracion:.1f}')
+        print(f'aprobados(201)={resultados[201]} rechazados(400)={resultados[400]} otros={procesados - resultados[201] - resultados[400]}')
+        print(f'latencias={resumen_latencias(latencias)}')
+        print(f'credito_disponible={tarjeta.credito_disponible} total_aprobado={aprobado}')
+
+        correcto = (
+            tarjeta.credito_disponible >= 0
+            and aprobado <= limite
+            and tarjeta.credito_disponible == limite - aprobado
+            and resultados[201] == TransaccionTarjeta.objects.filter(tarjeta=tarjeta).count()
+        )
+        print('OK' if correcto else 'ERROR: la tarjeta se sobregiró o se perdió una retención')
+        return 0 if correcto else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
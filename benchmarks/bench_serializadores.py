@@ -0,0 +1,171 @@
+"""
+Benchmark de las proyecciones de nucleo.proyecciones contra el armado anterior de las respuestas.
+
+Para transferencias, detalle de tarjeta y transacciones de tarjeta compara el
+armado anterior de las vistas (instancias completas con select_related y
+diccionario a mano) con la Proyeccion correspondiente: una consulta por
+respuesta (como en la vista) y la serialización de muchas filas de una vez.
+Antes de medir verifica que ambas formas produzcan la misma salida.
+
+Uso:
+    python benchmarks/bench_serializadores.py --filas 2000 --repeticiones 5
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from entorno import base_temporal, crear_cuentas, iniciar_django
+
+
+def transferencia_anterior(transferencia):
+    return {
+        'referencia': transferencia.referencia,
+        'monto': str(transferencia.monto),
+        'concepto': transferencia.concepto,
+        'estado': transferencia.estado,
+        'estado_display': transferencia.get_estado_display(),
+        'fecha_creacion': transferencia.fecha_creacion.isoformat(),
+        'fecha_procesamiento': transferencia.fecha_procesamiento.isoformat() if transferencia.fecha_procesamiento else None,
+        'cuenta_origen': {
+            'numero_cuenta': transferencia.cuenta_origen.numero_cuenta,
+            'usuario': transferencia.cuenta_origen.usuario.username,
+            'tipo_cuenta': transferencia.cuenta_origen.get_tipo_cuenta_display()
+        },
+        'cuenta_destino': {
+            'numero_cuenta': transferencia.cuenta_destino.numero_cuenta,
+            'usuario': transferencia.cuenta_destino.usuario.username,
+            'tipo_cuenta': transferencia.cuenta_destino.get_tipo_cuenta_display()
+        }
+    }
+
+
+def tarjeta_anterior(tarjeta):
+    return {
+        'id': tarjeta.id,
+        'numero_enmascarado': tarjeta.numero_enmascarado,
+        'marca': tarjeta.marca,
+        'marca_display': tarjeta.get_marca_display(),
+        'ultimos_4_digitos': tarjeta.ultimos_4_digitos,
+        'fecha_vencimiento': tarjeta.fecha_vencimiento.isoformat(),
+        'estado': tarjeta.estado_efectivo,
+        'estado_display': tarjeta.estado_efectivo_display,
+        'limite_credito': str(tarjeta.limite_credito),
+        'credito_disponible': str(tarjeta.credito_disponible),
+        'credito_utilizado': str(tarjeta.credito_utilizado),
+        'esta_vencida': tarjeta.esta_vencida,
+        'fecha_creacion': tarjeta.fecha_creacion.isoformat(),
+        'usuario': tarjeta.usuario.username
+    }
+
+
+def transaccion_anterior(transaccion):
+    return {
+        'transaccion': {
+            'id': str(transaccion.id_transaccion),
+            'monto': float(transaccion.monto),
+            'estado': transaccion.estado,
+            'fecha_pago': transaccion.fecha_pago.isoformat(),
+            'fecha_cobro': transaccion.fecha_cobro.isoformat() if transaccion.fecha_cobro else None,
+            'numero_cuenta_destino': transaccion.numero_cuenta_destino,
+            'descripcion': transaccion.descripcion
+        },
+        'tarjeta': {
+            'marca': transaccion.tarjeta.marca,
+            'ultimos_4_digitos': transaccion.tarjeta.ultimos_4_digitos
+        }
+    }
+
+
+def poblar(filas):
+    from tarjeta_credito.models import TarjetaCredito, TransaccionTarjeta, formatear_numero_tarjeta
+    from transferencia.models import Transferencia
+
+    origen, destino = crear_cuentas(2, '1000000')
+    Transferencia.objects.bulk_create(
+        Transferencia(cuenta_origen=origen, cuenta_destino=destino, monto=Decimal('10.50'),
+                      concepto=f'Pago {i}', referencia=f'BENCH{i:08d}', estado='COMPLETADA')
+        for i in range(filas)
+    )
+    tarjetas = []
+    for i in range(filas):
+        tarjeta = TarjetaCredito(usuario=origen.usuario, numero_tarjeta=formatear_numero_tarjeta('5555', i + 1),
+                                 limite_credito=Decimal('50000'), credito_disponible=Decimal('49000.50'))
+        tarjeta.completar_datos()
+        tarjeta.fecha_vencimiento = date.today() + timedelta(days=i % 900 - 30)
+        tarjetas.append(tarjeta)
+    tarjetas = TarjetaCredito.objects.bulk_create(tarjetas)
+    TransaccionTarjeta.objects.bulk_create(
+        TransaccionTarjeta(tarjeta=tarjeta, monto=Decimal('99.99'), descripcion='Compra', numero_cuenta_destino='1')
+        for tarjeta in tarjetas
+    )
+
+
+def casos():
+    from tarjeta_credito.models import TarjetaCredito, TransaccionTarjeta
+    from tarjeta_credito.serializadores import TARJETA_DETALLE, TRANSACCION
+    from transferencia.models import Transferencia
+    from transferencia.serializadores import TRANSFERENCIA
+
+    return [
+        ('transferencia',
+         lambda: Transferencia.objects.select_related('cuenta_origen__usuario', 'cuenta_destino__usuario'),
+         transferencia_anterior, TRANSFERENCIA, Transferencia.objects.all, 'referencia'),
+        ('tarjeta',
+         lambda: TarjetaCredito.objects.con_estado_efectivo().select_related('usuario'),
+         tarjeta_anterior, TARJETA_DETALLE, TarjetaCredito.objects.all, 'id'),
+        ('transaccion',
+         lambda: TransaccionTarjeta.objects.select_related('tarjeta'),
+         transaccion_anterior, TRANSACCION, TransaccionTarjeta.objects.all, 'id_transaccion'),
+    ]
+
+
+def medir(funcion, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--filas', type=int, default=2000, help='filas por modelo')
+    parser.add_argument('--consultas', type=int, default=500, help='consultas individuales por caso')
+    parser.add_argument('--repeticiones', type=int, default=5, help='se informa la mejor repetición')
+    args = parser.parse_args()
+
+    iniciar_django()
+    with base_temporal():
+        poblar(args.filas)
+        for nombre, consulta_anterior, armar_anterior, proyeccion, consulta_nueva, clave in casos():
+            claves = list(consulta_nueva().order_by('pk').values_list(clave, flat=True)[:args.consultas])
+            anterior = [armar_anterior(objeto) for objeto in consulta_anterior().order_by('pk')]
+            nueva = proyeccion.todas(consulta_nueva().order_by('pk'))
+            assert anterior == nueva, f'{nombre}: las salidas difieren'
+
+            def una_anterior():
+                for valor in claves:
+                    armar_anterior(consulta_anterior().get(**{clave: valor}))
+
+            def una_nueva():
+                for valor in claves:
+                    proyeccion.primera(consulta_nueva().filter(**{clave: valor}))
+
+            tiempos = {
+                'una por consulta': (medir(una_anterior, args.repeticiones), medir(una_nueva, args.repeticiones), len(claves)),
+                'listado': (
+                    medir(lambda: [armar_anterior(o) for o in consulta_anterior()], args.repeticiones),
+                    medir(lambda: proyeccion.todas(consulta_nueva()), args.repeticiones),
+                    args.filas,
+                ),
+            }
+            for modo, (t_anterior, t_nueva, cantidad) in tiempos.items():
+                print(f'{nombre:<13} {modo:<17} anterior={cantidad / t_anterior:9.0f}/s '
+                      f'proyeccion={cantidad / t_nueva:9.0f}/s  x{t_anterior / t_nueva:.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
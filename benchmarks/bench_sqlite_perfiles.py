@@ -0,0 +1,137 @@
+"""
+Benchmark de escrituras concurrentes en SQLite: settings de desarrollo contra el perfil de producción.
+
+Corre la misma carga con home_banking.settings y con home_banking.settings_produccion
+(cada perfil en un proceso aparte, porque los settings se eligen al iniciar
+Django): hilos escritores que crean y procesan transferencias entre cuentas al
+azar mientras hilos lectores consultan saldos y las últimas transferencias.
+Informa escrituras y lecturas por segundo y cuántas operaciones fallaron con
+OperationalError ("database is locked").
+
+Uso:
+    python benchmarks/bench_sqlite_perfiles.py --escritores 8 --lectores 4 --transferencias 2000
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from entorno import base_temporal, crear_cuentas, iniciar_django
+
+PERFILES = {
+    'desarrollo': 'home_banking.settings',
+    'produccion': 'home_banking.settings_produccion',
+}
+
+
+def escritor(cuentas, cantidad, semilla, contadores, candado):
+    from django.db import OperationalError, connection
+    from transferencia.models import Transferencia
+
+    azar = random.Random(semilla)
+    locales = Counter()
+    try:
+        for _ in range(cantidad):
+            origen, destino = azar.sample(cuentas, 2)
+            try:
+                transferencia = Transferencia.objects.create(
+                    cuenta_origen=origen, cuenta_destino=destino, monto=Decimal(azar.randint(1, 50))
+                )
+                transferencia.procesar_transferencia()
+                locales['escrituras'] += 1
+            except OperationalError as e:
+                locales[f'error escritura: {e}'] += 1
+    finally:
+        connection.close()
+        with candado:
+            contadores.update(locales)
+
+
+def lector(cuentas, semilla, terminado, contadores, candado):
+    from django.db import OperationalError, connection
+    from cuenta.models import Cuenta
+    from transferencia.models import Transferencia
+
+    azar = random.Random(semilla)
+    locales = Counter()
+    try:
+        while not terminado.is_set():
+            cuenta = azar.choice(cuentas)
+            try:
+                Cuenta.objects.values_list('saldo_disponible', flat=True).get(pk=cuenta.pk)
+                list(Transferencia.objects.filter(cuenta_origen=cuenta).order_by('-id')[:20].values_list('referencia'))
+                locales['lecturas'] += 1
+            except OperationalError as e:
+                locales[f'error lectura: {e}'] += 1
+    finally:
+        connection.close()
+        with candado:
+            contadores.update(locales)
+
+
+def correr_perfil(args):
+    iniciar_django()
+    from django.conf import settings
+
+    with base_temporal():
+        cuentas = crear_cuentas(args.cuentas, '1000000.00')
+        contadores, candado, terminado = Counter(), threading.Lock(), threading.Event()
+        por_hilo = args.transferencias // args.escritores
+        escritores = [
+            threading.Thread(target=escritor, args=(cuentas, por_hilo, i, contadores, candado))
+            for i in range(args.escritores)
+        ]
+        lectores = [
+            threading.Thread(target=lector, args=(cuentas, 1000 + i, terminado, contadores, candado))
+            for i in range(args.lectores)
+        ]
+        inicio = time.perf_counter()
+        for hilo in escritores + lectores:
+            hilo.start()
+        for hilo in escritores:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+        terminado.set()
+        for hilo in lectores:
+            hilo.join()
+
+    errores = sum(cantidad for mensaje, cantidad in contadores.items() if mensaje.startswith('error'))
+    intentos = por_hilo * args.escritores
+    print(f"perfil={args.perfil} ({settings.SETTINGS_MODULE}) duracion={duracion:.2f}s")
+    print(f"  escrituras/s={contadores['escrituras'] / duracion:.1f} lecturas/s={contadores['lecturas'] / duracion:.1f}")
+    print(f"  errores={errores} tasa_errores_escritura={(intentos - contadores['escrituras']) / intentos:.2%}")
+    for mensaje, cantidad in sorted(contadores.items()):
+        if mensaje.startswith('error'):
+            print(f'    {mensaje}: {cantidad}')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--perfil', choices=['ambos', *PERFILES], default='ambos')
+    parser.add_argument('--escritores', type=int, default=8)
+    parser.add_argument('--lectores', type=int, default=4)
+    parser.add_argument('--transferencias', type=int, default=2000, help='total entre todos los escritores')
+    parser.add_argument('--cuentas', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.perfil != 'ambos':
+        os.environ['DJANGO_SETTINGS_MODULE'] = PERFILES[args.perfil]
+        return correr_perfil(args)
+
+    codigo = 0
+    for perfil in PERFILES:
+        comando = [sys.executable, __file__, '--perfil', perfil] + [
+            f'--{nombre}={getattr(args, nombre)}' for nombre in ('escritores', 'lectores', 'transferencias', 'cuentas')
+        ]
+        codigo |= subprocess.run(comando).returncode
+    return codigo
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
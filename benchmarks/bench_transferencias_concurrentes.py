@@ -0,0 +1,105 @@
+"""
+Benchmark de concurrencia del motor de transferencias.
+
+Lanza varios hilos que transfieren en ambos sentidos entre unas pocas cuentas
+"calientes" y al final verifica que:
+  - la suma de saldos no cambió,
+  - ningún saldo quedó negativo,
+  - el saldo de cada cuenta coincide con sus transferencias COMPLETADAS.
+
+Uso:
+    python benchmarks/bench_transferencias_concurrentes.py --hilos 8 --transferencias 4000
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from entorno import base_temporal, crear_cuentas, iniciar_django
+
+
+def trabajador(cuentas, cantidad, semilla, resultados, errores, candado):
+    from django.db import OperationalError, connection
+    from transferencia.models import Transferencia
+
+    azar = random.Random(semilla)
+    locales, errores_locales = Counter(), Counter()
+    try:
+        for _ in range(cantidad):
+            origen, destino = azar.sample(cuentas, 2)
+            monto = Decimal(azar.randint(1, 500))
+            try:
+                transferencia = Transferencia.objects.create(
+                    cuenta_origen=origen, cuenta_destino=destino, monto=monto
+                )
+                exito, mensaje = transferencia.procesar_transferencia()
+                locales[mensaje if not exito else 'COMPLETADA'] += 1
+            except OperationalError as e:
+                errores_locales[str(e)] += 1
+    finally:
+        connection.close()
+        with candado:
+            resultados.update(locales)
+            errores.update(errores_locales)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--transferencias', type=int, default=4000, help='total entre todos los hilos')
+    parser.add_argument('--cuentas', type=int, default=4)
+    parser.add_argument('--saldo', default='2000.00')
+    args = parser.parse_args()
+
+    iniciar_django()
+    from django.db.models import Q, Sum
+    from cuenta.models import Cuenta
+    from transferencia.models import Transferencia
+
+    with base_temporal({'timeout': 60}):
+        cuentas = crear_cuentas(args.cuentas, args.saldo)
+        total_inicial = Cuenta.objects.aggregate(total=Sum('saldo_disponible'))['total']
+
+        resultados, errores, candado = Counter(), Counter(), threading.Lock()
+        por_hilo = args.transferencias // args.hilos
+        hilos = [
+            threading.Thread(target=trabajador, args=(cuentas, por_hilo, i, resultados, errores, candado))
+            for i in range(args.hilos)
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        total_final = Cuenta.objects.aggregate(total=Sum('saldo_disponible'))['total']
+        negativas = Cuenta.objects.filter(saldo_disponible__lt=0).count()
+        descuadradas = 0
+        for cuenta in Cuenta.objects.all():
+            completadas = Transferencia.objects.filter(estado='COMPLETADA')
+            salidas = completadas.filter(cuenta_origen=cuenta).aggregate(s=Sum('monto'))['s'] or 0
+            entradas = completadas.filter(cuenta_destino=cuenta).aggregate(s=Sum('monto'))['s'] or 0
+            if Decimal(args.saldo) - salidas + entradas != cuenta.saldo_disponible:
+                descuadradas += 1
+        pendientes = Transferencia.objects.filter(~Q(estado__in=['COMPLETADA', 'FALLIDA'])).count()
+
+        procesadas = sum(resultados.values())
+        print(f'hilos={args.hilos} cuentas={args.cuentas} transferencias={procesadas}')
+        print(f'duracion={duracion:.2f}s transferencias_por_segundo={procesadas / duracion:.1f}')
+        for mensaje, cantidad in sorted(resultados.items()):
+            print(f'  {mensaje}: {cantidad}')
+        for mensaje, cantidad in sorted(errores.items()):
+            print(f'  error "{mensaje}": {cantidad}')
+        print(f'saldo_total_inicial={total_inicial} saldo_total_final={total_final}')
+        print(f'cuentas_negativas={negativas} cuentas_descuadradas={descuadradas} sin_procesar={pendientes}')
+
+        correcto = total_inicial == total_final and negativas == 0 and descuadradas == 0
+        print('OK' if correcto else 'ERROR: el saldo total no se conservó')
+        return 0 if correcto else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""
+Prueba de carga HTTP de gunicorn con cada modelo de worker (sync, gthread, uvicorn).
+
+Prepara una base SQLite temporal con el perfil de producción (cuentas,
+transferencias y tarjetas), levanta gunicorn con gunicorn.conf.py para cada
+modelo y lanza clientes concurrentes con conexiones keep-alive durante un
+tiempo fijo. La mezcla de peticiones es: consulta de transferencia, consulta
+de tarjeta, saldo por username y, en la proporción de --escrituras, nuevas
+transferencias. Las semillas son fijas, así que cada corrida envía la misma
+secuencia de peticiones.
+
+Uso:
+    python benchmarks/carga_http.py --modelos sync,gthread,uvicorn --clientes 32 --duracion 20
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from entorno import RAIZ, crear_cuentas, iniciar_django, percentil, resumen_latencias
+
+
+def preparar_base(ruta, cantidad_cuentas):
+    """Migra la base temporal y crea los datos que consulta la carga"""
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'home_banking.settings_produccion'
+    os.environ['DJANGO_DB_PATH'] = ruta
+    iniciar_django()
+    from decimal import Decimal
+    from django.core.management import call_command
+    from django.db import connections
+    from tarjeta_credito.models import TarjetaCredito
+    from transferencia.models import Transferencia
+
+    call_command('migrate', verbosity=0)
+    cuentas = crear_cuentas(cantidad_cuentas, '1000000.00', prefijo='carga')
+    referencias = []
+    for i, origen in enumerate(cuentas):
+        destino = cuentas[(i + 1) % len(cuentas)]
+        transferencia = Transferencia.objects.create(cuenta_origen=origen, cuenta_destino=destino, monto=Decimal('10'))
+        transferencia.procesar_transferencia()
+        referencias.append(transferencia.referencia)
+    tarjetas = [TarjetaCredito.objects.create(usuario=cuenta.usuario).pk for cuenta in cuentas]
+    datos = {
+        'referencias': referencias,
+        'tarjetas': tarjetas,
+        'usernames': [cuenta.usuario.username for cuenta in cuentas],
+        'numeros_cuenta': [cuenta.numero_cuenta for cuenta in cuentas],
+    }
+    connections.close_all()
+    return datos
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def levantar_gunicorn(modelo, puerto, ruta, workers, **variables):
+    entorno = dict(
+        os.environ,
+        **variables,
+        GUNICORN_WORKER_CLASS=modelo,
+        GUNICORN_BIND=f'127.0.0.1:{puerto}',
+        DJANGO_SETTINGS_MODULE='home_banking.settings_produccion',
+        DJANGO_DB_PATH=ruta,
+    )
+    if workers:
+        entorno['GUNICORN_WORKERS'] = str(workers)
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(RAIZ / 'gunicorn.conf.py')],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            requests.get(f'http://127.0.0.1:{puerto}/metrics', timeout=1)
+            return proceso
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError(f'gunicorn ({modelo}) no respondió en 30 s')
+
+
+def cliente(base, datos, semilla, fin, escrituras, latencias, resultados, candado):
+    azar = random.Random(semilla)
+    sesion = requests.Session()
+    locales, estados = [], Counter()
+    while time.monotonic() < fin:
+        sorteo = azar.random()
+        if sorteo < escrituras:
+            origen, destino = azar.sample(datos['numeros_cuenta'], 2)
+            peticion = ('POST', f'{base}/transferencia/api/realizar/',
+                        {'json': {'cuenta_origen': origen, 'cuenta_destino': destino, 'monto': 1}})
+        elif sorteo < escrituras + (1 - escrituras) / 2:
+            peticion = ('GET', f"{base}/transferencia/api/consultar/{azar.choice(datos['referencias'])}/", {})
+        elif sorteo < escrituras + (1 - escrituras) * 3 / 4:
+            peticion = ('GET', f"{base}/tarjeta-credito/api/consultar/{azar.choice(datos['tarjetas'])}/", {})
+        else:
+            peticion = ('GET', f'{base}/cuenta/api/saldo/', {'params': {'username': azar.choice(datos['usernames'])}})
+        metodo, url, extra = peticion
+        inicio = time.perf_counter()
+        try:
+            estado = sesion.request(metodo, url, timeout=30, **extra).status_code
+        except requests.RequestException as e:
+            estado = e.__class__.__name__
+        locales.append(time.perf_counter() - inicio)
+        estados[estado] += 1
+    with candado:
+        latencias.extend(locales)
+        resultados.update(estados)
+
+
+def medir(modelo, puerto, datos, args):
+    base = f'http://127.0.0.1:{puerto}'
+    latencias, resultados, candado = [], Counter(), threading.Lock()
+    # Calentamiento: los workers importan, abren conexiones y llenan cachés
+    fin = time.monotonic() + args.calentamiento
+    cliente(base, datos, -1, fin, args.escrituras, [], Counter(), candado)
+
+    fin = time.monotonic() + args.duracion
+    hilos = [
+        threading.Thread(target=cliente,
+                         args=(base, datos, i, fin, args.escrituras, latencias, resultados, candado))
+        for i in range(args.clientes)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    errores = sum(cantidad for estado, cantidad in resultados.items() if not (isinstance(estado, int) and estado < 400))
+    resumen = resumen_latencias(latencias)
+    print(f'modelo={modelo} clientes={args.clientes} peticiones={len(latencias)} '
+          f'peticiones/s={len(latencias) / args.duracion:.1f} errores={errores}')
+    print(f"  p50={resumen['p50_ms']}ms p95={round(percentil(latencias, 95) * 1000, 3)}ms "
+          f"p99={resumen['p99_ms']}ms max={resumen['max_ms']}ms estados={dict(resultados)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modelos', default='sync,gthread,uvicorn', help='modelos separados por coma')
+    parser.add_argument('--clientes', type=int, default=32, help='conexiones concurrentes')
+    parser.add_argument('--duracion', type=float, default=20, help='segundos de medición por modelo')
+    parser.add_argument('--calentamiento', type=float, default=2, help='segundos previos sin medir')
+    parser.add_argument('--escrituras', type=float, default=0.1, help='proporción de transferencias nuevas')
+    parser.add_argument('--cuentas', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=0, help='por defecto, el cálculo de gunicorn.conf.py')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='home-banking-carga-') as directorio:
+        ruta = os.path.join(directorio, 'carga.sqlite3')
+        datos = preparar_base(ruta, args.cuentas)
+        for modelo in args.modelos.split(','):
+            puerto = puerto_libre()
+            proceso = levantar_gunicorn(modelo, puerto, ruta, args.workers)
+            try:
+                medir(modelo, puerto, datos, args)
+            finally:
+                proceso.terminate()
+                proceso.wait(timeout=60)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
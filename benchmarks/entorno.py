@@ -0,0 +1,85 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+Inicializa Django y crea una base de datos temporal en disco: los benchmarks
+concurrentes abren una conexión por hilo y la base SQLite en memoria de los
+tests no sirve para eso. Nunca se toca db.sqlite3.
+"""
+import contextlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def iniciar_django():
+    """Configura Django con los settings del proyecto"""
+    if str(RAIZ) not in sys.path:
+        sys.path.insert(0, str(RAIZ))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'home_banking.settings')
+
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def base_temporal(opciones=None):
+    """
+    Crea una base de datos de prueba con las migraciones aplicadas y la
+    elimina al salir. También prepara el entorno de tests para poder usar
+    django.test.Client. `opciones` se agrega a DATABASES['default']['OPTIONS']
+    antes de abrir la primera conexión (por ejemplo {'timeout': 30}).
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    directorio = tempfile.mkdtemp(prefix='home-banking-bench-')
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directorio, 'bench.sqlite3')
+    if opciones:
+        connection.settings_dict['OPTIONS'].update(opciones)
+
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+        shutil.rmtree(directorio, ignore_errors=True)
+        teardown_test_environment()
+
+
+def crear_cuentas(cantidad, saldo, prefijo='bench'):
+    """Crea `cantidad` usuarios con su cuenta y retorna las cuentas"""
+    from django.contrib.auth.models import User
+    from cuenta.models import Cuenta
+
+    cuentas = []
+    for i in range(cantidad):
+        usuario = User.objects.create(username=f'{prefijo}{i}')
+        cuentas.append(Cuenta.objects.create(usuario=usuario, saldo_disponible=Decimal(saldo)))
+    return cuentas
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por el método de rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def resumen_latencias(latencias):
+    """Resumen en milisegundos de una lista de latencias en segundos"""
+    return {
+        'p50_ms': round(statistics.median(latencias) * 1000, 3) if latencias else 0.0,
+        'p99_ms': round(percentil(latencias, 99) * 1000, 3),
+        'max_ms': round(max(latencias) * 1000, 3) if latencias else 0.0,
+    }
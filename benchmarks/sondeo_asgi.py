@@ -0,0 +1,116 @@
+"""
+Sondeo con miles de conexiones abiertas: vistas async contra sincrónicas.
+
+Simula a la casa de cambio consultando el estado de transferencias: cada
+conexión keep-alive pide GET /transferencia/api/consultar/<referencia>/ cada
+--intervalo segundos. Levanta gunicorn (gunicorn.conf.py) en cada variante:
+- asgi-async: workers uvicorn con API_ASINCRONA (vistas async)
+- asgi-sync: workers uvicorn con las vistas sincrónicas
+- gthread: WSGI con hilos
+e informa sondeos completados, latencias y errores. El cliente usa asyncio
+con sockets propios para poder abrir miles de conexiones desde un proceso;
+si el servidor cierra una conexión, se reconecta en el sondeo siguiente.
+
+Uso:
+    python benchmarks/sondeo_asgi.py --conexiones 2000 --intervalo 10 --duracion 30 --workers 1
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from carga_http import levantar_gunicorn, preparar_base, puerto_libre
+from entorno import percentil, resumen_latencias
+
+VARIANTES = {
+    'asgi-async': ('uvicorn', {'DJANGO_API_ASINCRONA': '1'}),
+    'asgi-sync': ('uvicorn', {'DJANGO_API_ASINCRONA': '0'}),
+    'gthread': ('gthread', {}),
+}
+
+
+async def sondear(puerto, referencias, semilla, intervalo, fin, latencias, estados):
+    azar = random.Random(semilla)
+    # Las conexiones arrancan repartidas dentro del primer intervalo
+    await asyncio.sleep(azar.random() * intervalo)
+    conexion = None
+    while time.monotonic() < fin:
+        inicio = time.perf_counter()
+        try:
+            if conexion is None:
+                conexion = await asyncio.open_connection('127.0.0.1', puerto)
+            estado = await consultar(*conexion, azar.choice(referencias))
+            latencias.append(time.perf_counter() - inicio)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            estado = e.__class__.__name__
+        estados[estado] += 1
+        if estado != 200 and conexion is not None:
+            # El servidor cerró o rechazó la conexión: se reconecta en el próximo sondeo
+            conexion[1].close()
+            conexion = None
+        await asyncio.sleep(max(0.0, intervalo - (time.perf_counter() - inicio)))
+    if conexion is not None:
+        conexion[1].close()
+
+
+async def consultar(lector, escritor, referencia):
+    escritor.write(f'GET /transferencia/api/consultar/{referencia}/ HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+    linea_estado = await asyncio.wait_for(lector.readline(), timeout=30)
+    if not linea_estado:
+        raise ConnectionResetError('conexión cerrada por el servidor')
+    largo = 0
+    while (cabecera := await lector.readline()) not in (b'\r\n', b''):
+        nombre, _, valor = cabecera.decode('latin-1').partition(':')
+        if nombre.lower() == 'content-length':
+            largo = int(valor)
+    await lector.readexactly(largo)
+    return int(linea_estado.split()[1])
+
+
+async def medir(puerto, referencias, args):
+    latencias, estados = [], Counter()
+    fin = time.monotonic() + args.duracion
+    await asyncio.gather(*(
+        sondear(puerto, referencias, i, args.intervalo, fin, latencias, estados)
+        for i in range(args.conexiones)
+    ))
+    return latencias, estados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--variantes', default=','.join(VARIANTES), help='separadas por coma')
+    parser.add_argument('--conexiones', type=int, default=2000)
+    parser.add_argument('--intervalo', type=float, default=10.0, help='segundos entre sondeos de una conexión')
+    parser.add_argument('--duracion', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='home-banking-sondeo-') as directorio:
+        ruta = os.path.join(directorio, 'sondeo.sqlite3')
+        referencias = preparar_base(ruta, 50)['referencias']
+        for variante in args.variantes.split(','):
+            modelo, variables = VARIANTES[variante]
+            puerto = puerto_libre()
+            proceso = levantar_gunicorn(modelo, puerto, ruta, args.workers, **variables)
+            try:
+                latencias, estados = asyncio.run(medir(puerto, referencias, args))
+            finally:
+                proceso.terminate()
+                proceso.wait(timeout=60)
+
+            esperados = args.conexiones * args.duracion / args.intervalo
+            resumen = resumen_latencias(latencias)
+            errores = sum(cantidad for estado, cantidad in estados.items() if estado != 200)
+            print(f'{variante}: conexiones={args.conexiones} sondeos={len(latencias)} '
+                  f'({len(latencias) / esperados:.0%} de lo esperado) errores={errores}')
+            print(f"  p50={resumen['p50_ms']}ms p95={round(percentil(latencias, 95) * 1000, 3)}ms "
+                  f"p99={resumen['p99_ms']}ms estados={dict(estados)}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
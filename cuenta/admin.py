@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cuenta
+from .models import CheckpointSaldo, Cuenta, MovimientoCuenta
 
 @admin.register(Cuenta)
 class CuentaAdmin(admin.ModelAdmin):
@@ -10,5 +10,27 @@ class CuentaAdmin(admin.ModelAdmin):
 
     def get_readonly_fields(self, request, obj=None):
         if obj:  # editing an existing object
-            return self.readonly_fields + ['usuario']
+            # El saldo solo cambia con movimientos registrados en el libro
+            return self.readonly_fields + ['usuario', 'saldo_disponible']
         return self.readonly_fields
+
+
+@admin.register(MovimientoCuenta)
+class MovimientoCuentaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'cuenta', 'tipo', 'monto', 'referencia', 'fecha']
+    list_filter = ['tipo', 'fecha']
+    search_fields = ['referencia', 'cuenta__numero_cuenta']
+    raw_id_fields = ['cuenta']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CheckpointSaldo)
+class CheckpointSaldoAdmin(admin.ModelAdmin):
+    list_display = ['cuenta', 'saldo', 'hasta_movimiento', 'fecha_corte', 'fecha_creacion']
+    search_fields = ['cuenta__numero_cuenta']
+    raw_id_fields = ['cuenta']
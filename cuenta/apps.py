@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CuentaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cuenta'
+
+    def ready(self):
+        from .directorio import conectar_senales
+        conectar_senales()
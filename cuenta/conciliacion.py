@@ -0,0 +1,154 @@
+"""
+Conciliación de saldos.
+
+Compara, por rangos de clave primaria:
+  - Cuenta.saldo_disponible contra el libro de movimientos y contra las
+    fuentes (apertura + transferencias COMPLETADAS + cobros de tarjeta),
+  - TarjetaCredito.credito_disponible contra el límite menos las
+    transacciones pendientes y cobradas.
+
+Cada rango se resuelve con pocas consultas agrupadas (GROUP BY) sobre los
+índices por cuenta/tarjeta, dentro de una transacción de solo lectura
+(DEFERRED) para ver una foto consistente. Solo se retornan las diferencias,
+así que la memoria no depende del tamaño de las tablas.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+
+from tarjeta_credito.models import TarjetaCredito, TransaccionTarjeta
+from transferencia.models import Transferencia
+from .models import Cuenta, MovimientoCuenta
+
+CERO = Decimal('0')
+CENTAVO = Decimal('0.01')
+
+
+def rangos(modelo, tamano):
+    """Rangos [desde, hasta) de claves primarias que cubren la tabla"""
+    limites = modelo.objects.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+    if limites['minimo'] is None:
+        return
+    for desde in range(limites['minimo'], limites['maximo'] + 1, tamano):
+        yield desde, desde + tamano
+
+
+def activar_solo_lectura():
+    """
+    Impide escrituras desde la conexión actual (procesos de conciliación).
+
+    En SQLite las transacciones de la conexión pasan a DEFERRED aunque el
+    perfil use BEGIN IMMEDIATE: IMMEDIATE pide el bloqueo de escritura, que
+    query_only rechaza, y lo retendría durante todo el recorrido. Con WAL una
+    transacción DEFERRED lee una foto consistente sin bloquear a nadie.
+    Retorna el modo anterior para desactivar_solo_lectura.
+    """
+    connection.ensure_connection()
+    modo_anterior = getattr(connection, 'transaction_mode', None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            connection.transaction_mode = 'DEFERRED'
+            cursor.execute('PRAGMA query_only = ON')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SET default_transaction_read_only = on')
+    return modo_anterior
+
+
+def desactivar_solo_lectura(modo_anterior):
+    """Deshace activar_solo_lectura en la conexión actual"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA query_only = OFF')
+            connection.transaction_mode = modo_anterior
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SET default_transaction_read_only = off')
+
+
+def _sumas(queryset, campo):
+    """{valor de campo: suma de monto} con una consulta agrupada"""
+    filas = queryset.values(campo).annotate(total=Sum('monto')).order_by().values_list(campo, 'total')
+    return {clave: total.quantize(CENTAVO) for clave, total in filas}
+
+
+def conciliar_cuentas(desde, hasta):
+    """Retorna (cuentas revisadas, diferencias) para las cuentas con pk en [desde, hasta)"""
+    with transaction.atomic():
+        cuentas = list(
+            Cuenta.objects.filter(pk__gte=desde, pk__lt=hasta)
+            .values_list('pk', 'numero_cuenta', 'saldo_disponible')
+        )
+        if not cuentas:
+            return 0, []
+
+        completadas = Transferencia.objects.filter(estado='COMPLETADA')
+        salidas = _sumas(completadas.filter(cuenta_origen_id__gte=desde, cuenta_origen_id__lt=hasta), 'cuenta_origen')
+        entradas = _sumas(completadas.filter(cuenta_destino_id__gte=desde, cuenta_destino_id__lt=hasta), 'cuenta_destino')
+        cobros = _sumas(
+            TransaccionTarjeta.objects.filter(
+                estado='cobrada', numero_cuenta_destino__in=[numero for _, numero, _ in cuentas]
+            ),
+            'numero_cuenta_destino',
+        )
+        libro, aperturas = {}, {}
+        movimientos = (
+            MovimientoCuenta.objects.filter(cuenta_id__gte=desde, cuenta_id__lt=hasta)
+            .values('cuenta', 'tipo').annotate(total=Sum('monto')).order_by()
+        )
+        for fila in movimientos:
+            total = fila['total'].quantize(CENTAVO)
+            libro[fila['cuenta']] = libro.get(fila['cuenta'], CERO) + total
+            if fila['tipo'] == 'APERTURA':
+                aperturas[fila['cuenta']] = total
+
+    diferencias = []
+    for pk, numero, saldo in cuentas:
+        segun_libro = libro.get(pk, CERO)
+        segun_fuentes = (
+            aperturas.get(pk, CERO) + entradas.get(pk, CERO) - salidas.get(pk, CERO) + cobros.get(numero, CERO)
+        )
+        for control, esperado in (('saldo_vs_libro', segun_libro), ('saldo_vs_fuentes', segun_fuentes)):
+            if saldo != esperado:
+                diferencias.append({
+                    'tipo': 'cuenta', 'control': control, 'id': pk, 'numero_cuenta': numero,
+                    'registrado': str(saldo), 'esperado': str(esperado), 'diferencia': str(saldo - esperado),
+                })
+    return len(cuentas), diferencias
+
+
+def conciliar_tarjetas(desde, hasta):
+    """Retorna (tarjetas revisadas, diferencias) para las tarjetas con pk en [desde, hasta)"""
+    with transaction.atomic():
+        tarjetas = list(
+            TarjetaCredito.objects.filter(pk__gte=desde, pk__lt=hasta)
+            .values_list('pk', 'ultimos_4_digitos', 'limite_credito', 'credito_disponible')
+        )
+        if not tarjetas:
+            return 0, []
+        utilizado = _sumas(
+            TransaccionTarjeta.objects.filter(
+                tarjeta_id__gte=desde, tarjeta_id__lt=hasta, estado__in=['pendiente', 'cobrada']
+            ),
+            'tarjeta',
+        )
+
+    diferencias = []
+    for pk, ultimos_4, limite, disponible in tarjetas:
+        esperado = limite - utilizado.get(pk, CERO)
+        if disponible != esperado:
+            diferencias.append({
+                'tipo': 'tarjeta', 'control': 'credito_vs_transacciones', 'id': pk, 'ultimos_4_digitos': ultimos_4,
+                'registrado': str(disponible), 'esperado': str(esperado), 'diferencia': str(disponible - esperado),
+            })
+    return len(tarjetas), diferencias
+
+
+TAREAS = {
+    'cuentas': (Cuenta, conciliar_cuentas),
+    'tarjetas': (TarjetaCredito, conciliar_tarjetas),
+}
+
+
+def ejecutar_tarea(nombre, desde, hasta):
+    """Punto de entrada de los procesos del pool (debe ser importable)"""
+    return nombre, TAREAS[nombre][1](desde, hasta)
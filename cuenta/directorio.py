@@ -0,0 +1,188 @@
+"""
+Directorio de usuarios en memoria para las APIs que reciben ?username=.
+
+Mapea username -> id de usuario, cuenta y un resumen de sus tarjetas, con
+tamaño acotado (LRU) y vencimiento por TTL. Se invalida con las señales
+post_save/post_delete de User, Cuenta y TarjetaCredito (ver CuentaConfig.ready)
+y explícitamente desde las escrituras masivas que no emiten señales.
+
+Solo guarda datos que no cambian con la operación diaria: ni saldos ni
+crédito disponible, que se siguen leyendo de la base. La caché es por
+proceso; con varios workers, los cambios hechos por otro proceso se ven a
+lo sumo DIRECTORIO_USUARIOS_TTL_SEGUNDOS después.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from nucleo.metricas import Contador, Medidor, registrar_recolector
+
+EntradaDirectorio = namedtuple('EntradaDirectorio', 'usuario_id username cuenta_id numero_cuenta tarjetas')
+ResumenTarjeta = namedtuple('ResumenTarjeta', 'id identificador_unico numero_tarjeta marca fecha_vencimiento')
+
+
+class DirectorioUsuarios:
+
+    def __init__(self, max_entradas=None, ttl=None):
+        self._max_entradas = max_entradas
+        self._ttl = ttl
+        self._candado = threading.Lock()
+        self._entradas = OrderedDict()
+        self._usernames = {}
+        self._version = 0
+        self.aciertos = self.fallos = self.desalojos = 0
+
+    @property
+    def max_entradas(self):
+        return self._max_entradas or getattr(settings, 'DIRECTORIO_USUARIOS_MAX_ENTRADAS', 10000)
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, 'DIRECTORIO_USUARIOS_TTL_SEGUNDOS', 60)
+
+    def buscar(self, username):
+        """EntradaDirectorio del usuario, o None si no existe"""
+        guardada, version = self._consultar(username)
+        if guardada is not None:
+            return guardada
+        return self._guardar(username, self._cargar(username), version)
+
+    async def abuscar(self, username):
+        """buscar() para vistas async: los fallos se cargan con el ORM asíncrono"""
+        guardada, version = self._consultar(username)
+        if guardada is not None:
+            return guardada
+        return self._guardar(username, await self._acargar(username), version)
+
+    def _consultar(self, username):
+        """(entrada vigente o None, versión con la que guardar lo que se lea)"""
+        with self._candado:
+            guardada = self._entradas.get(username)
+            if guardada is not None and guardada[1] > time.monotonic():
+                self._entradas.move_to_end(username)
+                self.aciertos += 1
+                return guardada[0], None
+            self.fallos += 1
+            return None, self._version
+
+    def _guardar(self, username, entrada, version):
+        if entrada is None:
+            return None
+        with self._candado:
+            # Si hubo una invalidación mientras se leía, lo leído puede estar viejo
+            if version == self._version:
+                self._entradas[username] = (entrada, time.monotonic() + self.ttl)
+                self._entradas.move_to_end(username)
+                self._usernames[entrada.usuario_id] = username
+                while len(self._entradas) > self.max_entradas:
+                    _, (desalojada, _) = self._entradas.popitem(last=False)
+                    self._usernames.pop(desalojada.usuario_id, None)
+                    self.desalojos += 1
+        return entrada
+
+    @staticmethod
+    def _consulta_usuario(username):
+        return User.objects.filter(username=username).values_list('id', 'cuenta__id', 'cuenta__numero_cuenta')
+
+    @staticmethod
+    def _consulta_tarjetas(usuario_id):
+        from tarjeta_credito.models import TarjetaCredito
+
+        return (
+            TarjetaCredito.objects.filter(usuario_id=usuario_id).order_by('-fecha_creacion')
+            .values_list('id', 'identificador_unico', 'numero_tarjeta', 'marca', 'fecha_vencimiento')
+        )
+
+    def _cargar(self, username):
+        fila = self._consulta_usuario(username).first()
+        if fila is None:
+            return None
+        usuario_id, cuenta_id, numero_cuenta = fila
+        tarjetas = tuple(ResumenTarjeta(*valores) for valores in self._consulta_tarjetas(usuario_id))
+        return EntradaDirectorio(usuario_id, username, cuenta_id, numero_cuenta, tarjetas)
+
+    async def _acargar(self, username):
+        fila = await self._consulta_usuario(username).afirst()
+        if fila is None:
+            return None
+        usuario_id, cuenta_id, numero_cuenta = fila
+        tarjetas = tuple([ResumenTarjeta(*valores) async for valores in self._consulta_tarjetas(usuario_id)])
+        return EntradaDirectorio(usuario_id, username, cuenta_id, numero_cuenta, tarjetas)
+
+    def invalidar(self, usuario_ids=(), usernames=()):
+        """Descarta las entradas de esos usuarios, ahora y al confirmar la transacción en curso"""
+        self._descartar(usuario_ids, usernames)
+        transaction.on_commit(lambda: self._descartar(usuario_ids, usernames))
+
+    def _descartar(self, usuario_ids, usernames):
+        with self._candado:
+            self._version += 1
+            for usuario_id in usuario_ids:
+                username = self._usernames.pop(usuario_id, None)
+                if username is not None:
+                    self._entradas.pop(username, None)
+            for username in usernames:
+                guardada = self._entradas.pop(username, None)
+                if guardada is not None:
+                    self._usernames.pop(guardada[0].usuario_id, None)
+
+    def limpiar(self):
+        with self._candado:
+            self._version += 1
+            self._entradas.clear()
+            self._usernames.clear()
+
+    def estadisticas(self):
+        with self._candado:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+directorio = DirectorioUsuarios()
+
+_CONSULTAS = Contador('homebanking_directorio_usuarios_consultas_total', 'Búsquedas en el directorio', ('resultado',))
+_DESALOJOS = Contador('homebanking_directorio_usuarios_desalojos_total', 'Entradas desalojadas por tamaño')
+_ENTRADAS = Medidor('homebanking_directorio_usuarios_entradas', 'Entradas en el directorio')
+
+
+def _recolectar_metricas():
+    estadisticas = directorio.estadisticas()
+    _CONSULTAS.fijar(estadisticas['aciertos'], 'acierto')
+    _CONSULTAS.fijar(estadisticas['fallos'], 'fallo')
+    _DESALOJOS.fijar(estadisticas['desalojos'])
+    _ENTRADAS.fijar(estadisticas['entradas'])
+
+
+registrar_recolector(_recolectar_metricas)
+
+
+def _al_cambiar_usuario(sender, instance, **kwargs):
+    directorio.invalidar(usuario_ids=[instance.pk], usernames=[instance.username])
+
+
+def _al_cambiar_cuenta_o_tarjeta(sender, instance, **kwargs):
+    directorio.invalidar(usuario_ids=[instance.usuario_id])
+
+
+def conectar_senales():
+    from django.db.models.signals import post_delete, post_save
+    from tarjeta_credito.models import TarjetaCredito
+    from .models import Cuenta
+
+    for nombre, senal in (('post_save', post_save), ('post_delete', post_delete)):
+        senal.connect(_al_cambiar_usuario, sender=User, dispatch_uid=f'directorio-User-{nombre}')
+        for modelo in (Cuenta, TarjetaCredito):
+            senal.connect(
+                _al_cambiar_cuenta_o_tarjeta, sender=modelo, dispatch_uid=f'directorio-{modelo.__name__}-{nombre}'
+            )
@@ -0,0 +1,127 @@
+"""
+Libro de movimientos y checkpoints de saldo.
+
+Cada cambio de Cuenta.saldo_disponible se registra como filas de
+MovimientoCuenta insertadas con bulk_create en la misma transacción. El saldo
+según el libro es el último checkpoint más la suma de los movimientos
+posteriores, así que nunca hace falta recorrer el historial completo.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CheckpointSaldo, Cuenta, MovimientoCuenta
+
+# Los movimientos más nuevos que esto quedan fuera del checkpoint: una
+# transacción todavía abierta podría confirmar después filas con id menor
+MARGEN_CHECKPOINT = timedelta(seconds=60)
+
+CENTAVO = Decimal('0.01')
+
+
+def movimientos_de_transferencias(transferencias, fecha=None):
+    """Débito y crédito de cada transferencia COMPLETADA (sin guardar)"""
+    fecha = fecha or timezone.now()
+    movimientos = []
+    for transferencia in transferencias:
+        if transferencia.estado != 'COMPLETADA':
+            continue
+        movimientos.append(MovimientoCuenta(
+            cuenta_id=transferencia.cuenta_origen_id, monto=-transferencia.monto,
+            tipo='DEBITO_TRANSFERENCIA', referencia=transferencia.referencia, fecha=fecha,
+        ))
+        movimientos.append(MovimientoCuenta(
+            cuenta_id=transferencia.cuenta_destino_id, monto=transferencia.monto,
+            tipo='CREDITO_TRANSFERENCIA', referencia=transferencia.referencia, fecha=fecha,
+        ))
+    return movimientos
+
+
+def registrar_transferencias(transferencias, fecha=None, tamano_lote=1000):
+    """Inserta los movimientos de las transferencias completadas. Llamar dentro de la transacción que mueve el saldo"""
+    MovimientoCuenta.objects.bulk_create(
+        movimientos_de_transferencias(transferencias, fecha), batch_size=tamano_lote
+    )
+
+
+def registrar_cobro_tarjeta(cuenta_id, monto, id_transaccion, fecha=None):
+    """Inserta el crédito de un cobro de tarjeta en la cuenta destino"""
+    MovimientoCuenta.objects.create(
+        cuenta_id=cuenta_id, monto=monto, tipo='CREDITO_COBRO_TARJETA',
+        referencia=str(id_transaccion), fecha=fecha or timezone.now(),
+    )
+
+
+def saldo_segun_libro(cuenta_id, hasta=None):
+    """
+    Saldo de la cuenta según el libro, al momento `hasta` (o el actual).
+    Usa el último checkpoint anterior a `hasta` y suma solo los movimientos
+    posteriores a ese checkpoint.
+    """
+    checkpoints = CheckpointSaldo.objects.filter(cuenta_id=cuenta_id)
+    if hasta is not None:
+        checkpoints = checkpoints.filter(fecha_corte__lte=hasta)
+    checkpoint = checkpoints.order_by('-hasta_movimiento').values_list('saldo', 'hasta_movimiento').first()
+    saldo, desde = checkpoint or (Decimal('0'), 0)
+
+    movimientos = MovimientoCuenta.objects.filter(cuenta_id=cuenta_id, id__gt=desde)
+    if hasta is not None:
+        movimientos = movimientos.filter(fecha__lte=hasta)
+    delta = movimientos.aggregate(total=Sum('monto'))['total'] or Decimal('0')
+    return (saldo + delta).quantize(CENTAVO)
+
+
+def crear_checkpoints(tamano_lote=1000, margen=MARGEN_CHECKPOINT):
+    """
+    Agrega un checkpoint a cada cuenta con movimientos nuevos desde su último
+    checkpoint. Procesa las cuentas por rangos de id con una consulta
+    agrupada por lote. Retorna la cantidad de checkpoints creados.
+    """
+    corte = (
+        MovimientoCuenta.objects.filter(fecha__lte=timezone.now() - margen)
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+    if corte is None:
+        return 0
+
+    ultimo_checkpoint = CheckpointSaldo.objects.filter(cuenta=OuterRef('cuenta')).order_by('-hasta_movimiento')
+    creados = 0
+    ultimo_id = 0
+    while True:
+        ids = list(
+            Cuenta.objects.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return creados
+        ultimo_id = ids[-1]
+
+        previos = {
+            checkpoint.cuenta_id: checkpoint
+            for checkpoint in CheckpointSaldo.objects.filter(
+                cuenta_id__in=ids, pk=Subquery(ultimo_checkpoint.values('pk')[:1])
+            )
+        }
+        desde_minimo = min((c.hasta_movimiento for c in previos.values()), default=0) if len(previos) == len(ids) else 0
+        deltas = (
+            MovimientoCuenta.objects
+            .filter(cuenta_id__in=ids, id__gt=desde_minimo, id__lte=corte)
+            .filter(id__gt=Coalesce(Subquery(ultimo_checkpoint.values('hasta_movimiento')[:1]), Value(0)))
+            .values('cuenta')
+            .annotate(delta=Sum('monto'), ultimo=Max('id'), fecha_corte=Max('fecha'))
+            .order_by()
+        )
+
+        nuevos = []
+        for fila in deltas:
+            previo = previos.get(fila['cuenta'])
+            nuevos.append(CheckpointSaldo(
+                cuenta_id=fila['cuenta'],
+                saldo=(previo.saldo if previo else Decimal('0')) + fila['delta'],
+                hasta_movimiento=fila['ultimo'],
+                fecha_corte=max(previo.fecha_corte, fila['fecha_corte']) if previo else fila['fecha_corte'],
+            ))
+        CheckpointSaldo.objects.bulk_create(nuevos)
+        creados += len(nuevos)
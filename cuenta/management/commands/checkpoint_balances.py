@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from cuenta.libro import crear_checkpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea checkpoints de saldo para las cuentas con movimientos nuevos en el libro. "
+        "Pensado para ejecutarse periódicamente (por ejemplo, cada noche)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=1000,
+                            help='Cuentas procesadas por consulta')
+
+    def handle(self, *args, **options):
+        creados = crear_checkpoints(tamano_lote=options['tamano_lote'])
+        self.stdout.write(f"Checkpoints de saldo creados: {creados}")
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cuenta.extractos import FORMATOS, lineas_extracto, parsear_fecha
+from cuenta.models import Cuenta
+
+
+class Command(BaseCommand):
+    help = "Exporta el extracto de una cuenta (CSV o JSONL) con saldo acumulado, para un rango de fechas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('numero_cuenta')
+        parser.add_argument('--desde', help='YYYY-MM-DD o ISO 8601 (inclusive)')
+        parser.add_argument('--hasta', help='YYYY-MM-DD o ISO 8601 (inclusive)')
+        parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto, stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = parsear_fecha(options['desde']) if options['desde'] else None
+            hasta = parsear_fecha(options['hasta'], fin_del_dia=True) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f"Fecha inválida: {e}")
+
+        cuenta = Cuenta.objects.filter(numero_cuenta=options['numero_cuenta']).only('id').first()
+        if cuenta is None:
+            raise CommandError(f"No existe la cuenta {options['numero_cuenta']}")
+
+        salida = open(options['salida'], 'w', newline='') if options['salida'] else sys.stdout
+        try:
+            for linea in lineas_extracto(cuenta.id, options['formato'], desde, hasta):
+                salida.write(linea)
+        finally:
+            if options['salida']:
+                salida.close()
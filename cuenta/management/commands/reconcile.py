@@ -0,0 +1,82 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cuenta.conciliacion import TAREAS, activar_solo_lectura, desactivar_solo_lectura, ejecutar_tarea, rangos
+
+
+def _iniciar_proceso():
+    """Inicializador del pool: Django listo y conexión nueva de solo lectura"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+    activar_solo_lectura()
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia los saldos de las cuentas (contra el libro de movimientos, las transferencias "
+        "y los cobros de tarjeta) y el crédito disponible de las tarjetas (contra sus "
+        "transacciones). Solo lee; reporta las diferencias encontradas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help='Procesos en paralelo (1 = sin pool)')
+        parser.add_argument('--tamano-rango', type=int, default=5000,
+                            help='Cantidad de ids de cuenta/tarjeta por tarea')
+        parser.add_argument('--solo', choices=sorted(TAREAS), action='append',
+                            help='Conciliar solo cuentas o solo tarjetas (repetible)')
+        parser.add_argument('--salida', help='Archivo JSONL con las diferencias (por defecto, stdout)')
+
+    def handle(self, *args, **options):
+        tareas = [
+            (nombre, desde, hasta)
+            for nombre in (options['solo'] or sorted(TAREAS))
+            for desde, hasta in rangos(TAREAS[nombre][0], options['tamano_rango'])
+        ]
+
+        salida = open(options['salida'], 'w') if options['salida'] else None
+        revisadas = {nombre: 0 for nombre in TAREAS}
+        total_diferencias = 0
+        try:
+            for nombre, (cantidad, diferencias) in self._resultados(tareas, options['procesos']):
+                revisadas[nombre] += cantidad
+                total_diferencias += len(diferencias)
+                for diferencia in diferencias:
+                    linea = json.dumps(diferencia)
+                    if salida:
+                        salida.write(linea + '\n')
+                    else:
+                        self.stdout.write(linea)
+        finally:
+            if salida:
+                salida.close()
+
+        resumen = ", ".join(f"{nombre}: {cantidad}" for nombre, cantidad in sorted(revisadas.items()))
+        if total_diferencias:
+            raise CommandError(f"Revisadas {resumen}. Diferencias: {total_diferencias}")
+        self.stderr.write(f"Revisadas {resumen}. Sin diferencias")
+
+    def _resultados(self, tareas, procesos):
+        if procesos <= 1:
+            modo_anterior = activar_solo_lectura()
+            try:
+                for tarea in tareas:
+                    yield ejecutar_tarea(*tarea)
+            finally:
+                desactivar_solo_lectura(modo_anterior)
+            return
+
+        # Los procesos hijos no deben heredar conexiones abiertas del padre
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+            futuros = [pool.submit(ejecutar_tarea, *tarea) for tarea in tareas]
+            for futuro in as_completed(futuros):
+                yield futuro.result()
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuenta', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckpointSaldo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('hasta_movimiento', models.BigIntegerField()),
+                ('fecha_corte', models.DateTimeField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('cuenta', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='cuenta.cuenta')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Saldo',
+                'verbose_name_plural': 'Checkpoints de Saldo',
+                'indexes': [models.Index(fields=['cuenta', '-hasta_movimiento'], name='checkpoint_cuenta_mov_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoCuenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monto', models.DecimalField(decimal_places=2, help_text='Positivo acredita, negativo debita', max_digits=15)),
+                ('tipo', models.CharField(choices=[('APERTURA', 'Saldo de apertura'), ('DEBITO_TRANSFERENCIA', 'Débito por transferencia'), ('CREDITO_TRANSFERENCIA', 'Crédito por transferencia'), ('CREDITO_COBRO_TARJETA', 'Crédito por cobro de tarjeta')], max_length=25)),
+                ('referencia', models.CharField(help_text='Referencia de la transferencia o id de la transacción', max_length=50)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cuenta', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='cuenta.cuenta')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Cuenta',
+                'verbose_name_plural': 'Movimientos de Cuenta',
+                'indexes': [models.Index(fields=['cuenta', 'id'], name='movimiento_cuenta_id_idx'), models.Index(fields=['cuenta', 'fecha'], name='movimiento_cuenta_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Sum
+
+TAMANO_LOTE = 1000
+
+
+def cargar_libro(apps, schema_editor):
+    """
+    Carga en el libro las transferencias completadas y los cobros de tarjeta
+    existentes. La diferencia entre el saldo actual de cada cuenta y esos
+    movimientos queda como movimiento de APERTURA.
+    """
+    Cuenta = apps.get_model('cuenta', 'Cuenta')
+    MovimientoCuenta = apps.get_model('cuenta', 'MovimientoCuenta')
+    Transferencia = apps.get_model('transferencia', 'Transferencia')
+    TransaccionTarjeta = apps.get_model('tarjeta_credito', 'TransaccionTarjeta')
+
+    pendientes = []
+
+    def agregar(movimiento):
+        pendientes.append(movimiento)
+        if len(pendientes) >= TAMANO_LOTE:
+            MovimientoCuenta.objects.bulk_create(pendientes)
+            pendientes.clear()
+
+    transferencias = (
+        Transferencia.objects.filter(estado='COMPLETADA').order_by('pk')
+        .values_list('cuenta_origen_id', 'cuenta_destino_id', 'monto', 'referencia',
+                     'fecha_procesamiento', 'fecha_creacion')
+    )
+    for origen, destino, monto, referencia, fecha_procesamiento, fecha_creacion in transferencias.iterator(TAMANO_LOTE):
+        fecha = fecha_procesamiento or fecha_creacion
+        agregar(MovimientoCuenta(cuenta_id=origen, monto=-monto, tipo='DEBITO_TRANSFERENCIA',
+                                 referencia=referencia, fecha=fecha))
+        agregar(MovimientoCuenta(cuenta_id=destino, monto=monto, tipo='CREDITO_TRANSFERENCIA',
+                                 referencia=referencia, fecha=fecha))
+
+    cobros = (
+        TransaccionTarjeta.objects.filter(estado='cobrada', numero_cuenta_destino__isnull=False)
+        .order_by('pk').values_list('id_transaccion', 'monto', 'numero_cuenta_destino', 'fecha_cobro', 'fecha_pago')
+    )
+    lote = []
+    for cobro in cobros.iterator(TAMANO_LOTE):
+        lote.append(cobro)
+        if len(lote) == TAMANO_LOTE:
+            _agregar_cobros(Cuenta, MovimientoCuenta, lote, agregar)
+            lote = []
+    _agregar_cobros(Cuenta, MovimientoCuenta, lote, agregar)
+    MovimientoCuenta.objects.bulk_create(pendientes)
+    pendientes.clear()
+
+    netos = dict(MovimientoCuenta.objects.values('cuenta').annotate(neto=Sum('monto')).values_list('cuenta', 'neto'))
+    cuentas = Cuenta.objects.order_by('pk').values_list('pk', 'saldo_disponible', 'numero_cuenta', 'fecha_creacion')
+    for pk, saldo, numero_cuenta, fecha_creacion in cuentas.iterator(TAMANO_LOTE):
+        apertura = saldo - netos.get(pk, Decimal('0'))
+        if apertura:
+            agregar(MovimientoCuenta(cuenta_id=pk, monto=apertura, tipo='APERTURA',
+                                     referencia=numero_cuenta, fecha=fecha_creacion))
+    MovimientoCuenta.objects.bulk_create(pendientes)
+
+
+def _agregar_cobros(Cuenta, MovimientoCuenta, cobros, agregar):
+    cuentas = dict(
+        Cuenta.objects.filter(numero_cuenta__in={cobro[2] for cobro in cobros}).values_list('numero_cuenta', 'pk')
+    )
+    for id_transaccion, monto, numero_cuenta, fecha_cobro, fecha_pago in cobros:
+        if numero_cuenta in cuentas:
+            agregar(MovimientoCuenta(cuenta_id=cuentas[numero_cuenta], monto=monto, tipo='CREDITO_COBRO_TARJETA',
+                                     referencia=str(id_transaccion), fecha=fecha_cobro or fecha_pago))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuenta', '0002_libro_movimientos'),
+        ('tarjeta_credito', '0005_alter_tarjetacredito_options_and_more'),
+        ('transferencia', '0003_indices_historial'),
+    ]
+
+    operations = [
+        migrations.RunPython(cargar_libro, migrations.RunPython.noop),
+    ]
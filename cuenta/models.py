@@ -1,8 +1,23 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator
-import random
-import string
+from nucleo.identificadores import AsignadorIdentificadores, con_digito_luhn
+
+
+def formatear_numero_cuenta(numero):
+    """15 dígitos de la secuencia más el dígito verificador de Luhn"""
+    return con_digito_luhn(f"{numero:015d}")
+
+
+def numeros_cuenta_en_uso(numeros):
+    """Números de la secuencia ya tomados por cuentas con número aleatorio"""
+    formateados = {formatear_numero_cuenta(numero): numero for numero in numeros}
+    existentes = Cuenta.objects.filter(numero_cuenta__in=formateados).values_list('numero_cuenta', flat=True)
+    return {formateados[numero_cuenta] for numero_cuenta in existentes}
+
+
+asignador_cuentas = AsignadorIdentificadores('numero_cuenta', en_uso=numeros_cuenta_en_uso)
 
 class Cuenta(models.Model):
     TIPO_CUENTA_CHOICES = [
@@ -25,14 +40,18 @@ class Cuenta(models.Model):
     def save(self, *args, **kwargs):
         if not self.numero_cuenta:
             self.numero_cuenta = self.generar_numero_cuenta()
-        super().save(*args, **kwargs)
+        nueva = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if nueva and self.saldo_disponible:
+                # El saldo inicial entra al libro como apertura
+                MovimientoCuenta.objects.create(
+                    cuenta=self, monto=self.saldo_disponible, tipo='APERTURA', referencia=self.numero_cuenta
+                )
 
     def generar_numero_cuenta(self):
         """Genera un número de cuenta único de 16 dígitos"""
-        while True:
-            numero = ''.join(random.choices(string.digits, k=16))
-            if not Cuenta.objects.filter(numero_cuenta=numero).exists():
-                return numero
+        return formatear_numero_cuenta(asignador_cuentas.siguiente())
 
     def __str__(self):
         return f"{self.usuario.username} - {self.numero_cuenta}"
@@ -40,3 +59,57 @@ class Cuenta(models.Model):
     class Meta:
         verbose_name = "Cuenta"
         verbose_name_plural = "Cuentas"
+
+
+class MovimientoCuenta(models.Model):
+    """
+    Libro de movimientos de las cuentas: solo se insertan filas, nunca se
+    modifican. Cada transferencia completada genera un débito en la cuenta
+    origen y un crédito en la destino con la misma referencia.
+    """
+    TIPO_CHOICES = [
+        ('APERTURA', 'Saldo de apertura'),
+        ('DEBITO_TRANSFERENCIA', 'Débito por transferencia'),
+        ('CREDITO_TRANSFERENCIA', 'Crédito por transferencia'),
+        ('CREDITO_COBRO_TARJETA', 'Crédito por cobro de tarjeta'),
+    ]
+
+    cuenta = models.ForeignKey(Cuenta, on_delete=models.CASCADE, related_name='movimientos', db_index=False)
+    monto = models.DecimalField(max_digits=15, decimal_places=2, help_text="Positivo acredita, negativo debita")
+    tipo = models.CharField(max_length=25, choices=TIPO_CHOICES)
+    referencia = models.CharField(max_length=50, help_text="Referencia de la transferencia o id de la transacción")
+    fecha = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.cuenta_id} {self.tipo} {self.monto} ({self.referencia})"
+
+    class Meta:
+        verbose_name = "Movimiento de Cuenta"
+        verbose_name_plural = "Movimientos de Cuenta"
+        indexes = [
+            models.Index(fields=['cuenta', 'id'], name='movimiento_cuenta_id_idx'),
+            models.Index(fields=['cuenta', 'fecha'], name='movimiento_cuenta_fecha_idx'),
+        ]
+
+
+class CheckpointSaldo(models.Model):
+    """
+    Saldo de una cuenta según el libro, acumulado hasta el movimiento
+    `hasta_movimiento` inclusive. `fecha_corte` es la fecha del último
+    movimiento incluido.
+    """
+    cuenta = models.ForeignKey(Cuenta, on_delete=models.CASCADE, related_name='checkpoints', db_index=False)
+    saldo = models.DecimalField(max_digits=15, decimal_places=2)
+    hasta_movimiento = models.BigIntegerField()
+    fecha_corte = models.DateTimeField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.cuenta_id} ${self.saldo} hasta {self.hasta_movimiento}"
+
+    class Meta:
+        verbose_name = "Checkpoint de Saldo"
+        verbose_name_plural = "Checkpoints de Saldo"
+        indexes = [
+            models.Index(fields=['cuenta', '-hasta_movimiento'], name='checkpoint_cuenta_mov_idx'),
+        ]
@@ -1,3 +1,112 @@
-from django.test import TestCase
+import json
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from home_banking import settings_produccion
+from nucleo.pruebas import restaurar_secuencias, valor_metrica
+from tarjeta_credito.models import TarjetaCredito
+from transferencia.models import Transferencia
+from .directorio import DirectorioUsuarios, directorio
+from .models import Cuenta
+from .views import CAMPOS_LISTADO
+
+
+class DirectorioUsuariosTests(TestCase):
+
+    def setUp(self):
+        directorio.limpiar()
+        self.usuario = User.objects.create_user(username='karen')
+        self.cuenta = Cuenta.objects.create(usuario=self.usuario, saldo_disponible=100)
+
+    def test_un_acierto_no_consulta_la_base(self):
+        directorio.buscar('karen')
+        aciertos = directorio.estadisticas()['aciertos']
+        with self.assertNumQueries(0):
+            entrada = directorio.buscar('karen')
+
+        self.assertEqual((entrada.usuario_id, entrada.cuenta_id), (self.usuario.pk, self.cuenta.pk))
+        self.assertEqual(directorio.estadisticas()['aciertos'], aciertos + 1)
+
+    def test_las_senales_invalidan_la_entrada(self):
+        self.assertEqual(directorio.buscar('karen').tarjetas, ())
+
+        tarjeta = TarjetaCredito.objects.create(usuario=self.usuario)
+
+        self.assertEqual([t.id for t in directorio.buscar('karen').tarjetas], [tarjeta.pk])
+        self.usuario.delete()
+        self.assertIsNone(directorio.buscar('karen'))
+
+    def test_desaloja_la_entrada_menos_usada(self):
+        acotado = DirectorioUsuarios(max_entradas=2)
+        for username in ('ana', 'beto'):
+            User.objects.create_user(username=username)
+        acotado.buscar('karen')
+        acotado.buscar('ana')
+        acotado.buscar('karen')
+        acotado.buscar('beto')
+
+        with self.assertNumQueries(0):
+            acotado.buscar('karen')
+        self.assertEqual(acotado.estadisticas()['desalojos'], 1)
+        self.assertEqual(acotado.estadisticas()['entradas'], 2)
+
+    def test_las_estadisticas_se_exportan_solo_en_metrics(self):
+        directorio.buscar('karen')
+        directorio.buscar('karen')
+
+        texto = self.client.get('/metrics').content.decode()
+
+        serie = 'homebanking_directorio_usuarios_consultas_total{resultado="acierto"}'
+        self.assertEqual(valor_metrica(texto, serie), directorio.estadisticas()['aciertos'])
+        self.assertEqual(self.client.get('/cuenta/api/directorio/estadisticas/').status_code, 404)
+
+    def test_las_apis_por_username_usan_el_directorio(self):
+        url = reverse('api_transferencias_enviadas')
+        self.client.get(url, {'username': 'karen'})
+
+        # Solo la consulta de transferencias: el usuario y la cuenta salen del directorio
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, {'username': 'karen'})
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_los_listados_no_exponen_las_columnas_de_la_cola(self):
+        destino = Cuenta.objects.create(usuario=User.objects.create_user(username='lucas'))
+        Transferencia.objects.create(cuenta_origen=self.cuenta, cuenta_destino=destino, monto=10, en_cola=True)
+        url = reverse('api_transferencias_enviadas')
+
+        pagina = self.client.get(url, {'username': 'karen'}).json()
+        streaming = json.loads(b''.join(self.client.get(url, {'username': 'karen', 'stream': '1'}).streaming_content))
+
+        for resultados in (pagina['results'], streaming['results']):
+            self.assertEqual(len(resultados), 1)
+            self.assertEqual(set(resultados[0]), set(CAMPOS_LISTADO))
+            self.assertFalse({'en_cola', 'reclamada_por', 'reclamada_en'} & set(resultados[0]))
+
+
+class ConciliacionPerfilProduccionTests(TransactionTestCase):
+    """reconcile con las transacciones BEGIN IMMEDIATE del perfil de producción"""
+
+    def setUp(self):
+        restaurar_secuencias()
+        connection.ensure_connection()
+        self.addCleanup(setattr, connection, 'transaction_mode', connection.transaction_mode)
+        connection.transaction_mode = settings_produccion.DATABASES['default']['OPTIONS']['transaction_mode']
+        cuenta = Cuenta.objects.create(usuario=User.objects.create_user(username='karen'), saldo_disponible=100)
+        TarjetaCredito.objects.create(usuario=cuenta.usuario)
+
+    def test_lee_en_transacciones_deferred_y_devuelve_la_conexion_escribible(self):
+        errores = StringIO()
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('reconcile', procesos=1, stdout=StringIO(), stderr=errores)
+
+        self.assertIn('Sin diferencias', errores.getvalue())
+        inicios = {consulta['sql'] for consulta in consultas if consulta['sql'].startswith('BEGIN')}
+        self.assertEqual(inicios, {'BEGIN DEFERRED'})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=5)
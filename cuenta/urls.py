@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -7,7 +8,13 @@ urlpatterns = [
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('logout/', views.logout_view, name='logout'),
     path('historial/', views.historial_view, name='historial'),
+    path('extracto/', views.exportar_extracto_view, name='exportar_extracto'),
     path('api/register/', views.api_register, name='api_register'),
-    path('api/transferencias/enviadas/', views.api_transferencias_enviadas, name='api_transferencias_enviadas'),
-    path('api/transferencias/recibidas/', views.api_transferencias_recibidas, name='api_transferencias_recibidas'),
+    path('api/saldo/', views.api_saldo, name='api_saldo'),
+    path('api/transferencias/enviadas/',
+         views.api_transferencias_enviadas_async if settings.API_ASINCRONA else views.api_transferencias_enviadas,
+         name='api_transferencias_enviadas'),
+    path('api/transferencias/recibidas/',
+         views.api_transferencias_recibidas_async if settings.API_ASINCRONA else views.api_transferencias_recibidas,
+         name='api_transferencias_recibidas'),
 ]
@@ -4,10 +4,15 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.contrib.auth.models import User
+from .directorio import directorio
+from .extractos import FORMATOS, lineas_extracto, parsear_fecha
+from .libro import saldo_segun_libro
 from .models import Cuenta
+from transferencia import historial
 from transferencia.models import Transferencia
 from decimal import Decimal
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
 import json
@@ -58,8 +63,8 @@ def dashboard_view(request):
         cuenta = Cuenta.objects.create(usuario=request.user, saldo_disponible=5000000.00)
 
     # Obtener últimas transferencias (enviadas y recibidas)
-    transferencias_enviadas = Transferencia.objects.filter(cuenta_origen=cuenta)[:5]
-    transferencias_recibidas = Transferencia.objects.filter(cuenta_destino=cuenta)[:5]
+    transferencias_enviadas = historial.ultimas(historial.enviadas(cuenta))
+    transferencias_recibidas = historial.ultimas(historial.recibidas(cuenta))
 
     context = {
         'cuenta': cuenta,
@@ -78,10 +83,10 @@ def logout_view(request):
 
 @login_required
 def historial_view(request):
-    """Vista para ver el historial completo de transferencias"""
+    """Vista para ver el historial completo de transferencias, por páginas"""
     cuenta = request.user.cuenta
-    transferencias_enviadas = Transferencia.objects.filter(cuenta_origen=cuenta)
-    transferencias_recibidas = Transferencia.objects.filter(cuenta_destino=cuenta)
+    transferencias_enviadas = historial.pagina(historial.enviadas(cuenta), request.GET.get('pagina_enviadas'))
+    transferencias_recibidas = historial.pagina(historial.recibidas(cuenta), request.GET.get('pagina_recibidas'))
 
     context = {
         'cuenta': cuenta,
@@ -91,6 +96,30 @@ def historial_view(request):
 
     return render(request, 'cuenta/historial.html', context)
 
+@login_required
+@require_GET
+def exportar_extracto_view(request):
+    """
+    Extracto de la cuenta del usuario en CSV o JSONL, en streaming.
+    ?formato=csv|jsonl&desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+    """
+    formato = request.GET.get("formato", "csv")
+    if formato not in FORMATOS:
+        return JsonResponse({"detail": "formato debe ser csv o jsonl"}, status=400)
+    try:
+        desde = parsear_fecha(request.GET["desde"]) if request.GET.get("desde") else None
+        hasta = parsear_fecha(request.GET["hasta"], fin_del_dia=True) if request.GET.get("hasta") else None
+    except ValueError:
+        return JsonResponse({"detail": "desde y hasta deben ser YYYY-MM-DD o ISO 8601"}, status=400)
+
+    cuenta = get_object_or_404(Cuenta, usuario=request.user)
+    respuesta = StreamingHttpResponse(
+        lineas_extracto(cuenta.id, formato, desde, hasta), content_type=FORMATOS[formato]
+    )
+    respuesta["Content-Disposition"] = f'attachment; filename="extracto-{cuenta.numero_cuenta}.{formato}"'
+    respuesta["Cache-Control"] = "no-store"
+    return respuesta
+
 @csrf_exempt
 @require_POST
 def api_register(request):
@@ -140,42 +169,186 @@ def api_register(request):
     )
 
 
-# ...existing code...
+# Paginación por cursor (keyset sobre id) de los listados de transferencias
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+FILAS_POR_FRAGMENTO = 500
+# Columnas públicas de cada transferencia; las de la cola (en_cola,
+# reclamada_por, reclamada_en) son internas del worker y no se devuelven
+CAMPOS_LISTADO = (
+    "id", "cuenta_origen_id", "cuenta_destino_id", "monto", "concepto", "estado",
+    "fecha_creacion", "fecha_procesamiento", "referencia",
+)
+
 
 @require_GET
 def api_transferencias_enviadas(request):
-    #ejemplo: /cuenta/api/transferencias/enviadas/?username=karen
+    #ejemplo: /cuenta/api/transferencias/enviadas/?username=karen&limit=100&cursor=1234
+    return _listar_transferencias(request, 'cuenta_origen')
+
+
+@require_GET
+def api_transferencias_recibidas(request):
+    return _listar_transferencias(request, 'cuenta_destino')
+
+
+@require_GET
+async def api_transferencias_enviadas_async(request):
+    """api_transferencias_enviadas con el ORM asíncrono (API_ASINCRONA)"""
+    return await _alistar_transferencias(request, 'cuenta_origen')
+
+
+@require_GET
+async def api_transferencias_recibidas_async(request):
+    return await _alistar_transferencias(request, 'cuenta_destino')
+
+
+@require_GET
+def api_saldo(request):
+    """
+    Saldo de la cuenta según el libro de movimientos.
+    ?fecha=YYYY-MM-DD o ISO 8601 devuelve el saldo a esa fecha (fin del día
+    si no se indica hora); se calcula desde el último checkpoint anterior.
+    """
+    #ejemplo: /cuenta/api/saldo/?username=karen&fecha=2025-10-01
     username = (request.GET.get("username") or "").strip()
     if not username:
         return JsonResponse({"detail": "username es requerido"}, status=400)
 
-    try:
-        user = User.objects.get(username=username)
-        cuenta = user.cuenta
-    except User.DoesNotExist:
-        return JsonResponse({"detail": "Usuario no existe"}, status=404)
-    except Cuenta.DoesNotExist:
-        return JsonResponse({"detail": "El usuario no tiene cuenta"}, status=404)
+    hasta = None
+    fecha = request.GET.get("fecha")
+    if fecha:
+        try:
+            hasta = parsear_fecha(fecha, fin_del_dia=True)
+        except ValueError:
+            return JsonResponse({"detail": "fecha debe ser YYYY-MM-DD o ISO 8601"}, status=400)
 
-    qs = Transferencia.objects.filter(cuenta_origen=cuenta).order_by("-id")
-    data = list(qs.values())
-    return JsonResponse({"count": len(data), "results": data}, status=200)
+    entrada = directorio.buscar(username)
+    if entrada is None or entrada.cuenta_id is None:
+        return JsonResponse({"detail": "Usuario no existe o no tiene cuenta"}, status=404)
 
+    return JsonResponse({
+        "numero_cuenta": entrada.numero_cuenta,
+        "fecha": hasta.isoformat() if hasta else None,
+        "saldo": str(saldo_segun_libro(entrada.cuenta_id, hasta)),
+    }, status=200)
 
-@require_GET
-def api_transferencias_recibidas(request):
+
+def _listar_transferencias(request, campo_cuenta):
+    """
+    Lista las transferencias de la cuenta del usuario ordenadas por -id.
+    - Paginado: ?limit=N&cursor=<id>; la respuesta incluye next_cursor.
+    - Streaming: ?stream=1 escribe el arreglo JSON por fragmentos a partir de
+      un iterador del lado del servidor, con memoria constante.
+    """
+    parametros = _parametros_listado(request)
+    if isinstance(parametros, JsonResponse):
+        return parametros
+    username, limite, cursor = parametros
+
+    entrada = directorio.buscar(username)
+    if entrada is None or entrada.cuenta_id is None:
+        return _sin_cuenta(entrada)
+
+    qs = _transferencias_de(entrada, campo_cuenta, cursor)
+    if request.GET.get("stream") in ("1", "true"):
+        return _respuesta_streaming(_json_por_fragmentos(qs.values(*CAMPOS_LISTADO)))
+
+    return _respuesta_pagina(list(qs.values(*CAMPOS_LISTADO)[:limite + 1]), limite)
+
+
+async def _alistar_transferencias(request, campo_cuenta):
+    """_listar_transferencias con el ORM asíncrono; el streaming usa un iterador async"""
+    parametros = _parametros_listado(request)
+    if isinstance(parametros, JsonResponse):
+        return parametros
+    username, limite, cursor = parametros
+
+    entrada = await directorio.abuscar(username)
+    if entrada is None or entrada.cuenta_id is None:
+        return _sin_cuenta(entrada)
+
+    qs = _transferencias_de(entrada, campo_cuenta, cursor)
+    if request.GET.get("stream") in ("1", "true"):
+        return _respuesta_streaming(_ajson_por_fragmentos(qs.values(*CAMPOS_LISTADO)))
+
+    return _respuesta_pagina([fila async for fila in qs.values(*CAMPOS_LISTADO)[:limite + 1]], limite)
+
+
+def _parametros_listado(request):
+    """(username, limite, cursor) o la respuesta 400 si los parámetros no son válidos"""
     username = (request.GET.get("username") or "").strip()
     if not username:
         return JsonResponse({"detail": "username es requerido"}, status=400)
 
     try:
-        user = User.objects.get(username=username)
-        cuenta = user.cuenta
-    except User.DoesNotExist:
+        limite = int(request.GET.get("limit", LIMITE_POR_DEFECTO))
+        cursor = request.GET.get("cursor")
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return JsonResponse({"detail": "limit y cursor deben ser enteros"}, status=400)
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        return JsonResponse({"detail": f"limit debe estar entre 1 y {LIMITE_MAXIMO}"}, status=400)
+    return username, limite, cursor
+
+
+def _sin_cuenta(entrada):
+    if entrada is None:
         return JsonResponse({"detail": "Usuario no existe"}, status=404)
-    except Cuenta.DoesNotExist:
-        return JsonResponse({"detail": "El usuario no tiene cuenta"}, status=404)
+    return JsonResponse({"detail": "El usuario no tiene cuenta"}, status=404)
+
+
+def _transferencias_de(entrada, campo_cuenta, cursor):
+    qs = Transferencia.objects.filter(**{f"{campo_cuenta}_id": entrada.cuenta_id}).order_by("-id")
+    if cursor is not None:
+        qs = qs.filter(id__lt=cursor)
+    return qs
+
+
+def _respuesta_streaming(fragmentos):
+    respuesta = StreamingHttpResponse(fragmentos, content_type="application/json")
+    respuesta["Cache-Control"] = "no-store"
+    return respuesta
+
+
+def _respuesta_pagina(data, limite):
+    siguiente = data[limite - 1]["id"] if len(data) > limite else None
+    data = data[:limite]
+    return JsonResponse({"count": len(data), "results": data, "next_cursor": siguiente}, status=200)
+
+
+def _json_por_fragmentos(filas):
+    """Serializa {"results": [...], "count": N} fila a fila, en fragmentos"""
+    yield '{"results": ['
+    total = 0
+    fragmento = []
+    for fila in filas.iterator(chunk_size=FILAS_POR_FRAGMENTO):
+        fragmento.append(fila)
+        total += 1
+        if len(fragmento) == FILAS_POR_FRAGMENTO:
+            yield _fragmento_json(fragmento, total)
+            fragmento = []
+    if fragmento:
+        yield _fragmento_json(fragmento, total)
+    yield f'], "count": {total}}}'
+
+
+async def _ajson_por_fragmentos(filas):
+    """_json_por_fragmentos leyendo las filas con el iterador asíncrono del ORM"""
+    yield '{"results": ['
+    total = 0
+    fragmento = []
+    async for fila in filas.aiterator(chunk_size=FILAS_POR_FRAGMENTO):
+        fragmento.append(fila)
+        total += 1
+        if len(fragmento) == FILAS_POR_FRAGMENTO:
+            yield _fragmento_json(fragmento, total)
+            fragmento = []
+    if fragmento:
+        yield _fragmento_json(fragmento, total)
+    yield f'], "count": {total}}}'
+
 
-    qs = Transferencia.objects.filter(cuenta_destino=cuenta).order_by("-id")
-    data = list(qs.values())
-    return JsonResponse({"count": len(data), "results": data}, status=200)
\ No newline at end of file
+def _fragmento_json(filas, total):
+    """Las filas como parte del arreglo results; `total` incluye estas filas"""
+    return ("," if total > len(filas) else "") + ",".join(json.dumps(fila, cls=DjangoJSONEncoder) for fila in filas)
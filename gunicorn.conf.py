@@ -0,0 +1,75 @@
+"""
+Configuración de gunicorn. gunicorn la toma sola al arrancar desde la raíz del
+proyecto (o con -c gunicorn.conf.py); la aplicación también se elige acá, así
+que alcanza con `gunicorn`.
+
+Modelo de workers con GUNICORN_WORKER_CLASS:
+- gthread (por defecto): procesos con varios hilos cada uno, vía WSGI. Las
+  vistas pasan la mayor parte del tiempo esperando a la base de datos, así
+  que los hilos de un proceso se superponen sin pelear por el GIL.
+- uvicorn: workers ASGI (paquete uvicorn-worker) sobre home_banking.asgi.
+- sync: un hilo por proceso, el modelo por defecto de gunicorn.
+
+Los valores se pueden cambiar con variables de entorno GUNICORN_*.
+"""
+import multiprocessing
+import os
+
+_CLASES = {
+    'sync': ('sync', 'home_banking.wsgi:application'),
+    'gthread': ('gthread', 'home_banking.wsgi:application'),
+    'uvicorn': ('uvicorn_worker.UvicornWorker', 'home_banking.asgi:application'),
+}
+_cpus = multiprocessing.cpu_count()
+_modelo = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if _modelo not in _CLASES:
+    raise RuntimeError(f"GUNICORN_WORKER_CLASS debe ser uno de {', '.join(_CLASES)}: '{_modelo}'")
+
+worker_class, wsgi_app = _CLASES[_modelo]
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8001')
+
+# sync: la receta clásica 2 * CPU + 1. gthread y uvicorn atienden varias
+# peticiones por proceso, así que bastan CPU + 1 procesos.
+workers = int(os.environ.get('GUNICORN_WORKERS', 2 * _cpus + 1 if _modelo == 'sync' else _cpus + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if _modelo == 'gthread' else 1))
+
+# El maestro importa Django y la aplicación una sola vez; los workers comparten
+# esas páginas por copy-on-write y arrancan más rápido. Nada abre conexiones
+# a la base al importar, y los asignadores de identificadores se reinician
+# en cada hijo (ver nucleo.identificadores).
+preload_app = True
+
+# Las vistas consultan la base y responden en milisegundos: una petición que
+# pasa de 30 s está trabada (p. ej. esperando un bloqueo) y el worker se reinicia.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+
+# Los clientes de la API sondean el estado de transferencias y transacciones
+# por la misma conexión: se la mantiene abierta entre sondeos. En gthread y
+# uvicorn una conexión ociosa no ocupa un hilo. worker_connections es el tope
+# de conexiones simultáneas por worker (en uvicorn, su limit_concurrency).
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 10000 if _modelo == 'uvicorn' else 1000))
+
+# Reciclar los workers cada tantas peticiones acota la memoria que acumulan
+# las cachés por proceso; el jitter evita que se reinicien todos a la vez.
+# Un worker uvicorn corta al reiniciarse todas sus conexiones abiertas, y con
+# miles de clientes sondeando llega a 2000 peticiones en segundos.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 50000 if _modelo == 'uvicorn' else 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Por si algo tocó la base en el maestro: cada worker abre sus propias conexiones
+    from django.db import connections
+    for conexion in connections.all(initialized_only=True):
+        conexion.close()
+
+
+def on_starting(server):
+    # Las métricas de una ejecución anterior no se suman a las de esta (ver nucleo.metricas)
+    from nucleo.metricas import reiniciar_directorio
+    reiniciar_directorio()
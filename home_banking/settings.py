@@ -40,9 +40,11 @@ INSTALLED_APPS = [
     'cuenta',
     'transferencia',
     'tarjeta_credito',
+    'nucleo',
 ]
 
 MIDDLEWARE = [
+    'nucleo.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,6 +121,56 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Si es True, realizar_transferencia_api encola las transferencias (202) y las
+# procesa `manage.py process_transfers`. Cada petición puede elegir con "asincrona".
+TRANSFERENCIAS_ASINCRONAS = False
+
+# Si es True, las consultas de solo lectura de la API (transferencia, tarjeta,
+# transacción, tarjetas por usuario y listados de transferencias) usan sus
+# versiones async con el ORM asíncrono. Sirve con un servidor ASGI
+# (GUNICORN_WORKER_CLASS=uvicorn); bajo WSGI conviene dejarlo en False
+API_ASINCRONA = False
+
+# Idempotency-Key: tiempo durante el cual se guarda la respuesta de una petición
+IDEMPOTENCIA_TTL_SEGUNDOS = 24 * 60 * 60
+# Reserva de la clave mientras la vista se ejecuta: debe superar la vista más
+# lenta (lotes de 5000 items), porque un reintento con la reserva vencida
+# vuelve a ejecutarla
+IDEMPOTENCIA_RESERVA_SEGUNDOS = 5 * 60
+
+# Caché de respuestas de consultas en estado final (transferencias COMPLETADA/
+# FALLIDA, transacciones cobradas/canceladas). En memoria por proceso; con varios
+# workers conviene una caché compartida (Redis, Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+CACHE_RESPUESTAS_TTL_SEGUNDOS = 60 * 60
+
+# Números que cada proceso reserva de una vez para referencias, números de
+# cuenta y de tarjeta (ver nucleo.identificadores)
+IDENTIFICADORES_TAMANO_BLOQUE = 100
+
+# Directorio en memoria username -> usuario, cuenta y tarjetas (cuenta.directorio)
+DIRECTORIO_USUARIOS_MAX_ENTRADAS = 10000
+DIRECTORIO_USUARIOS_TTL_SEGUNDOS = 60
+
+# Métricas de /metrics (nucleo.metricas). Con varios procesos (workers de
+# gunicorn), cada uno publica sus valores en este directorio y /metrics los
+# suma; con None, /metrics muestra solo el proceso que atiende la petición
+METRICAS_DIRECTORIO = None
+METRICAS_INTERVALO_SEGUNDOS = 5
+# Quién puede leer /metrics: direcciones o redes (REMOTE_ADDR) y, además, un
+# token opcional (header Authorization: Bearer <token>). El resto recibe 403
+METRICAS_IPS_PERMITIDAS = ['127.0.0.1', '::1']
+METRICAS_TOKEN = None
+
+# Horas tras las cuales un pago con tarjeta no cobrado se cancela y su monto
+# vuelve al crédito disponible (comando expire_card_holds)
+TARJETA_AUTORIZACION_EXPIRA_HORAS = 7 * 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
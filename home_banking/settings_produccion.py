@@ -0,0 +1,76 @@
+"""
+Perfil de producción. Se elige con la variable de entorno
+DJANGO_SETTINGS_MODULE=home_banking.settings_produccion (el Dockerfile ya la define).
+
+Parte de settings.py y cambia lo que no sirve para workers de larga vida:
+- DEBUG apagado: con DEBUG cada conexión guarda todas sus consultas en
+  connection.queries y la memoria del worker crece con cada petición.
+- SQLite ajustado con PRAGMAs que se ejecutan al abrir cada conexión
+  (init_command): WAL para que las lecturas no esperen a las escrituras,
+  synchronous=NORMAL (seguro con WAL), mmap y caché de páginas más grandes.
+- Transacciones BEGIN IMMEDIATE: la transacción toma el bloqueo de escritura
+  al empezar, así una espera por otro escritor respeta el timeout en lugar
+  de fallar con "database is locked" al pasar de lectura a escritura. Una
+  transacción de solo lectura con IMMEDIATE retendría el bloqueo sin usarlo:
+  esas usan DEFERRED (ver cuenta.conciliacion).
+- Conexiones persistentes (CONN_MAX_AGE) con verificación antes de reusarlas,
+  salvo con workers ASGI.
+- Métricas sumadas entre todos los workers (METRICAS_DIRECTORIO).
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, IDEMPOTENCIA_RESERVA_SEGUNDOS, SECRET_KEY
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '') == '1'
+
+# Vistas async para las consultas de la API (ver settings.API_ASINCRONA). Solo
+# tienen sentido con workers ASGI (GUNICORN_WORKER_CLASS=uvicorn)
+_ASGI = os.environ.get('GUNICORN_WORKER_CLASS') == 'uvicorn'
+API_ASINCRONA = os.environ.get('DJANGO_API_ASINCRONA', '') == '1'
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+# Claves anteriores separadas por coma, mientras se rota SECRET_KEY (ver
+# API_TARJETAS_CREDITO.md, "Rotación de SECRET_KEY")
+SECRET_KEY_FALLBACKS = [clave for clave in os.environ.get('DJANGO_SECRET_KEY_FALLBACKS', '').split(',') if clave]
+
+# gunicorn corta una petición a los GUNICORN_TIMEOUT segundos; la reserva de
+# una Idempotency-Key no debe vencer antes
+IDEMPOTENCIA_RESERVA_SEGUNDOS = max(IDEMPOTENCIA_RESERVA_SEGUNDOS, 2 * int(os.environ.get('GUNICORN_TIMEOUT', 30)))
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negativo: en KiB (64 MiB)
+    'temp_store': 'MEMORY',
+}
+
+# Diccionarios nuevos: importar este módulo (p. ej. desde los tests) no
+# cambia la configuración de settings.py
+DATABASES = {
+    **DATABASES,
+    'default': {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DJANGO_DB_PATH') or DATABASES['default']['NAME'],
+        # Bajo ASGI cada petición usa su propio hilo para el ORM y una conexión
+        # persistente quedaría atada a ese hilo: ahí se abre una por petición
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 0 if _ASGI else 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Espera máxima por el bloqueo de otro escritor (busy_timeout), en segundos
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_SEGUNDOS', 20)),
+            # Los transaction.atomic() de la aplicación escriben; las lecturas
+            # largas (conciliación) pasan su conexión a DEFERRED
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ''.join(f'PRAGMA {nombre}={valor};' for nombre, valor in SQLITE_PRAGMAS.items()),
+        },
+    },
+}
+
+METRICAS_DIRECTORIO = os.environ.get('METRICAS_DIRECTORIO', '/tmp/home-banking-metricas') or None
+# Redes del scraper separadas por coma (p. ej. 10.0.0.0/8) y token opcional
+METRICAS_IPS_PERMITIDAS = [
+    red.strip() for red in os.environ.get('METRICAS_IPS_PERMITIDAS', '127.0.0.1,::1').split(',') if red.strip()
+]
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN') or None
@@ -2,10 +2,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
 
+from nucleo.metricas import metricas_view
+
 urlpatterns = [
     path('', RedirectView.as_view(pattern_name='login', permanent=False), name='home'),
     path('admin/', admin.site.urls),
     path('cuenta/', include('cuenta.urls')),
     path('transferencia/', include('transferencia.urls')),
     path('tarjeta-credito/', include('tarjeta_credito.urls')),
+    path('metrics', metricas_view, name='metricas'),
 ]
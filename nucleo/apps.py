@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class NucleoConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'nucleo'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .metricas import instalar_en_conexion
+        connection_created.connect(instalar_en_conexion, dispatch_uid='metricas-consultas-bd')
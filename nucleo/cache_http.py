@@ -0,0 +1,100 @@
+"""
+ETag y caché de respuestas para consultas que se consultan repetidamente.
+
+Toda respuesta 200 lleva un ETag fuerte (hash del cuerpo) y un
+If-None-Match que coincide se responde con 304. Cuando la vista marca la
+respuesta como final (el registro ya no puede cambiar), el cuerpo se guarda
+en la caché de Django y las consultas siguientes se responden desde ahí sin
+tocar el ORM.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+PREFIJO = 'respuesta-final'
+
+
+def ttl():
+    return getattr(settings, 'CACHE_RESPUESTAS_TTL_SEGUNDOS', 60 * 60)
+
+
+def marcar_final(respuesta):
+    """Indica que el contenido de la respuesta ya no puede cambiar"""
+    respuesta.estado_final = True
+    return respuesta
+
+
+def calcular_etag(contenido):
+    return '"%s"' % hashlib.sha256(contenido).hexdigest()[:32]
+
+
+def _coincide(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or etag in etags
+
+
+def _con_cabeceras(respuesta, etag, final):
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = f'private, max-age={ttl()}' if final else 'no-cache'
+    return respuesta
+
+
+def _desde_cache(request, guardada):
+    etag, contenido, tipo_contenido = guardada
+    if _coincide(request, etag):
+        return _con_cabeceras(HttpResponseNotModified(), etag, final=True)
+    return _con_cabeceras(HttpResponse(contenido, content_type=tipo_contenido), etag, final=True)
+
+
+def _con_etag(request, respuesta):
+    """La respuesta a devolver y, si es final, lo que hay que guardar en la caché"""
+    if respuesta.status_code != 200 or respuesta.streaming:
+        return respuesta, None
+
+    final = getattr(respuesta, 'estado_final', False)
+    etag = calcular_etag(respuesta.content)
+    guardar = (etag, respuesta.content, respuesta['Content-Type']) if final else None
+    if _coincide(request, etag):
+        return _con_cabeceras(HttpResponseNotModified(), etag, final), guardar
+    return _con_cabeceras(respuesta, etag, final), guardar
+
+
+def cache_estado_final(ambito, parametro):
+    """
+    Decorador para vistas GET de consulta. `parametro` es el kwarg de la URL
+    que identifica el registro (p. ej. 'referencia'). Sirve también para
+    vistas async, que usan la API asíncrona de la caché.
+    """
+    def decorador(vista):
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura_async(request, *args, **kwargs):
+                clave = f'{PREFIJO}:{ambito}:{kwargs[parametro]}'
+                guardada = await cache.aget(clave)
+                if guardada is not None:
+                    return _desde_cache(request, guardada)
+
+                respuesta, guardar = _con_etag(request, await vista(request, *args, **kwargs))
+                if guardar is not None:
+                    await cache.aset(clave, guardar, ttl())
+                return respuesta
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            clave = f'{PREFIJO}:{ambito}:{kwargs[parametro]}'
+            guardada = cache.get(clave)
+            if guardada is not None:
+                return _desde_cache(request, guardada)
+
+            respuesta, guardar = _con_etag(request, vista(request, *args, **kwargs))
+            if guardar is not None:
+                cache.set(clave, guardar, ttl())
+            return respuesta
+        return envoltura
+    return decorador
@@ -0,0 +1,171 @@
+"""
+Soporte del header Idempotency-Key para las APIs que mueven dinero.
+
+La primera petición con una clave reserva la fila (estado en proceso),
+ejecuta la vista y guarda la respuesta. Las repeticiones con la misma clave
+devuelven la respuesta guardada con una lectura por clave primaria, sin
+volver a tocar Cuenta ni TarjetaCredito.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+HEADER = 'Idempotency-Key'
+LONGITUD_MAXIMA_CLAVE = 255
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_TTL_SEGUNDOS', 24 * 60 * 60))
+
+
+def duracion_reserva():
+    """
+    Vigencia de la reserva mientras la vista se ejecuta. Vence antes que el
+    TTL para que, si el proceso muere, el cliente pueda reintentar; pero debe
+    superar la vista más lenta, porque un reintento con la reserva vencida
+    vuelve a ejecutarla.
+    """
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_RESERVA_SEGUNDOS', 5 * 60))
+
+
+def _sha256(*partes):
+    digest = hashlib.sha256()
+    for parte in partes:
+        digest.update(parte if isinstance(parte, bytes) else str(parte).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def idempotente(ambito):
+    """
+    Decorador para vistas POST. Si la petición trae Idempotency-Key:
+      - clave nueva: ejecuta la vista y guarda la respuesta (salvo errores 5xx)
+      - clave repetida con el mismo cuerpo: devuelve la respuesta guardada
+      - clave repetida con otro cuerpo: 422
+      - clave todavía en proceso: 409
+    Sin el header la vista se ejecuta normalmente.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            clave_cliente = request.headers.get(HEADER)
+            if not clave_cliente:
+                return vista(request, *args, **kwargs)
+
+            if len(clave_cliente) > LONGITUD_MAXIMA_CLAVE:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Idempotency-Key inválida',
+                    'message': f'La clave no puede superar {LONGITUD_MAXIMA_CLAVE} caracteres'
+                }, status=400)
+
+            clave = _sha256(ambito, clave_cliente)
+            huella = _sha256(request.method, request.path, request.body)
+
+            registro, reserva = _reservar(clave, huella)
+            if reserva is None:
+                return _respuesta_para_existente(registro, huella)
+
+            try:
+                respuesta = vista(request, *args, **kwargs)
+            except Exception:
+                liberar(clave, huella, reserva)
+                raise
+
+            if respuesta.status_code >= 500 or respuesta.streaming:
+                liberar(clave, huella, reserva)
+            else:
+                _guardar(clave, huella, reserva, respuesta)
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def _reservar(clave, huella):
+    """
+    Reserva la clave para esta petición. Retorna (registro, reserva): la
+    reserva (su vencimiento, que la identifica) si quedó reservada, o el
+    registro vigente y None si la clave ya existía.
+    """
+    ahora = timezone.now()
+    registro = ClaveIdempotencia.objects.filter(pk=clave, expira__gt=ahora).first()
+    if registro is not None:
+        return registro, None
+
+    reserva = ahora + duracion_reserva()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(clave=clave, huella_peticion=huella, expira=reserva)
+            return registro, reserva
+        except IntegrityError:
+            # Otra petición la reservó primero, o quedó una fila vencida
+            registro = ClaveIdempotencia.objects.filter(pk=clave).first()
+            if registro is not None and registro.expira > ahora:
+                return registro, None
+            ClaveIdempotencia.objects.filter(pk=clave, expira__lte=ahora).delete()
+    return ClaveIdempotencia.objects.filter(pk=clave).first(), None
+
+
+def _de_la_reserva(clave, huella, reserva):
+    """
+    La fila solo si sigue en proceso con la reserva de esta petición: si la
+    reserva venció y otra petición tomó la clave, no se toca la de la otra
+    """
+    return ClaveIdempotencia.objects.filter(pk=clave, huella_peticion=huella, estado_http__isnull=True, expira=reserva)
+
+
+def _guardar(clave, huella, reserva, respuesta):
+    _de_la_reserva(clave, huella, reserva).update(
+        estado_http=respuesta.status_code,
+        tipo_contenido=respuesta.get('Content-Type', ''),
+        cuerpo=respuesta.content,
+        expira=timezone.now() + ttl(),
+    )
+
+
+def liberar(clave, huella, reserva):
+    """Elimina una reserva en proceso para que el cliente pueda reintentar"""
+    _de_la_reserva(clave, huella, reserva).delete()
+
+
+def _respuesta_para_existente(registro, huella):
+    if registro.huella_peticion != huella:
+        return JsonResponse({
+            'success': False,
+            'error': 'Idempotency-Key reutilizada',
+            'message': 'La clave ya se usó con una petición diferente'
+        }, status=422)
+
+    if registro.en_proceso:
+        return JsonResponse({
+            'success': False,
+            'error': 'Petición en proceso',
+            'message': 'Una petición con la misma Idempotency-Key todavía se está procesando'
+        }, status=409)
+
+    respuesta = HttpResponse(
+        bytes(registro.cuerpo), status=registro.estado_http, content_type=registro.tipo_contenido
+    )
+    respuesta['Idempotent-Replayed'] = 'true'
+    return respuesta
+
+
+def purgar_vencidas(tamano_lote=5000):
+    """Elimina por lotes las claves vencidas. Retorna la cantidad eliminada"""
+    total = 0
+    while True:
+        claves = list(
+            ClaveIdempotencia.objects.filter(expira__lte=timezone.now())
+            .values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not claves:
+            return total
+        total += ClaveIdempotencia.objects.filter(pk__in=claves, expira__lte=timezone.now()).delete()[0]
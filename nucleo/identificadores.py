@@ -0,0 +1,188 @@
+"""
+Asignación de identificadores sin colisiones.
+
+Cada tipo de identificador (referencia de transferencia, número de cuenta,
+número de tarjeta) sale de una secuencia persistente en SecuenciaIdentificador.
+Cada proceso reserva bloques de números con un único UPDATE y los reparte en
+memoria, así generar un identificador no consulta la base de datos.
+
+La reserva de un bloque siempre se confirma por separado de la transacción del
+llamador: si esa transacción se revierte, el bloque no puede volver a
+entregarse a otro proceso. En SQLite una segunda conexión no puede escribir
+mientras la conexión actual está dentro de una transacción, así que en ese
+caso se reserva exactamente lo pedido dentro de la misma transacción y no se
+guarda sobrante para otros hilos.
+"""
+import functools
+import os
+import threading
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import SecuenciaIdentificador
+
+_DOBLE = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
+
+def digito_luhn(numero):
+    """Dígito verificador de Luhn para una cadena de dígitos"""
+    return (10 - _suma_luhn(numero) % 10) % 10
+
+
+def con_digito_luhn(numero):
+    """Agrega el dígito verificador de Luhn al final"""
+    return f"{numero}{digito_luhn(numero)}"
+
+
+def _suma_luhn(numero, doblar=True):
+    suma = 0
+    for caracter in reversed(numero):
+        digito = ord(caracter) - 48
+        suma += _DOBLE[digito] if doblar else digito
+        doblar = not doblar
+    return suma
+
+
+@functools.lru_cache(maxsize=None)
+def _sumas_por_grupo():
+    """Aporte a la suma de Luhn de cada grupo de 4 dígitos (0000-9999) cuyo último dígito se dobla"""
+    return tuple(_suma_luhn(f"{grupo:04d}") for grupo in range(10000))
+
+
+def con_digitos_luhn(prefijo, numeros, ancho):
+    """
+    Versión por lotes de con_digito_luhn(f"{prefijo}{numero:0{ancho}d}").
+
+    El aporte del prefijo se calcula una sola vez y el de cada número se suma
+    por grupos de 4 dígitos desde una tabla: como los grupos tienen longitud
+    par, todos empiezan doblando su último dígito.
+    """
+    sumas = _sumas_por_grupo()
+    base = _suma_luhn(prefijo, doblar=ancho % 2 == 0)
+    resultado = []
+    for numero in numeros:
+        suma, resto = base, numero
+        while resto:
+            suma += sumas[resto % 10000]
+            resto //= 10000
+        resultado.append(f"{prefijo}{numero:0{ancho}d}{(10 - suma % 10) % 10}")
+    return resultado
+
+
+def tamano_bloque_por_defecto():
+    return getattr(settings, 'IDENTIFICADORES_TAMANO_BLOQUE', 100)
+
+
+class SecuenciaAgotada(Exception):
+    """La secuencia no tiene fila en SecuenciaIdentificador"""
+
+
+class AsignadorIdentificadores:
+    """
+    Reparte números de la secuencia `nombre` desde bloques reservados por proceso.
+
+    `en_uso`, si se indica, recibe una lista de números recién reservados y
+    retorna el subconjunto que ya está ocupado (por ejemplo, números
+    aleatorios generados antes de existir la secuencia). Se llama una vez por
+    bloque, con una sola consulta, nunca una vez por identificador.
+    """
+
+    def __init__(self, nombre, en_uso=None, tamano_bloque=None):
+        self.nombre = nombre
+        self.en_uso = en_uso
+        self._tamano_bloque = tamano_bloque
+        self._candado = threading.Lock()
+        self._disponibles = deque()
+        self._conexion_propia = None
+        _asignadores.add(self)
+
+    @property
+    def tamano_bloque(self):
+        return self._tamano_bloque or tamano_bloque_por_defecto()
+
+    def siguiente(self):
+        """Retorna un número nuevo de la secuencia"""
+        return self.reservar(1)[0]
+
+    def reservar(self, cantidad):
+        """Retorna `cantidad` números nuevos, distintos entre sí y de cualquier otro proceso"""
+        conexion = connections[DEFAULT_DB_ALIAS]
+        if conexion.vendor == 'sqlite' and conexion.in_atomic_block:
+            return self._reservar_en_transaccion_actual(conexion, cantidad)
+
+        with self._candado:
+            while len(self._disponibles) < cantidad:
+                faltan = cantidad - len(self._disponibles)
+                bloque = self._reservar_confirmado(conexion, max(faltan, self.tamano_bloque))
+                self._disponibles.extend(self._descartar_en_uso(bloque))
+            return [self._disponibles.popleft() for _ in range(cantidad)]
+
+    def reiniciar(self):
+        """Olvida los números reservados (p. ej. en un proceso hijo tras fork)"""
+        self._candado = threading.Lock()
+        self._disponibles = deque()
+        self._conexion_propia = None
+
+    def _reservar_en_transaccion_actual(self, conexion, cantidad):
+        numeros = []
+        while len(numeros) < cantidad:
+            bloque = _reservar_en_bd(conexion, self.nombre, cantidad - len(numeros))
+            numeros.extend(self._descartar_en_uso(bloque))
+        return numeros
+
+    def _reservar_confirmado(self, conexion, cantidad):
+        if not conexion.in_atomic_block:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                return _reservar_en_bd(conexion, self.nombre, cantidad)
+
+        # Dentro de una transacción del llamador: se usa una conexión aparte,
+        # que confirma la reserva aunque la transacción del llamador se revierta
+        if self._conexion_propia is None:
+            self._conexion_propia = connections.create_connection(DEFAULT_DB_ALIAS)
+            self._conexion_propia.inc_thread_sharing()
+        propia = self._conexion_propia
+        try:
+            propia.set_autocommit(False)
+            bloque = _reservar_en_bd(propia, self.nombre, cantidad)
+            propia.commit()
+            propia.set_autocommit(True)
+        except Exception:
+            propia.close()
+            self._conexion_propia = None
+            raise
+        return bloque
+
+    def _descartar_en_uso(self, bloque):
+        if self.en_uso is None:
+            return list(bloque)
+        ocupados = self.en_uso(list(bloque))
+        return [numero for numero in bloque if numero not in ocupados]
+
+
+def _reservar_en_bd(conexion, nombre, cantidad):
+    """Avanza el contador y retorna el rango reservado; la conexión debe estar en una transacción"""
+    tabla = conexion.ops.quote_name(SecuenciaIdentificador._meta.db_table)
+    with conexion.cursor() as cursor:
+        cursor.execute(f"UPDATE {tabla} SET siguiente = siguiente + %s WHERE nombre = %s", [cantidad, nombre])
+        if cursor.rowcount != 1:
+            raise SecuenciaAgotada(f"No existe la secuencia '{nombre}'")
+        cursor.execute(f"SELECT siguiente FROM {tabla} WHERE nombre = %s", [nombre])
+        fin = cursor.fetchone()[0]
+    return range(fin - cantidad, fin)
+
+
+_asignadores = weakref.WeakSet()
+
+
+def _reiniciar_tras_fork():
+    for asignador in list(_asignadores):
+        asignador.reiniciar()
+
+
+# Con gunicorn --preload los workers heredan la memoria del proceso maestro:
+# cada hijo debe reservar sus propios bloques.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from nucleo.idempotencia import purgar_vencidas
+
+
+class Command(BaseCommand):
+    help = "Elimina las claves de idempotencia cuyo TTL ya venció"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=5000,
+                            help='Cantidad de claves eliminadas por DELETE')
+
+    def handle(self, *args, **options):
+        eliminadas = purgar_vencidas(tamano_lote=options['tamano_lote'])
+        self.stdout.write(f"Claves de idempotencia eliminadas: {eliminadas}")
@@ -0,0 +1,421 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus (GET /metrics).
+
+MetricasMiddleware mide cada petición: latencia por ruta (histograma),
+peticiones por ruta, método y estado, errores, peticiones en curso y
+cantidad y tiempo de consultas a la base. El resto de los módulos cuenta
+eventos de dominio con los contadores definidos acá (transferencias
+completadas y fallidas por motivo, retenciones de tarjeta rechazadas, ...).
+
+Cada proceso acumula sus valores en memoria: registrar un valor es una suma
+en un diccionario bajo un candado. Cada worker de gunicorn y cada worker de
+las colas (process_transfers, expire_card_holds) publica cada
+METRICAS_INTERVALO_SEGUNDOS una instantánea en METRICAS_DIRECTORIO
+(<pid>.json) desde un hilo aparte, y /metrics suma las de todos los
+procesos. Los contadores de los procesos que ya terminaron (p. ej.
+reciclados por max_requests) se acumulan en un archivo aparte para que
+ningún contador retroceda; sus medidores (peticiones en curso) se
+descartan. Sin METRICAS_DIRECTORIO, /metrics muestra solo el proceso que
+atiende la petición.
+"""
+import atexit
+import contextlib
+import contextvars
+import fcntl
+import hmac
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+ACUMULADO = 'terminados.json'
+
+_metricas = {}
+_recolectores = []
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._candado = threading.Lock()
+        _metricas[nombre] = self
+
+    def valores(self):
+        with self._candado:
+            return [[list(etiquetas), _copiar(valor)] for etiquetas, valor in self._valores.items()]
+
+
+def _copiar(valor):
+    return list(valor) if isinstance(valor, list) else valor
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, *etiquetas, cantidad=1):
+        with self._candado:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def fijar(self, valor, *etiquetas):
+        """Para contadores que ya lleva otro componente (p. ej. el directorio de usuarios)"""
+        with self._candado:
+            self._valores[etiquetas] = valor
+
+
+class Medidor(_Metrica):
+    tipo = 'gauge'
+
+    def inc(self, *etiquetas, cantidad=1):
+        with self._candado:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def dec(self, *etiquetas, cantidad=1):
+        self.inc(*etiquetas, cantidad=-cantidad)
+
+    def fijar(self, valor, *etiquetas):
+        with self._candado:
+            self._valores[etiquetas] = valor
+
+
+class Histograma(_Metrica):
+    """Cuentas por intervalo (no acumuladas) más la suma, en una sola lista por serie"""
+    tipo = 'histogram'
+
+    def observar(self, valor, *etiquetas):
+        indice = bisect_left(LIMITES_SEGUNDOS, valor)
+        with self._candado:
+            serie = self._valores.get(etiquetas)
+            if serie is None:
+                serie = self._valores[etiquetas] = [0] * (len(LIMITES_SEGUNDOS) + 2)
+            serie[indice] += 1
+            serie[-1] += valor
+
+
+# HTTP (MetricasMiddleware)
+PETICIONES = Contador('homebanking_http_peticiones_total', 'Peticiones atendidas', ('ruta', 'metodo', 'estado'))
+ERRORES = Contador(
+    'homebanking_http_errores_total', 'Peticiones que terminaron en error 5xx o excepción', ('ruta', 'metodo')
+)
+DURACION = Histograma('homebanking_http_duracion_segundos', 'Latencia de las peticiones', ('ruta', 'metodo'))
+EN_CURSO = Medidor('homebanking_http_en_curso', 'Peticiones en curso')
+CONSULTAS_BD = Contador('homebanking_http_consultas_bd_total', 'Consultas a la base hechas por las peticiones', ('ruta',))
+TIEMPO_BD = Contador('homebanking_http_bd_segundos_total', 'Tiempo de las peticiones esperando a la base', ('ruta',))
+
+# Dominio
+TRANSFERENCIAS = Contador(
+    'homebanking_transferencias_total', 'Transferencias procesadas por resultado y motivo', ('resultado', 'motivo')
+)
+RETENCIONES_TARJETA = Contador(
+    'homebanking_retenciones_tarjeta_total', 'Pagos con tarjeta aprobados, rechazados y vencidos por motivo',
+    ('resultado', 'motivo'),
+)
+
+
+def registrar_recolector(funcion):
+    """`funcion` se llama antes de cada instantánea para actualizar métricas que lleva otro componente"""
+    _recolectores.append(funcion)
+
+
+def instantanea():
+    """Las métricas de este proceso: {nombre: {'tipo', 'ayuda', 'etiquetas', 'valores'}}"""
+    for recolector in _recolectores:
+        recolector()
+    return {
+        nombre: {'tipo': m.tipo, 'ayuda': m.ayuda, 'etiquetas': m.etiquetas, 'valores': m.valores()}
+        for nombre, m in _metricas.items()
+    }
+
+
+# Medición por petición
+
+_medicion_bd = contextvars.ContextVar('medicion_bd', default=None)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    # Las vistas async ejecutan el ORM en otro hilo: el contexto (y la medición) viaja con sync_to_async
+    medicion = _medicion_bd.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion[0] += 1
+        medicion[1] += time.perf_counter() - inicio
+
+
+def instalar_en_conexion(sender, connection, **kwargs):
+    """Receptor de connection_created: mide las consultas de toda conexión nueva"""
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio, medicion, token = self._empezar()
+        respuesta = None
+        try:
+            respuesta = self.get_response(request)
+            return respuesta
+        finally:
+            self._terminar(request, respuesta, inicio, medicion, token)
+
+    async def __acall__(self, request):
+        inicio, medicion, token = self._empezar()
+        respuesta = None
+        try:
+            respuesta = await self.get_response(request)
+            return respuesta
+        finally:
+            self._terminar(request, respuesta, inicio, medicion, token)
+
+    @staticmethod
+    def _empezar():
+        if _publicador_pid != os.getpid():
+            iniciar_publicador()
+        EN_CURSO.inc()
+        medicion = [0, 0.0]
+        return time.perf_counter(), medicion, _medicion_bd.set(medicion)
+
+    @staticmethod
+    def _terminar(request, respuesta, inicio, medicion, token):
+        duracion = time.perf_counter() - inicio
+        _medicion_bd.reset(token)
+        EN_CURSO.dec()
+        coincidencia = request.resolver_match
+        ruta = coincidencia.view_name if coincidencia is not None else 'sin_ruta'
+        estado = respuesta.status_code if respuesta is not None else 500
+        PETICIONES.inc(ruta, request.method, str(estado))
+        DURACION.observar(duracion, ruta, request.method)
+        if estado >= 500:
+            ERRORES.inc(ruta, request.method)
+        if medicion[0]:
+            CONSULTAS_BD.inc(ruta, cantidad=medicion[0])
+            TIEMPO_BD.inc(ruta, cantidad=medicion[1])
+
+
+# Agregación entre procesos
+
+def _directorio():
+    return getattr(settings, 'METRICAS_DIRECTORIO', None)
+
+
+_candado_publicar = threading.Lock()
+
+
+def publicar():
+    """
+    Escribe la instantánea de este proceso en METRICAS_DIRECTORIO (reemplazo
+    atómico). El hilo publicador y cada /metrics publican: el candado
+    serializa las escrituras del proceso y cada una usa su propio temporal.
+    """
+    directorio = _directorio()
+    if not directorio:
+        return
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f'{os.getpid()}.json')
+    with _candado_publicar:
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=f'{os.getpid()}.', suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as archivo:
+                json.dump(instantanea(), archivo)
+            os.replace(temporal, ruta)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temporal)
+            raise
+
+
+_publicador_pid = None
+_candado_publicador = threading.Lock()
+
+
+def iniciar_publicador():
+    """
+    Arranca en este proceso un hilo que publica periódicamente (una vez por
+    proceso: los hilos no sobreviven al fork de los workers). Lo llama
+    MetricasMiddleware en la primera petición y los comandos que procesan
+    colas (process_transfers, expire_card_holds) al empezar.
+    """
+    global _publicador_pid
+    with _candado_publicador:
+        if _publicador_pid == os.getpid():
+            return
+        _publicador_pid = os.getpid()
+    if not _directorio():
+        return
+    intervalo = getattr(settings, 'METRICAS_INTERVALO_SEGUNDOS', 5)
+
+    def publicar_periodicamente():
+        while True:
+            time.sleep(intervalo)
+            try:
+                publicar()
+            except OSError:
+                pass
+
+    threading.Thread(target=publicar_periodicamente, name='metricas', daemon=True).start()
+    atexit.register(publicar)
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _leer(ruta):
+    try:
+        with open(ruta) as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _sumar(destino, origen, con_medidores=True):
+    """Suma las métricas de `origen` en `destino` (mismo formato que instantanea())"""
+    for nombre, metrica in origen.items():
+        if metrica['tipo'] == 'gauge' and not con_medidores:
+            continue
+        acumulada = destino.setdefault(nombre, {**metrica, 'valores': []})
+        por_etiquetas = {tuple(etiquetas): valor for etiquetas, valor in acumulada['valores']}
+        for etiquetas, valor in metrica['valores']:
+            clave = tuple(etiquetas)
+            previo = por_etiquetas.get(clave)
+            if previo is None:
+                por_etiquetas[clave] = _copiar(valor)
+            elif isinstance(valor, list):
+                por_etiquetas[clave] = [a + b for a, b in zip(previo, valor)]
+            else:
+                por_etiquetas[clave] = previo + valor
+        acumulada['valores'] = [[list(etiquetas), valor] for etiquetas, valor in por_etiquetas.items()]
+    return destino
+
+
+def agregadas():
+    """Métricas de todos los procesos: los vivos más lo acumulado de los que terminaron"""
+    directorio = _directorio()
+    if not directorio:
+        return instantanea()
+
+    try:
+        publicar()
+    except OSError:
+        # Se suma la última instantánea publicada de este proceso
+        pass
+    with open(os.path.join(directorio, '.candado'), 'w') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        acumulado = _leer(os.path.join(directorio, ACUMULADO)) or {}
+        vivos, terminados = [], []
+        for nombre in os.listdir(directorio):
+            pid, extension = os.path.splitext(nombre)
+            if extension == '.json' and pid.isdigit():
+                (vivos if _vivo(int(pid)) else terminados).append(os.path.join(directorio, nombre))
+
+        if terminados:
+            for ruta in terminados:
+                _sumar(acumulado, _leer(ruta) or {}, con_medidores=False)
+            with open(os.path.join(directorio, f'{ACUMULADO}.tmp'), 'w') as archivo:
+                json.dump(acumulado, archivo)
+            os.replace(os.path.join(directorio, f'{ACUMULADO}.tmp'), os.path.join(directorio, ACUMULADO))
+            for ruta in terminados:
+                os.remove(ruta)
+
+    total = _sumar({}, acumulado)
+    for ruta in vivos:
+        _sumar(total, _leer(ruta) or {})
+    return total
+
+
+def reiniciar_directorio():
+    """Borra las instantáneas de una ejecución anterior (al arrancar el servidor)"""
+    directorio = _directorio()
+    if not directorio or not os.path.isdir(directorio):
+        return
+    for nombre in os.listdir(directorio):
+        if nombre.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directorio, nombre))
+
+
+# Formato de texto de Prometheus
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formatear(metricas):
+    lineas = []
+    for nombre in sorted(metricas):
+        metrica = metricas[nombre]
+        lineas.append(f"# HELP {nombre} {metrica['ayuda']}")
+        lineas.append(f"# TYPE {nombre} {metrica['tipo']}")
+        for etiquetas, valor in sorted(metrica['valores']):
+            if metrica['tipo'] != 'histogram':
+                lineas.append(f"{nombre}{_etiquetas(metrica['etiquetas'], etiquetas)} {_numero(valor)}")
+                continue
+            acumulado = 0
+            for limite, cuenta in zip((*LIMITES_SEGUNDOS, '+Inf'), valor[:-1]):
+                acumulado += cuenta
+                le = f'le="{limite}"'
+                lineas.append(f"{nombre}_bucket{_etiquetas(metrica['etiquetas'], etiquetas, le)} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(metrica['etiquetas'], etiquetas)} {_numero(valor[-1])}")
+            lineas.append(f"{nombre}_count{_etiquetas(metrica['etiquetas'], etiquetas)} {acumulado}")
+    return '\n'.join(lineas) + '\n'
+
+
+def _permitido(request):
+    """REMOTE_ADDR dentro de METRICAS_IPS_PERMITIDAS y, si hay METRICAS_TOKEN, el token correcto"""
+    try:
+        direccion = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    redes = getattr(settings, 'METRICAS_IPS_PERMITIDAS', ())
+    if not any(direccion in ipaddress.ip_network(red, strict=False) for red in redes):
+        return False
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    return not token or hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metricas_view(request):
+    if not _permitido(request):
+        return HttpResponseForbidden('Acceso denegado\n', content_type=TIPO_CONTENIDO)
+    return HttpResponse(formatear(agregadas()), content_type=TIPO_CONTENIDO)
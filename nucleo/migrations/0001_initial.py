@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('clave', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('huella_peticion', models.CharField(max_length=64)),
+                ('estado_http', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('tipo_contenido', models.CharField(blank=True, max_length=100)),
+                ('cuerpo', models.BinaryField(blank=True)),
+                ('expira', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+SECUENCIAS = {
+    'referencia_transferencia': 1,
+    'numero_cuenta': 10 ** 14,
+    'numero_tarjeta': 1,
+}
+
+
+def crear_secuencias(apps, schema_editor):
+    SecuenciaIdentificador = apps.get_model('nucleo', 'SecuenciaIdentificador')
+    SecuenciaIdentificador.objects.bulk_create([
+        SecuenciaIdentificador(nombre=nombre, siguiente=inicio) for nombre, inicio in SECUENCIAS.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nucleo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaIdentificador',
+            fields=[
+                ('nombre', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('siguiente', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Identificadores',
+                'verbose_name_plural': 'Secuencias de Identificadores',
+            },
+        ),
+        migrations.RunPython(crear_secuencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import models
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta almacenada para un header Idempotency-Key.
+    La clave es el SHA-256 del ámbito más la clave enviada por el cliente, así
+    la fila es de tamaño fijo y la búsqueda es por clave primaria.
+    """
+    clave = models.CharField(max_length=64, primary_key=True)
+    huella_peticion = models.CharField(max_length=64)
+    estado_http = models.PositiveSmallIntegerField(null=True, blank=True)  # None: en proceso
+    tipo_contenido = models.CharField(max_length=100, blank=True)
+    cuerpo = models.BinaryField(blank=True)
+    expira = models.DateTimeField(db_index=True)
+
+    @property
+    def en_proceso(self):
+        return self.estado_http is None
+
+    def __str__(self):
+        return f"{self.clave[:12]} - {self.estado_http or 'en proceso'}"
+
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+
+
+class SecuenciaIdentificador(models.Model):
+    """
+    Contador persistente de una secuencia de identificadores. Los procesos
+    reservan bloques avanzando `siguiente` (ver nucleo.identificadores).
+    """
+    nombre = models.CharField(max_length=50, primary_key=True)
+    siguiente = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.nombre}: {self.siguiente}"
+
+    class Meta:
+        verbose_name = "Secuencia de Identificadores"
+        verbose_name_plural = "Secuencias de Identificadores"
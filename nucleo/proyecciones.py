@@ -0,0 +1,97 @@
+"""
+Serialización de respuestas JSON a partir de proyecciones.
+
+Una Proyeccion describe la forma de una respuesta: cada clave de salida se
+obtiene de un lookup del ORM (con joins, p. ej. 'cuenta_origen__usuario__username')
+y, opcionalmente, de un conversor. La consulta trae solo esas columnas con
+values_list y cada fila se convierte con una función armada una sola vez
+por forma de respuesta: una lista precalculada de (clave, extractor), donde
+cada extractor toma de la tupla las posiciones de sus columnas. No hay
+instancias de modelo, cargas perezosas de FKs ni columnas que no se
+devuelven. Un conversor puede recibir varias columnas si el lookup es una
+tupla de lookups.
+
+    TRANSACCION = Proyeccion({
+        'id': ('id_transaccion', como_texto),
+        'monto': ('monto', float),
+        'tarjeta': {'marca': 'tarjeta__marca'},
+    })
+    TRANSACCION.primera(TransaccionTarjeta.objects.filter(pk=...))
+"""
+from operator import itemgetter
+
+
+def como_texto(valor):
+    return None if valor is None else str(valor)
+
+
+def como_iso(valor):
+    return None if valor is None else valor.isoformat()
+
+
+def como_display(choices):
+    """Conversor al texto legible de un campo con choices"""
+    textos = dict(choices)
+    return lambda valor: textos.get(valor, valor)
+
+
+def _extractor(indices, conversor):
+    """Valor de una clave: las columnas `indices` de la fila, pasadas por `conversor`"""
+    if conversor is None:
+        return itemgetter(*indices)
+    if len(indices) == 1:
+        indice, = indices
+
+        def extraer(fila):
+            return conversor(fila[indice])
+        return extraer
+
+    columnas = itemgetter(*indices)
+
+    def extraer(fila):
+        return conversor(*columnas(fila))
+    return extraer
+
+
+class Proyeccion:
+
+    def __init__(self, campos):
+        self.lookups = []
+        self.serializar = self._armar(campos)
+
+    def _armar(self, campos):
+        """Función que arma el diccionario de `campos` a partir de una fila"""
+        partes = []
+        for clave, definicion in campos.items():
+            if isinstance(definicion, dict):
+                partes.append((clave, self._armar(definicion)))
+                continue
+            lookups, conversor = definicion if isinstance(definicion, tuple) else (definicion, None)
+            if isinstance(lookups, str):
+                lookups = (lookups,)
+            for lookup in lookups:
+                if lookup not in self.lookups:
+                    self.lookups.append(lookup)
+            partes.append((clave, _extractor([self.lookups.index(lookup) for lookup in lookups], conversor)))
+
+        def serializar(fila):
+            return {clave: extraer(fila) for clave, extraer in partes}
+        return serializar
+
+    def consultar(self, queryset):
+        """El queryset proyectado a las columnas de la respuesta"""
+        return queryset.values_list(*self.lookups)
+
+    def todas(self, queryset):
+        serializar = self.serializar
+        return [serializar(fila) for fila in self.consultar(queryset)]
+
+    def primera(self, queryset):
+        """La primera fila serializada, o None si no hay resultados"""
+        filas = list(self.consultar(queryset)[:1])
+        return self.serializar(filas[0]) if filas else None
+
+    async def aprimera(self, queryset):
+        """primera() con el ORM asíncrono, para vistas async"""
+        filas = [fila async for fila in self.consultar(queryset)[:1]]
+        return self.serializar(filas[0]) if filas else None
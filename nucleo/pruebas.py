@@ -0,0 +1,41 @@
+"""
+Utilidades compartidas por los tests de las aplicaciones.
+"""
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+
+from django.test import AsyncRequestFactory, RequestFactory
+
+from .models import SecuenciaIdentificador
+
+
+class VistasAsincronasMixin:
+    """Compara la versión async de una vista (API_ASINCRONA) con la sincrónica"""
+
+    async def comparar(self, vista_sincronica, vista_async, url, **kwargs):
+        esperada = await sync_to_async(vista_sincronica)(RequestFactory().get(url), **kwargs)
+        respuesta = await vista_async(AsyncRequestFactory().get(url), **kwargs)
+        self.assertEqual(respuesta.status_code, esperada.status_code)
+        if respuesta.streaming:
+            contenido = b''.join([parte async for parte in respuesta.streaming_content])
+            self.assertEqual(contenido, await sync_to_async(b''.join)(esperada.streaming_content))
+        else:
+            self.assertEqual(respuesta.content, esperada.content)
+        return respuesta
+
+
+def restaurar_secuencias():
+    """Las secuencias de identificadores las crea una migración: TransactionTestCase las borra al terminar"""
+    migracion = import_module('nucleo.migrations.0002_secuencia_identificador')
+    for nombre, inicio in migracion.SECUENCIAS.items():
+        SecuenciaIdentificador.objects.get_or_create(nombre=nombre, defaults={'siguiente': inicio})
+
+
+def valor_metrica(texto, serie):
+    """Valor de una serie en la salida de /metrics (0 si no aparece)"""
+    for linea in texto.splitlines():
+        nombre, _, valor = linea.rpartition(' ')
+        if nombre == serie:
+            return float(valor)
+    return 0.0
@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import metricas
+from .idempotencia import idempotente
+from .models import ClaveIdempotencia
+from .proyecciones import Proyeccion, como_texto
+
+
+class IdempotenteTests(TestCase):
+
+    def setUp(self):
+        self.llamadas = 0
+        self.durante_la_vista = None
+
+        @idempotente('pruebas')
+        def vista(request):
+            self.llamadas += 1
+            numero = self.llamadas
+            if self.durante_la_vista:
+                accion, self.durante_la_vista = self.durante_la_vista, None
+                self.respuesta_interna = accion()
+            return JsonResponse({'llamada': numero}, status=201)
+
+        self.vista = vista
+
+    def post(self, cuerpo=None, clave='clave-1'):
+        return self.vista(RequestFactory().post(
+            '/pruebas/', json.dumps(cuerpo or {'monto': 10}), content_type='application/json',
+            headers={'Idempotency-Key': clave},
+        ))
+
+    def test_repite_la_respuesta_guardada(self):
+        primera = self.post()
+        segunda = self.post()
+
+        self.assertEqual(self.llamadas, 1)
+        self.assertEqual((segunda.status_code, segunda.content), (201, primera.content))
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+
+    def test_la_misma_clave_con_otro_cuerpo_responde_422(self):
+        self.post()
+        respuesta = self.post({'monto': 99})
+
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(self.llamadas, 1)
+
+    def test_una_peticion_en_proceso_responde_409(self):
+        self.durante_la_vista = self.post
+        respuesta = self.post()
+
+        self.assertEqual(self.respuesta_interna.status_code, 409)
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(self.llamadas, 1)
+
+    def test_con_la_respuesta_vencida_se_vuelve_a_ejecutar(self):
+        self.post()
+        ClaveIdempotencia.objects.update(expira=timezone.now() - timedelta(seconds=1))
+
+        respuesta = self.post()
+
+        self.assertEqual(json.loads(respuesta.content), {'llamada': 2})
+        self.assertFalse(respuesta.has_header('Idempotent-Replayed'))
+
+    def test_una_reserva_vencida_no_pisa_la_respuesta_del_reintento(self):
+        def reintentar_con_la_reserva_vencida():
+            ClaveIdempotencia.objects.update(expira=timezone.now() - timedelta(seconds=1))
+            return self.post()
+
+        self.durante_la_vista = reintentar_con_la_reserva_vencida
+        self.post()
+
+        self.assertEqual(json.loads(self.respuesta_interna.content), {'llamada': 2})
+        self.assertEqual(json.loads(self.post().content), {'llamada': 2})
+        self.assertEqual(self.llamadas, 2)
+
+
+class ProyeccionTests(SimpleTestCase):
+
+    def test_arma_el_diccionario_desde_la_fila(self):
+        proyeccion = Proyeccion({
+            'monto': ('monto', como_texto),
+            'saldo': (('limite', 'monto'), lambda limite, monto: limite - monto),
+            'tarjeta': {'marca': 'tarjeta__marca', 'monto': 'monto'},
+        })
+
+        self.assertEqual(proyeccion.lookups, ['monto', 'limite', 'tarjeta__marca'])
+        self.assertEqual(proyeccion.serializar((30, 100, 'CABAL')), {
+            'monto': '30', 'saldo': 70, 'tarjeta': {'marca': 'CABAL', 'monto': 30},
+        })
+
+
+class PublicarMetricasTests(SimpleTestCase):
+
+    def test_publicaciones_simultaneas_no_fallan_ni_dejan_instantaneas_ilegibles(self):
+        errores, ilegibles = [], []
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIRECTORIO=directorio):
+            metricas.publicar()
+            ruta = os.path.join(directorio, f'{os.getpid()}.json')
+            terminado = threading.Event()
+
+            def publicar():
+                try:
+                    for _ in range(100):
+                        metricas.publicar()
+                except Exception as e:
+                    errores.append(e)
+
+            def leer():
+                while not terminado.is_set():
+                    if metricas._leer(ruta) is None:
+                        ilegibles.append(ruta)
+
+            lector = threading.Thread(target=leer)
+            lector.start()
+            hilos = [threading.Thread(target=publicar) for _ in range(4)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            terminado.set()
+            lector.join()
+
+            self.assertEqual(sorted(os.listdir(directorio)), [f'{os.getpid()}.json'])
+        self.assertEqual(errores, [])
+        self.assertEqual(ilegibles, [])
+
+    def test_metrics_responde_aunque_falle_la_publicacion(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIRECTORIO=directorio):
+            with mock.patch('nucleo.metricas.json.dump', side_effect=OSError('disco lleno')):
+                total = metricas.agregadas()
+        self.assertEqual(total, {})
+
+
+class AccesoMetricasTests(SimpleTestCase):
+
+    def test_solo_las_direcciones_permitidas(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        with override_settings(METRICAS_IPS_PERMITIDAS=['203.0.113.0/24']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_con_token_se_exige_el_header(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer otro'}).status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer secreto'}).status_code, 200)
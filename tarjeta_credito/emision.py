@@ -0,0 +1,38 @@
+"""
+Emisión de tarjetas por lotes.
+
+Los números salen de la secuencia de asignador_tarjetas: cada lote reserva
+todos sus números de una vez (el asignador descarta los que coinciden con
+tarjetas existentes con una sola consulta por rangos del índice), arma los
+números de todo el lote con el dígito de Luhn por lotes (numerar_tarjetas)
+e inserta las tarjetas con bulk_create.
+"""
+from django.db import transaction
+
+from cuenta.directorio import directorio
+from .models import TarjetaCredito, asignador_tarjetas, numerar_tarjetas
+
+
+def emitir_tarjetas(solicitudes, tamano_lote=1000):
+    """
+    Emite una tarjeta por cada (usuario_id, marca, limite_credito) de
+    `solicitudes` y retorna las tarjetas creadas, en el mismo orden.
+    """
+    emitidas = []
+    for inicio in range(0, len(solicitudes), tamano_lote):
+        lote = solicitudes[inicio:inicio + tamano_lote]
+        with transaction.atomic():
+            tarjetas = [
+                TarjetaCredito(
+                    usuario_id=usuario_id, marca=marca,
+                    limite_credito=limite_credito, credito_disponible=limite_credito,
+                )
+                for usuario_id, marca, limite_credito in lote
+            ]
+            numerar_tarjetas(tarjetas, asignador_tarjetas.reservar(len(lote)))
+            for tarjeta in tarjetas:
+                tarjeta.completar_datos()
+            emitidas.extend(TarjetaCredito.objects.bulk_create(tarjetas))
+            # bulk_create no emite post_save
+            directorio.invalidar(usuario_ids={usuario_id for usuario_id, _, _ in lote})
+    return emitidas
@@ -0,0 +1,176 @@
+"""
+Operaciones por lotes sobre transacciones de tarjeta.
+
+Cobro: cada bloque se cobra en una sola transacción: una lectura de las
+transacciones del bloque, un UPDATE condicional (pendiente -> cobrada) por
+cuenta destino, un único incremento de saldo por cuenta y los movimientos
+del libro con bulk_create. El resultado se informa por ítem.
+
+Vencimiento: las retenciones pendientes más antiguas que el corte se
+cancelan por lotes y el crédito se devuelve con un UPDATE por lote,
+agrupado por tarjeta.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from cuenta.models import Cuenta, MovimientoCuenta
+from nucleo.metricas import RETENCIONES_TARJETA
+from transferencia.motor import aplicar_deltas
+from .models import TarjetaCredito, TransaccionTarjeta
+
+
+class CambioConcurrente(Exception):
+    """Otro proceso cambió el estado de transacciones del bloque entre la lectura y el UPDATE"""
+
+
+def cobrar_lote(items, tamano_bloque=1000, reintentos=3):
+    """
+    Cobra `items`, una lista de (id_transaccion, numero_cuenta_destino).
+
+    Retorna una lista paralela de resultados:
+    {'id_transaccion', 'success', 'estado', 'monto'?, 'error'?}. Una
+    transacción ya cobrada en la misma cuenta cuenta como éxito (no se vuelve
+    a acreditar); una registrada para otra cuenta destino no se cobra.
+    """
+    resultados = []
+    for inicio in range(0, len(items), tamano_bloque):
+        bloque = items[inicio:inicio + tamano_bloque]
+        for intento in range(reintentos):
+            try:
+                with transaction.atomic():
+                    resultados_bloque = _cobrar_bloque(bloque)
+                break
+            except CambioConcurrente:
+                resultados_bloque = [
+                    _error(id_transaccion, 'Cobro concurrente, reintente el lote') for id_transaccion, _ in bloque
+                ]
+        resultados.extend(resultados_bloque)
+    return resultados
+
+
+def _error(id_transaccion, mensaje, estado=None):
+    return {'id_transaccion': str(id_transaccion), 'success': False, 'estado': estado, 'error': mensaje}
+
+
+def _como_uuid(valor):
+    try:
+        return valor if isinstance(valor, uuid.UUID) else uuid.UUID(str(valor))
+    except ValueError:
+        return None
+
+
+def _cobrar_bloque(bloque):
+    ahora = timezone.now()
+    bloque = [
+        (_como_uuid(id_transaccion) if isinstance(id_transaccion, (str, uuid.UUID)) else None, id_transaccion, numero)
+        for id_transaccion, numero in bloque
+    ]
+    numeros = {numero for _, _, numero in bloque if isinstance(numero, str)}
+    cuentas = dict(
+        Cuenta.objects.filter(numero_cuenta__in=numeros, activa=True).values_list('numero_cuenta', 'pk')
+    )
+    actuales = {
+        pk: (estado, monto, numero)
+        for pk, estado, monto, numero in TransaccionTarjeta.objects.select_for_update()
+        .filter(pk__in=[id_transaccion for id_transaccion, _, _ in bloque if id_transaccion])
+        .values_list('pk', 'estado', 'monto', 'numero_cuenta_destino')
+    }
+
+    resultados = []
+    por_cuenta = defaultdict(list)
+    for id_transaccion, recibido, numero_cuenta in bloque:
+        if not isinstance(recibido, (str, uuid.UUID)):
+            resultados.append(_error(recibido, 'ID de transacción inválido'))
+            continue
+        actual = actuales.get(id_transaccion)
+        if actual is None:
+            resultados.append(_error(recibido, 'Transacción no encontrada'))
+            continue
+        estado, monto, numero_registrado = actual
+        if estado == 'cobrada' and numero_registrado == numero_cuenta:
+            resultados.append({'id_transaccion': str(id_transaccion), 'success': True, 'estado': estado,
+                               'monto': monto, 'ya_cobrada': True})
+        elif estado != 'pendiente':
+            resultados.append(_error(id_transaccion, f'La transacción ya está en estado: {estado}', estado))
+        elif numero_registrado and numero_registrado != numero_cuenta:
+            resultados.append(_error(id_transaccion, 'La transacción está registrada para otra cuenta destino', estado))
+        elif not isinstance(numero_cuenta, str) or numero_cuenta not in cuentas:
+            resultados.append(_error(id_transaccion, 'Cuenta destino no encontrada o inactiva', estado))
+        else:
+            # Se marca como cobrada para que un id repetido en el mismo lote no se cobre dos veces
+            actuales[id_transaccion] = ('cobrada', monto, numero_cuenta)
+            por_cuenta[numero_cuenta].append((id_transaccion, monto))
+            resultados.append({'id_transaccion': str(id_transaccion), 'success': True, 'estado': 'cobrada',
+                               'monto': monto})
+
+    deltas = defaultdict(Decimal)
+    movimientos = []
+    for numero_cuenta, cobros in por_cuenta.items():
+        ids = [id_transaccion for id_transaccion, _ in cobros]
+        reclamadas = TransaccionTarjeta.objects.filter(
+            TransaccionTarjeta.cobrable_en(numero_cuenta), pk__in=ids, estado='pendiente'
+        ).update(
+            estado='cobrada', fecha_cobro=ahora, numero_cuenta_destino=numero_cuenta
+        )
+        if reclamadas != len(ids):
+            raise CambioConcurrente()
+        cuenta_id = cuentas[numero_cuenta]
+        for id_transaccion, monto in cobros:
+            deltas[cuenta_id] += monto
+            movimientos.append(MovimientoCuenta(
+                cuenta_id=cuenta_id, monto=monto, tipo='CREDITO_COBRO_TARJETA',
+                referencia=str(id_transaccion), fecha=ahora,
+            ))
+
+    aplicar_deltas(deltas)
+    MovimientoCuenta.objects.bulk_create(movimientos)
+    return resultados
+
+
+def pendientes_de_cuenta(numero_cuenta, limite=None):
+    """Ids de las transacciones pendientes registradas para la cuenta del comercio"""
+    ids = TransaccionTarjeta.objects.filter(
+        numero_cuenta_destino=numero_cuenta, estado='pendiente'
+    ).order_by('pk').values_list('pk', flat=True)
+    return list(ids[:limite] if limite else ids)
+
+
+def cancelar_retenciones_vencidas(corte, tamano_lote=1000):
+    """
+    Cancela hasta `tamano_lote` transacciones pendientes con fecha_pago
+    anterior a `corte` y devuelve su monto al crédito de cada tarjeta.
+    Retorna (transacciones canceladas, tarjetas afectadas); (0, 0) cuando no
+    quedan retenciones vencidas.
+    """
+    with transaction.atomic():
+        filas = list(
+            TransaccionTarjeta.objects.select_for_update()
+            .filter(estado='pendiente', fecha_pago__lt=corte)
+            .order_by('fecha_pago')
+            .values_list('pk', 'tarjeta_id', 'monto')[:tamano_lote]
+        )
+        if not filas:
+            return 0, 0
+
+        canceladas = TransaccionTarjeta.objects.filter(
+            pk__in=[pk for pk, _, _ in filas], estado='pendiente'
+        ).update(estado='cancelada')
+        if canceladas != len(filas):
+            raise CambioConcurrente()
+
+        por_tarjeta = defaultdict(Decimal)
+        for _, tarjeta_id, monto in filas:
+            por_tarjeta[tarjeta_id] += monto
+        TarjetaCredito.objects.filter(pk__in=por_tarjeta).update(
+            credito_disponible=F('credito_disponible') + Case(
+                *[When(pk=tarjeta_id, then=Value(monto)) for tarjeta_id, monto in por_tarjeta.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+    RETENCIONES_TARJETA.inc('cancelada', 'vencida', cantidad=len(filas))
+    return len(filas), len(por_tarjeta)
@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError
+from django.utils import timezone
+
+from nucleo.metricas import iniciar_publicador, publicar
+from tarjeta_credito.lotes import CambioConcurrente, cancelar_retenciones_vencidas
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancela por lotes los pagos con tarjeta pendientes de cobro más antiguos que "
+        "TARJETA_AUTORIZACION_EXPIRA_HORAS y devuelve el monto al crédito disponible."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=None,
+                            help='Antigüedad de vencimiento (por defecto TARJETA_AUTORIZACION_EXPIRA_HORAS)')
+        parser.add_argument('--tamano-lote', type=int, default=1000,
+                            help='Transacciones canceladas por transacción de base de datos')
+        parser.add_argument('--pausa', type=float, default=0,
+                            help='Segundos de espera entre lotes para no acaparar la base de datos')
+        parser.add_argument('--reintentos', type=int, default=3,
+                            help='Intentos por lote ante un conflicto antes de terminar con error')
+
+    def handle(self, *args, **options):
+        horas = options['horas'] or settings.TARJETA_AUTORIZACION_EXPIRA_HORAS
+        corte = timezone.now() - timedelta(hours=horas)
+
+        self.stdout.write(f"Cancelando retenciones pendientes anteriores a {corte.isoformat()}")
+        iniciar_publicador()
+        try:
+            self.cancelar_por_lotes(corte, options)
+        finally:
+            publicar()
+
+    def cancelar_por_lotes(self, corte, options):
+        total_canceladas = total_tarjetas = 0
+        fallos = 0
+        while True:
+            try:
+                canceladas, tarjetas = cancelar_retenciones_vencidas(corte, options['tamano_lote'])
+            except (CambioConcurrente, OperationalError) as e:
+                # El lote se revirtió completo; se vuelve a leer
+                fallos += 1
+                if fallos >= options['reintentos']:
+                    raise CommandError(
+                        f"Lote fallido tras {fallos} intentos ({total_canceladas} retenciones ya canceladas): "
+                        f"{e.__class__.__name__} {e}"
+                    )
+                self.stderr.write(f"Lote reintentado: {e.__class__.__name__} {e}")
+                time.sleep(0.1)
+                continue
+            fallos = 0
+            if not canceladas:
+                break
+            total_canceladas += canceladas
+            total_tarjetas += tarjetas
+            self.stdout.write(f"Lote procesado: {canceladas} canceladas en {tarjetas} tarjetas")
+            if options['pausa']:
+                time.sleep(options['pausa'])
+
+        self.stdout.write(f"Total: {total_canceladas} retenciones canceladas")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tarjeta_credito.models import TarjetaCredito
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca como VENCIDA, con un único UPDATE, todas las tarjetas ACTIVA cuya fecha "
+        "de vencimiento ya pasó. Pensado para ejecutarse una vez por día."
+    )
+
+    def handle(self, *args, **options):
+        vencidas = TarjetaCredito.objects.vencidas_sin_marcar().update(estado='VENCIDA')
+        self.stdout.write(f"Total: {vencidas} tarjetas marcadas como vencidas")
@@ -0,0 +1,75 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tarjeta_credito.emision import emitir_tarjetas
+from tarjeta_credito.models import TarjetaCredito
+
+
+class Command(BaseCommand):
+    help = (
+        "Emite tarjetas de crédito por lotes. Lee un CSV con columnas "
+        "username[,marca,limite_credito] o, con --sin-tarjeta, emite una para cada "
+        "usuario que todavía no tiene ninguna."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archivo', help='CSV con encabezado username[,marca,limite_credito]')
+        parser.add_argument('--sin-tarjeta', action='store_true',
+                            help='Emitir para todos los usuarios sin tarjeta')
+        parser.add_argument('--marca', default='CABAL', help='Marca cuando el CSV no la indica')
+        parser.add_argument('--limite', default='50000.00', help='Límite cuando el CSV no lo indica')
+        parser.add_argument('--tamano-lote', type=int, default=1000,
+                            help='Tarjetas insertadas por transacción de base de datos')
+
+    def handle(self, *args, **options):
+        if bool(options['archivo']) == options['sin_tarjeta']:
+            raise CommandError("Indique --archivo o --sin-tarjeta (uno de los dos)")
+        marcas_validas = {choice[0] for choice in TarjetaCredito.MARCA_CHOICES}
+
+        if options['sin_tarjeta']:
+            usuarios = User.objects.filter(tarjetas_credito__isnull=True).values_list('id', flat=True)
+            filas = [(usuario_id, options['marca'], options['limite']) for usuario_id in usuarios.iterator()]
+        else:
+            filas = self.leer_archivo(options)
+
+        solicitudes = []
+        for usuario_id, marca, limite in filas:
+            if marca not in marcas_validas:
+                raise CommandError(f"Marca inválida: {marca}")
+            try:
+                solicitudes.append((usuario_id, marca, Decimal(limite)))
+            except InvalidOperation:
+                raise CommandError(f"Límite inválido: {limite}")
+
+        self.stdout.write(f"Emitiendo {len(solicitudes)} tarjetas")
+        inicio = time.perf_counter()
+        emitidas = emitir_tarjetas(solicitudes, tamano_lote=options['tamano_lote'])
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(f"Total: {len(emitidas)} tarjetas emitidas en {duracion:.1f}s")
+
+    def leer_archivo(self, options):
+        try:
+            with open(options['archivo'], newline='', encoding='utf-8') as archivo:
+                filas = list(csv.DictReader(archivo))
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {options['archivo']}: {e}")
+
+        usernames = {fila['username'].strip() for fila in filas if fila.get('username')}
+        usuarios = {}
+        pendientes = sorted(usernames)
+        for inicio in range(0, len(pendientes), 10000):
+            usuarios.update(
+                User.objects.filter(username__in=pendientes[inicio:inicio + 10000]).values_list('username', 'id')
+            )
+        faltantes = usernames - set(usuarios)
+        if faltantes:
+            raise CommandError(f"Usuarios inexistentes: {', '.join(sorted(faltantes)[:10])}")
+        return [
+            (usuarios[fila['username'].strip()], fila.get('marca') or options['marca'],
+             fila.get('limite_credito') or options['limite'])
+            for fila in filas if fila.get('username')
+        ]
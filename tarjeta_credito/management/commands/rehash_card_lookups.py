@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from tarjeta_credito.models import actualizar_huellas
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula con la SECRET_KEY actual la huella de búsqueda por datos (huella_datos) "
+        "de todas las tarjetas. Se ejecuta después de rotar SECRET_KEY."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=2000,
+                            help='Tarjetas recalculadas por UPDATE')
+
+    def handle(self, *args, **options):
+        total = actualizar_huellas(options['tamano_lote'])
+        self.stdout.write(f"Total: {total} tarjetas recalculadas")
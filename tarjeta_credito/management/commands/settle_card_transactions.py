@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tarjeta_credito.lotes import cobrar_lote, pendientes_de_cuenta
+
+
+class Command(BaseCommand):
+    help = (
+        "Cobra por lotes transacciones de tarjeta en la cuenta de un comercio. "
+        "Sin ids cobra todas las transacciones pendientes registradas para la cuenta."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', help='id_transaccion a cobrar')
+        parser.add_argument('--cuenta', required=True, help='numero_cuenta_destino del comercio')
+        parser.add_argument('--archivo', help='Archivo con un id_transaccion por línea')
+        parser.add_argument('--tamano-lote', type=int, default=1000,
+                            help='Transacciones cobradas por transacción de base de datos')
+
+    def handle(self, *args, **options):
+        cuenta = options['cuenta']
+        ids = list(options['ids'])
+        if options['archivo']:
+            try:
+                with open(options['archivo'], encoding='utf-8') as archivo:
+                    ids.extend(linea.strip() for linea in archivo if linea.strip())
+            except OSError as e:
+                raise CommandError(f"No se pudo leer {options['archivo']}: {e}")
+
+        if not ids:
+            ids = pendientes_de_cuenta(cuenta)
+        self.stdout.write(f"Cobrando {len(ids)} transacciones en la cuenta {cuenta}")
+
+        cobradas = fallidas = 0
+        for inicio in range(0, len(ids), options['tamano_lote']):
+            bloque = [(id_transaccion, cuenta) for id_transaccion in ids[inicio:inicio + options['tamano_lote']]]
+            for resultado in cobrar_lote(bloque, tamano_bloque=options['tamano_lote']):
+                if resultado['success']:
+                    cobradas += 1
+                else:
+                    fallidas += 1
+                    self.stderr.write(f"{resultado['id_transaccion']}: {resultado['error']}")
+            self.stdout.write(f"Lote procesado: {cobradas} cobradas, {fallidas} fallidas")
+
+        self.stdout.write(f"Total: {cobradas} cobradas, {fallidas} fallidas")
+        if fallidas:
+            raise CommandError(f"{fallidas} transacciones no se pudieron cobrar")
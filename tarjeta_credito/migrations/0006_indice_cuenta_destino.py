@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tarjeta_credito', '0005_alter_tarjetacredito_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transacciontarjeta',
+            name='numero_cuenta_destino',
+            field=models.CharField(blank=True, db_index=True, max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tarjeta_credito', '0006_indice_cuenta_destino'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transacciontarjeta',
+            index=models.Index(fields=['estado', 'fecha_pago'], name='transaccion_estado_fecha_idx'),
+        ),
+    ]
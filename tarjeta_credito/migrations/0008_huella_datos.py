@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+
+def cargar_huellas(apps, schema_editor):
+    TarjetaCredito = apps.get_model('tarjeta_credito', 'TarjetaCredito')
+    ultimo = 0
+    while True:
+        tarjetas = list(
+            TarjetaCredito.objects.filter(pk__gt=ultimo).order_by('pk')
+            .only('pk', 'ultimos_4_digitos', 'cvc', 'fecha_vencimiento')[:2000]
+        )
+        if not tarjetas:
+            return
+        for tarjeta in tarjetas:
+            valor = f"{tarjeta.ultimos_4_digitos}|{tarjeta.cvc}|{tarjeta.fecha_vencimiento.isoformat()}"
+            tarjeta.huella_datos = salted_hmac('tarjeta_credito.huella_datos', valor, algorithm='sha256').hexdigest()
+        TarjetaCredito.objects.bulk_update(tarjetas, ['huella_datos'])
+        ultimo = tarjetas[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tarjeta_credito', '0007_indice_estado_fecha_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarjetacredito',
+            name='huella_datos',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='HMAC de últimos 4 dígitos, CVC y vencimiento para búsquedas indexadas', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(cargar_huellas, migrations.RunPython.noop),
+    ]
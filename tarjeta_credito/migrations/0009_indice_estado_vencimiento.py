@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tarjeta_credito', '0008_huella_datos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tarjetacredito',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='tarjeta_estado_vencim_idx'),
+        ),
+    ]
@@ -1,11 +1,152 @@
-from django.db import models
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinLengthValidator, MaxLengthValidator
+from django.utils.crypto import salted_hmac
 from datetime import datetime, timedelta
+from decimal import Decimal
 import random
 import string
 import uuid
 
+from nucleo.identificadores import AsignadorIdentificadores, con_digito_luhn, con_digitos_luhn, digito_luhn
+
+PREFIJOS_MARCA = {
+    'AMERICAN_EXPRESS': ['34', '37'],  # American Express inicia con 34 o 37
+    'CABAL': ['627170', '589657'],     # Cabal tiene prefijos específicos
+    'CREDICARD': ['636368', '636297'], # Credicard prefijos
+}
+PREFIJO_POR_DEFECTO = ['5555']
+
+
+def formatear_numero_tarjeta(prefijo, numero):
+    """Prefijo de la marca, número de la secuencia y dígito de Luhn: 16 dígitos"""
+    return con_digito_luhn(f"{prefijo}{numero:0{15 - len(prefijo)}d}")
+
+
+def formatear_numeros_tarjeta(prefijo, numeros):
+    """formatear_numero_tarjeta para muchos números con el mismo prefijo"""
+    return con_digitos_luhn(prefijo, numeros, 15 - len(prefijo))
+
+
+def numerar_tarjetas(tarjetas, numeros):
+    """
+    Asigna a cada tarjeta (sin guardar) su número a partir de un número de
+    la secuencia ya reservado. El prefijo se elige por tarjeta según su
+    marca y los números con el mismo prefijo se formatean juntos
+    (formatear_numeros_tarjeta).
+    """
+    por_prefijo = {}
+    for tarjeta, numero in zip(tarjetas, numeros):
+        prefijo = random.choice(PREFIJOS_MARCA.get(tarjeta.marca, PREFIJO_POR_DEFECTO))
+        por_prefijo.setdefault(prefijo, []).append((tarjeta, numero))
+    for prefijo, grupo in por_prefijo.items():
+        numeros_tarjeta = formatear_numeros_tarjeta(prefijo, [numero for _, numero in grupo])
+        for (tarjeta, _), numero_tarjeta in zip(grupo, numeros_tarjeta):
+            tarjeta.numero_tarjeta = numero_tarjeta
+            tarjeta.ultimos_4_digitos = numero_tarjeta[-4:]
+
+
+def numeros_tarjeta_en_uso(numeros):
+    """
+    Números de la secuencia que, con alguno de los prefijos, coinciden con
+    una tarjeta de número aleatorio. Una sola consulta por bloque: con cada
+    prefijo, los números de tarjeta del bloque caen en un rango del índice
+    de numero_tarjeta, que solo puede tener tarjetas anteriores a la
+    secuencia (los números del bloque se acaban de reservar).
+    """
+    if not numeros:
+        return set()
+    prefijos = {p for lista in PREFIJOS_MARCA.values() for p in lista} | set(PREFIJO_POR_DEFECTO)
+    menor, mayor = min(numeros), max(numeros)
+    rangos = Q()
+    for prefijo in prefijos:
+        ancho = 15 - len(prefijo)
+        rangos |= Q(numero_tarjeta__range=(f"{prefijo}{menor:0{ancho}d}0", f"{prefijo}{mayor:0{ancho}d}9"))
+    buscados = set(numeros)
+    en_uso = set()
+    for numero_tarjeta in TarjetaCredito.objects.filter(rangos).values_list('numero_tarjeta', flat=True):
+        for prefijo in prefijos:
+            if numero_tarjeta.startswith(prefijo) and int(numero_tarjeta[len(prefijo):-1]) in buscados:
+                en_uso.add(int(numero_tarjeta[len(prefijo):-1]))
+    return en_uso
+
+
+asignador_tarjetas = AsignadorIdentificadores('numero_tarjeta', en_uso=numeros_tarjeta_en_uso)
+
+
+def huella_datos_tarjeta(ultimos_4_digitos, cvc, fecha_vencimiento, secreto=None):
+    """
+    HMAC (con SECRET_KEY, o `secreto`) de últimos 4 dígitos, CVC y
+    vencimiento. Se indexa para buscar una tarjeta por esos datos sin
+    recorrer la tabla y sin indexar el CVC en claro. Si cambia SECRET_KEY
+    hay que recalcularla (ver el comando rehash_card_lookups).
+    """
+    valor = f"{ultimos_4_digitos}|{cvc}|{fecha_vencimiento.isoformat()}"
+    return salted_hmac('tarjeta_credito.huella_datos', valor, secret=secreto, algorithm='sha256').hexdigest()
+
+
+def huellas_datos_tarjeta(ultimos_4_digitos, cvc, fecha_vencimiento):
+    """
+    Huellas con SECRET_KEY y con cada SECRET_KEY_FALLBACKS: mientras se
+    rota la clave, las tarjetas que todavía no se recalcularon se siguen
+    encontrando
+    """
+    return [
+        huella_datos_tarjeta(ultimos_4_digitos, cvc, fecha_vencimiento, secreto)
+        for secreto in [settings.SECRET_KEY, *settings.SECRET_KEY_FALLBACKS]
+    ]
+
+
+def actualizar_huellas(tamano_lote=2000):
+    """
+    Recalcula huella_datos de todas las tarjetas por lotes (p. ej. tras
+    cambiar SECRET_KEY). Retorna la cantidad de tarjetas recalculadas.
+    """
+    ultimo = total = 0
+    while True:
+        tarjetas = list(
+            TarjetaCredito.objects.filter(pk__gt=ultimo).order_by('pk')
+            .only('pk', 'ultimos_4_digitos', 'cvc', 'fecha_vencimiento')[:tamano_lote]
+        )
+        if not tarjetas:
+            return total
+        for tarjeta in tarjetas:
+            tarjeta.huella_datos = huella_datos_tarjeta(tarjeta.ultimos_4_digitos, tarjeta.cvc, tarjeta.fecha_vencimiento)
+        TarjetaCredito.objects.bulk_update(tarjetas, ['huella_datos'])
+        ultimo = tarjetas[-1].pk
+        total += len(tarjetas)
+
+
+class TarjetaCreditoQuerySet(models.QuerySet):
+
+    def con_estado_efectivo(self):
+        """
+        Anota `estado_efectivo`: VENCIDA para las tarjetas ACTIVA ya vencidas
+        aunque el comando expire_cards todavía no las haya marcado. Las
+        lecturas usan este valor en lugar de escribir el estado.
+        """
+        return self.annotate(estado_efectivo=Case(
+            When(estado='ACTIVA', fecha_vencimiento__lt=timezone.localdate(), then=Value('VENCIDA')),
+            default=F('estado'),
+            output_field=models.CharField(max_length=15),
+        ))
+
+    def por_datos(self, ultimos_4_digitos, cvc, fecha_vencimiento):
+        """Filtra por últimos 4 dígitos, CVC y vencimiento usando el índice de huella_datos"""
+        return self.filter(
+            huella_datos__in=huellas_datos_tarjeta(ultimos_4_digitos, cvc, fecha_vencimiento),
+            ultimos_4_digitos=ultimos_4_digitos,
+            cvc=cvc,
+            fecha_vencimiento=fecha_vencimiento,
+        )
+
+    def vencidas_sin_marcar(self):
+        """Tarjetas ACTIVA con fecha de vencimiento pasada"""
+        return self.filter(estado='ACTIVA', fecha_vencimiento__lt=timezone.localdate())
+
 
 class TarjetaCredito(models.Model):
     MARCA_CHOICES = [
@@ -54,6 +195,12 @@ class TarjetaCredito(models.Model):
         validators=[MinLengthValidator(3), MaxLengthValidator(4)]
     )
     fecha_vencimiento = models.DateField(editable=False)
+    huella_datos = models.CharField(
+        max_length=64,
+        editable=False,
+        db_index=True,
+        help_text="HMAC de últimos 4 dígitos, CVC y vencimiento para búsquedas indexadas"
+    )
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     estado = models.CharField(
         max_length=15,
@@ -71,9 +218,20 @@ class TarjetaCredito(models.Model):
         default=50000.00
     )
 
+    objects = TarjetaCreditoQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
+        self.completar_datos()
+        super().save(*args, **kwargs)
+
+    def completar_datos(self, numero=None):
+        """
+        Completa número, CVC, vencimiento y huella antes de guardar. `numero`
+        es un número de la secuencia ya reservado (emisión por lotes); si
+        falta se pide uno al asignador.
+        """
         if not self.numero_tarjeta:
-            self.numero_tarjeta = self.generar_numero_tarjeta()
+            self.numero_tarjeta = self.generar_numero_tarjeta(numero)
             self.ultimos_4_digitos = self.numero_tarjeta[-4:]
 
         if not self.cvc:
@@ -82,58 +240,27 @@ class TarjetaCredito(models.Model):
         if not self.fecha_vencimiento:
             self.fecha_vencimiento = self.generar_fecha_vencimiento()
 
+        self.huella_datos = huella_datos_tarjeta(self.ultimos_4_digitos, self.cvc, self.fecha_vencimiento)
+
         # Asegurar que el crédito disponible no sea mayor al límite
         if self.credito_disponible > self.limite_credito:
             self.credito_disponible = self.limite_credito
 
-        super().save(*args, **kwargs)
+    @classmethod
+    def buscar_por_datos(cls, ultimos_4_digitos, cvc, fecha_vencimiento):
+        """Tarjetas con esos datos, resueltas por el índice de huella_datos"""
+        return cls.objects.por_datos(ultimos_4_digitos, cvc, fecha_vencimiento)
 
-    def generar_numero_tarjeta(self):
+    def generar_numero_tarjeta(self, numero=None):
         """Genera un número de tarjeta único basado en la marca seleccionada"""
-        prefijos = {
-            'AMERICAN_EXPRESS': ['34', '37'],  # American Express inicia con 34 o 37
-            'CABAL': ['627170', '589657'],     # Cabal tiene prefijos específicos
-            'CREDICARD': ['636368', '636297'], # Credicard prefijos
-        }
-
-        prefijo = random.choice(prefijos.get(self.marca, ['5555']))  # Default
-
-        # Generar el resto de dígitos
-        longitud_restante = 16 - len(prefijo) - 1  # -1 para el dígito de verificación
-        resto = ''.join(random.choices(string.digits, k=longitud_restante))
-
-        # Calcular dígito de verificación usando algoritmo de Luhn
-        numero_base = prefijo + resto
-        digito_verificacion = self.calcular_digito_luhn(numero_base)
-
-        numero_completo = numero_base + str(digito_verificacion)
-
-        # Verificar que el número no existe
-        while TarjetaCredito.objects.filter(numero_tarjeta=numero_completo).exists():
-            resto = ''.join(random.choices(string.digits, k=longitud_restante))
-            numero_base = prefijo + resto
-            digito_verificacion = self.calcular_digito_luhn(numero_base)
-            numero_completo = numero_base + str(digito_verificacion)
-
-        return numero_completo
+        prefijo = random.choice(PREFIJOS_MARCA.get(self.marca, PREFIJO_POR_DEFECTO))
+        if numero is None:
+            numero = asignador_tarjetas.siguiente()
+        return formatear_numero_tarjeta(prefijo, numero)
 
     def calcular_digito_luhn(self, numero):
         """Calcula el dígito de verificación usando el algoritmo de Luhn"""
-        suma = 0
-        es_par = True
-
-        for i in range(len(numero) - 1, -1, -1):
-            digito = int(numero[i])
-
-            if es_par:
-                digito *= 2
-                if digito > 9:
-                    digito = digito // 10 + digito % 10
-
-            suma += digito
-            es_par = not es_par
-
-        return (10 - (suma % 10)) % 10
+        return digito_luhn(numero)
 
     def generar_cvc(self):
         """Genera un CVC de 3 o 4 dígitos según la marca"""
@@ -154,7 +281,12 @@ class TarjetaCredito(models.Model):
     @property
     def esta_vencida(self):
         """Verifica si la tarjeta está vencida"""
-        return self.fecha_vencimiento < datetime.now().date()
+        return self.fecha_vencimiento < timezone.localdate()
+
+    @property
+    def estado_efectivo_display(self):
+        """Texto de `estado_efectivo` (requiere la anotación con_estado_efectivo)"""
+        return dict(self.ESTADO_CHOICES).get(self.estado_efectivo, self.estado_efectivo)
 
     @property
     def credito_utilizado(self):
@@ -167,6 +299,42 @@ class TarjetaCredito(models.Model):
             self.estado = 'VENCIDA'
             self.save()
 
+    def retener_credito(self, monto):
+        """
+        Descuenta `monto` del crédito disponible con un único UPDATE
+        condicionado a que la tarjeta esté ACTIVA, no vencida y el crédito alcance, así
+        dos pagos simultáneos no pueden exceder el límite. Retorna True si la
+        retención se aplicó; en ese caso credito_disponible queda con el valor
+        resultante.
+        """
+        if connection.vendor in ('postgresql', 'sqlite'):
+            # UPDATE ... RETURNING: el saldo resultante sin otra consulta
+            nombre = connection.ops.quote_name
+            tabla = nombre(self._meta.db_table)
+            pk, estado = nombre(self._meta.pk.column), nombre(self._meta.get_field('estado').column)
+            credito = nombre(self._meta.get_field('credito_disponible').column)
+            vencimiento = nombre(self._meta.get_field('fecha_vencimiento').column)
+            hoy = connection.ops.adapt_datefield_value(timezone.localdate())
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {tabla} SET {credito} = {credito} - %s "
+                    f"WHERE {pk} = %s AND {estado} = %s AND {vencimiento} >= %s AND {credito} >= %s "
+                    f"RETURNING {credito}",
+                    [monto, self.pk, 'ACTIVA', hoy, monto],
+                )
+                fila = cursor.fetchone()
+            if fila is None:
+                return False
+            self.credito_disponible = Decimal(str(fila[0])).quantize(Decimal('0.01'))
+            return True
+
+        retenidas = TarjetaCredito.objects.filter(
+            pk=self.pk, estado='ACTIVA', fecha_vencimiento__gte=timezone.localdate(), credito_disponible__gte=monto
+        ).update(credito_disponible=F('credito_disponible') - monto)
+        if retenidas:
+            self.credito_disponible -= monto
+        return retenidas == 1
+
     def bloquear_tarjeta(self, motivo="Bloqueada por el usuario"):
         """Bloquea la tarjeta"""
         if self.estado == 'ACTIVA':
@@ -190,6 +358,10 @@ class TarjetaCredito(models.Model):
         verbose_name = "Tarjeta de Crédito"
         verbose_name_plural = "Tarjetas de Crédito"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Búsqueda de tarjetas ACTIVA vencidas (comando expire_cards)
+            models.Index(fields=['estado', 'fecha_vencimiento'], name='tarjeta_estado_vencim_idx'),
+        ]
 
 
 class TransaccionTarjeta(models.Model):
@@ -205,13 +377,58 @@ class TransaccionTarjeta(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADOS_CHOICES, default='pendiente')
     fecha_pago = models.DateTimeField(auto_now_add=True)
     fecha_cobro = models.DateTimeField(null=True, blank=True)
-    numero_cuenta_destino = models.CharField(max_length=20, null=True, blank=True)
+    numero_cuenta_destino = models.CharField(max_length=20, null=True, blank=True, db_index=True)
     descripcion = models.TextField(blank=True)
 
+    def cobrar(self, cuenta_destino):
+        """
+        Cobra la transacción acreditando su monto en `cuenta_destino`.
+
+        El paso pendiente -> cobrada es un UPDATE condicional en la misma
+        transacción que el crédito (incremento atómico y movimiento en el
+        libro): si varias llamadas cobran a la vez solo una lo aplica.
+        Retorna True si esta llamada la cobró; si no, la instancia queda con
+        el estado actual (el resultado de quien ganó). Una transacción
+        registrada para otra cuenta destino no se cobra.
+        """
+        from cuenta.libro import registrar_cobro_tarjeta
+        from transferencia.motor import acreditar
+
+        ahora = timezone.now()
+        with transaction.atomic():
+            cobrada = TransaccionTarjeta.objects.filter(
+                TransaccionTarjeta.cobrable_en(cuenta_destino.numero_cuenta), pk=self.pk, estado='pendiente'
+            ).update(
+                estado='cobrada', fecha_cobro=ahora, numero_cuenta_destino=cuenta_destino.numero_cuenta
+            )
+            if cobrada:
+                acreditar(cuenta_destino.pk, self.monto)
+                registrar_cobro_tarjeta(cuenta_destino.pk, self.monto, self.id_transaccion, ahora)
+
+        if not cobrada:
+            self.refresh_from_db(fields=['estado', 'fecha_cobro', 'numero_cuenta_destino'])
+            return False
+        self.estado = 'cobrada'
+        self.fecha_cobro = ahora
+        self.numero_cuenta_destino = cuenta_destino.numero_cuenta
+        return True
+
+    @staticmethod
+    def cobrable_en(numero_cuenta):
+        """Filtro: sin cuenta destino registrada o registrada para `numero_cuenta`"""
+        return Q(numero_cuenta_destino__isnull=True) | Q(numero_cuenta_destino='') | Q(numero_cuenta_destino=numero_cuenta)
+
+    def registrada_para_otra_cuenta(self, numero_cuenta):
+        return bool(self.numero_cuenta_destino) and self.numero_cuenta_destino != numero_cuenta
+
     def __str__(self):
         return f"Transacción {str(self.id_transaccion)[:8]} - ${self.monto}"
 
     class Meta:
         verbose_name = "Transacción de Tarjeta"
         verbose_name_plural = "Transacciones de Tarjetas"
-        ordering = ['-fecha_pago']
\ No newline at end of file
+        ordering = ['-fecha_pago']
+        indexes = [
+            # Búsqueda de retenciones vencidas (pendientes más antiguas que el corte)
+            models.Index(fields=['estado', 'fecha_pago'], name='transaccion_estado_fecha_idx'),
+        ]
\ No newline at end of file
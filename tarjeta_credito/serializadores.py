@@ -0,0 +1,83 @@
+"""Proyecciones de las respuestas JSON de tarjetas y transacciones (ver nucleo.proyecciones)"""
+from django.utils import timezone
+
+from nucleo.proyecciones import Proyeccion, como_display, como_iso, como_texto
+from .models import TarjetaCredito
+
+_estados = dict(TarjetaCredito.ESTADO_CHOICES)
+
+
+def _estado_efectivo(estado, fecha_vencimiento):
+    """El mismo cálculo que TarjetaCreditoQuerySet.con_estado_efectivo, sobre la fila ya leída"""
+    if estado == 'ACTIVA' and fecha_vencimiento < timezone.localdate():
+        return 'VENCIDA'
+    return estado
+
+
+_marca_display = ('marca', como_display(TarjetaCredito.MARCA_CHOICES))
+_estado = (('estado', 'fecha_vencimiento'), _estado_efectivo)
+_estado_display = (
+    ('estado', 'fecha_vencimiento'),
+    lambda estado, fecha_vencimiento: _estados.get(_estado_efectivo(estado, fecha_vencimiento), estado),
+)
+_enmascarado = ('ultimos_4_digitos', lambda ultimos_4: f"**** **** **** {ultimos_4}")
+
+
+TARJETA_DETALLE = Proyeccion({
+    'id': 'id',
+    'numero_enmascarado': _enmascarado,
+    'marca': 'marca',
+    'marca_display': _marca_display,
+    'ultimos_4_digitos': 'ultimos_4_digitos',
+    'fecha_vencimiento': ('fecha_vencimiento', como_iso),
+    'estado': _estado,
+    'estado_display': _estado_display,
+    'limite_credito': ('limite_credito', como_texto),
+    'credito_disponible': ('credito_disponible', como_texto),
+    # En Python: la resta en SQLite devuelve float y perdería el formato del Decimal
+    'credito_utilizado': (('limite_credito', 'credito_disponible'), lambda limite, disponible: str(limite - disponible)),
+    'esta_vencida': ('fecha_vencimiento', lambda fecha_vencimiento: fecha_vencimiento < timezone.localdate()),
+    'fecha_creacion': ('fecha_creacion', como_iso),
+    'usuario': 'usuario__username',
+})
+
+TARJETA_IDENTIFICADOR = Proyeccion({
+    'identificador_unico': ('identificador_unico', como_texto),
+    'numero_enmascarado': _enmascarado,
+    'marca': 'marca',
+    'marca_display': _marca_display,
+    'estado': _estado,
+    'estado_display': _estado_display,
+    'usuario': 'usuario__username',
+})
+
+TARJETA_POR_DATOS = Proyeccion({
+    'identificador_unico': ('identificador_unico', como_texto),
+    'numero_enmascarado': _enmascarado,
+    'ultimos_4_digitos': 'ultimos_4_digitos',
+    'marca': 'marca',
+    'marca_display': _marca_display,
+    'fecha_vencimiento': ('fecha_vencimiento', como_iso),
+    'estado': _estado,
+    'estado_display': _estado_display,
+    'limite_credito': ('limite_credito', float),
+    'credito_disponible': ('credito_disponible', float),
+    'fecha_creacion': ('fecha_creacion', como_iso),
+    'usuario': 'usuario__username',
+})
+
+TRANSACCION = Proyeccion({
+    'transaccion': {
+        'id': ('id_transaccion', como_texto),
+        'monto': ('monto', float),
+        'estado': 'estado',
+        'fecha_pago': ('fecha_pago', como_iso),
+        'fecha_cobro': ('fecha_cobro', como_iso),
+        'numero_cuenta_destino': 'numero_cuenta_destino',
+        'descripcion': 'descripcion',
+    },
+    'tarjeta': {
+        'marca': 'tarjeta__marca',
+        'ultimos_4_digitos': 'tarjeta__ultimos_4_digitos',
+    },
+})
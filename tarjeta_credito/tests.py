@@ -0,0 +1,450 @@
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cuenta.models import Cuenta, MovimientoCuenta
+from nucleo import metricas
+from nucleo.identificadores import digito_luhn
+from nucleo.models import SecuenciaIdentificador
+from nucleo.pruebas import VistasAsincronasMixin, valor_metrica
+from . import views
+from .emision import emitir_tarjetas
+from .lotes import CambioConcurrente, cancelar_retenciones_vencidas
+from .models import TarjetaCredito, TransaccionTarjeta, formatear_numero_tarjeta, numeros_tarjeta_en_uso
+from .serializadores import TARJETA_DETALLE
+
+
+def crear_transaccion(monto='250.00'):
+    titular = User.objects.create_user(username=f'titular{User.objects.count()}')
+    tarjeta = TarjetaCredito.objects.create(usuario=titular)
+    return TransaccionTarjeta.objects.create(tarjeta=tarjeta, monto=Decimal(monto))
+
+
+class CobroConcurrenteTests(TransactionTestCase):
+    """
+    Varios hilos cobran la misma transacción a la vez: exactamente uno la
+    cobra y la cuenta se acredita una sola vez.
+    """
+
+    HILOS = 8
+
+    def setUp(self):
+        comercio = User.objects.create_user(username='comercio')
+        self.cuenta = Cuenta.objects.create(usuario=comercio, saldo_disponible=1000)
+
+    def cobrar_en_paralelo(self, transaccion):
+        barrera = threading.Barrier(self.HILOS)
+        resultados, errores = [], []
+
+        def cobrar():
+            try:
+                propia = TransaccionTarjeta.objects.get(pk=transaccion.pk)
+                cuenta = Cuenta.objects.get(pk=self.cuenta.pk)
+                barrera.wait()
+                while True:
+                    try:
+                        resultados.append(propia.cobrar(cuenta))
+                        return
+                    except OperationalError:
+                        # SQLite en memoria compartida: la tabla está bloqueada por otro hilo
+                        time.sleep(0.001)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=cobrar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+        return resultados
+
+    def test_una_transaccion_no_se_cobra_dos_veces(self):
+        for _ in range(5):
+            transaccion = crear_transaccion()
+            saldo_anterior = Cuenta.objects.get(pk=self.cuenta.pk).saldo_disponible
+
+            resultados = self.cobrar_en_paralelo(transaccion)
+
+            self.assertEqual(sorted(resultados), [False] * (self.HILOS - 1) + [True])
+            self.cuenta.refresh_from_db()
+            self.assertEqual(self.cuenta.saldo_disponible, saldo_anterior + transaccion.monto)
+            self.assertEqual(
+                MovimientoCuenta.objects.filter(referencia=str(transaccion.pk)).count(), 1
+            )
+            transaccion.refresh_from_db()
+            self.assertEqual(transaccion.estado, 'cobrada')
+
+
+class CobrarTransaccionApiTests(TestCase):
+
+    def setUp(self):
+        comercio = User.objects.create_user(username='comercio')
+        self.cuenta = Cuenta.objects.create(usuario=comercio, saldo_disponible=1000)
+        self.transaccion = crear_transaccion()
+
+    def cobrar(self, numero_cuenta):
+        return self.client.post(
+            reverse('tarjeta_credito:cobrar_transaccion'),
+            json.dumps({'id_transaccion': str(self.transaccion.pk), 'numero_cuenta_destino': numero_cuenta}),
+            content_type='application/json',
+        )
+
+    def test_repetir_el_cobro_devuelve_el_resultado_sin_acreditar_de_nuevo(self):
+        primera = self.cobrar(self.cuenta.numero_cuenta)
+        segunda = self.cobrar(self.cuenta.numero_cuenta)
+
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(segunda.status_code, 200)
+        self.assertEqual(segunda.json()['data'], primera.json()['data'])
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_disponible, Decimal('1250.00'))
+
+    def test_cobrar_en_otra_cuenta_una_transaccion_ya_cobrada_falla(self):
+        otra = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=0)
+        self.cobrar(self.cuenta.numero_cuenta)
+
+        respuesta = self.cobrar(otra.numero_cuenta)
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['estado_actual'], 'cobrada')
+        otra.refresh_from_db()
+        self.assertEqual(otra.saldo_disponible, Decimal('0.00'))
+
+    def test_no_se_cobra_en_otra_cuenta_que_la_registrada_en_el_pago(self):
+        otra = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=0)
+        TransaccionTarjeta.objects.update(numero_cuenta_destino=self.cuenta.numero_cuenta)
+
+        respuesta = self.cobrar(otra.numero_cuenta)
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['error'], 'Cuenta destino no válida')
+        self.assertFalse(self.transaccion.cobrar(otra))
+        self.transaccion.refresh_from_db()
+        self.assertEqual(self.transaccion.estado, 'pendiente')
+        otra.refresh_from_db()
+        self.assertEqual(otra.saldo_disponible, Decimal('0.00'))
+        self.assertEqual(self.cobrar(self.cuenta.numero_cuenta).status_code, 200)
+
+
+class MetricasPagoTests(TestCase):
+
+    def test_cuenta_pagos_aprobados_y_rechazados_por_credito(self):
+        tarjeta = TarjetaCredito.objects.create(usuario=User.objects.create_user(username='titular'))
+        antes = {tuple(etiquetas): valor for etiquetas, valor in metricas.RETENCIONES_TARJETA.valores()}
+        for monto in ('100.00', str(tarjeta.credito_disponible)):
+            self.client.post(
+                reverse('tarjeta_credito:pagar_con_tarjeta'),
+                json.dumps({'id_tarjeta': str(tarjeta.identificador_unico), 'monto': monto}),
+                content_type='application/json',
+            )
+
+        despues = {tuple(etiquetas): valor for etiquetas, valor in metricas.RETENCIONES_TARJETA.valores()}
+        for etiquetas in (('aprobada', 'ninguno'), ('rechazada', 'credito_insuficiente')):
+            self.assertEqual(despues[etiquetas] - antes.get(etiquetas, 0), 1)
+
+
+class CobrarLoteApiTests(TestCase):
+
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(usuario=User.objects.create_user(username='comercio'), saldo_disponible=0)
+        self.otra = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=0)
+
+    def cobrar_lote(self, datos):
+        return self.client.post(
+            reverse('tarjeta_credito:cobrar_lote_api'), json.dumps(datos), content_type='application/json'
+        )
+
+    def test_cobra_las_pendientes_de_la_cuenta_con_un_incremento_por_cuenta(self):
+        transacciones = [crear_transaccion(monto) for monto in ('10.00', '20.00', '30.50')]
+        TransaccionTarjeta.objects.update(numero_cuenta_destino=self.cuenta.numero_cuenta)
+
+        respuesta = self.cobrar_lote({'numero_cuenta_destino': self.cuenta.numero_cuenta})
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['cobradas'], 3)
+        self.assertEqual(respuesta.json()['monto_acreditado'], '60.50')
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_disponible, Decimal('60.50'))
+        self.assertEqual(
+            MovimientoCuenta.objects.filter(referencia__in=[str(t.pk) for t in transacciones]).count(), 3
+        )
+        self.assertFalse(TransaccionTarjeta.objects.filter(estado='pendiente').exists())
+
+    def test_resultado_por_item_sin_acreditar_dos_veces(self):
+        primera, segunda = crear_transaccion('10.00'), crear_transaccion('5.00')
+        primera.cobrar(self.otra)
+
+        respuesta = self.cobrar_lote({'transacciones': [
+            {'id_transaccion': str(segunda.pk), 'numero_cuenta_destino': self.cuenta.numero_cuenta},
+            {'id_transaccion': str(segunda.pk), 'numero_cuenta_destino': self.cuenta.numero_cuenta},
+            {'id_transaccion': str(primera.pk), 'numero_cuenta_destino': self.cuenta.numero_cuenta},
+            {'id_transaccion': 'no-existe', 'numero_cuenta_destino': self.cuenta.numero_cuenta},
+        ]})
+
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['success'] for r in resultados], [True, True, False, False])
+        self.assertTrue(resultados[1]['ya_cobrada'])
+        self.assertEqual(resultados[2]['estado'], 'cobrada')
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_disponible, Decimal('5.00'))
+
+    def test_rechaza_por_item_otra_cuenta_e_ids_invalidos(self):
+        registrada = crear_transaccion('10.00')
+        registrada.numero_cuenta_destino = self.otra.numero_cuenta
+        registrada.save()
+
+        respuesta = self.cobrar_lote({'numero_cuenta_destino': self.cuenta.numero_cuenta,
+                                      'ids': [str(registrada.pk), ['lista'], {'id': 1}, 7]})
+
+        self.assertEqual(respuesta.status_code, 200)
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['success'] for r in resultados], [False] * 4)
+        self.assertEqual(resultados[0]['error'], 'La transacción está registrada para otra cuenta destino')
+        self.assertEqual({r['error'] for r in resultados[1:]}, {'ID de transacción inválido'})
+        registrada.refresh_from_db()
+        self.assertEqual(registrada.estado, 'pendiente')
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_disponible, Decimal('0.00'))
+
+
+class RetencionesVencidasTests(TestCase):
+
+    def test_cancela_las_vencidas_y_devuelve_el_credito(self):
+        tarjeta = TarjetaCredito.objects.create(usuario=User.objects.create_user(username='titular'))
+        for monto in ('100.00', '200.00', '300.00'):
+            tarjeta.retener_credito(Decimal(monto))
+            TransaccionTarjeta.objects.create(tarjeta=tarjeta, monto=Decimal(monto))
+        ahora = timezone.now()
+        TransaccionTarjeta.objects.exclude(monto=Decimal('300.00')).update(fecha_pago=ahora - timedelta(days=10))
+
+        self.assertEqual(cancelar_retenciones_vencidas(ahora - timedelta(days=7), tamano_lote=1), (1, 1))
+        self.assertEqual(cancelar_retenciones_vencidas(ahora - timedelta(days=7)), (1, 1))
+        self.assertEqual(cancelar_retenciones_vencidas(ahora - timedelta(days=7)), (0, 0))
+
+        tarjeta.refresh_from_db()
+        self.assertEqual(tarjeta.credito_disponible, tarjeta.limite_credito - Decimal('300.00'))
+        self.assertEqual(TransaccionTarjeta.objects.filter(estado='cancelada').count(), 2)
+
+    def test_el_comando_reintenta_cada_lote_un_numero_limitado_de_veces(self):
+        comando = 'tarjeta_credito.management.commands.expire_card_holds'
+        conflicto = CambioConcurrente()
+
+        with mock.patch(f'{comando}.cancelar_retenciones_vencidas',
+                        side_effect=[conflicto, (1, 1), conflicto, conflicto, (0, 0)]) as cancelar:
+            call_command('expire_card_holds', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(cancelar.call_count, 5)
+
+        with mock.patch(f'{comando}.cancelar_retenciones_vencidas', side_effect=conflicto) as cancelar:
+            with self.assertRaises(CommandError):
+                call_command('expire_card_holds', '--reintentos', '2', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(cancelar.call_count, 2)
+
+    def test_el_comando_publica_las_canceladas_en_metrics(self):
+        transaccion = crear_transaccion()
+        TransaccionTarjeta.objects.filter(pk=transaccion.pk).update(fecha_pago=timezone.now() - timedelta(days=30))
+        serie = 'homebanking_retenciones_tarjeta_total{resultado="cancelada",motivo="vencida"}'
+        antes = valor_metrica(metricas.formatear(metricas.instantanea()), serie)
+
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIRECTORIO=directorio):
+            call_command('expire_card_holds', stdout=StringIO())
+            # /metrics lo atiende otro proceso, que no publica los valores de este
+            with mock.patch.object(metricas, 'publicar'):
+                total = metricas.formatear(metricas.agregadas())
+
+        self.assertEqual(valor_metrica(total, serie) - antes, 1)
+
+
+class ConsultarTarjetaPorDatosTests(TestCase):
+
+    def test_busca_por_huella_y_mantiene_la_respuesta(self):
+        tarjeta = TarjetaCredito.objects.create(usuario=User.objects.create_user(username='titular'))
+        datos = {
+            'ultimos_4_digitos': tarjeta.ultimos_4_digitos,
+            'cvc': tarjeta.cvc,
+            'fecha_vencimiento': tarjeta.fecha_vencimiento.isoformat(),
+        }
+        url = reverse('tarjeta_credito:consultar_tarjeta_por_datos_api')
+
+        respuesta = self.client.post(url, json.dumps(datos), content_type='application/json')
+        otro_cvc = str((int(tarjeta.cvc) + 1) % 1000).zfill(3)
+        fallida = self.client.post(url, json.dumps({**datos, 'cvc': otro_cvc}), content_type='application/json')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['tarjeta']['identificador_unico'], str(tarjeta.identificador_unico))
+        self.assertEqual(fallida.status_code, 404)
+
+    def test_rotar_secret_key(self):
+        tarjeta = TarjetaCredito.objects.create(usuario=User.objects.create_user(username='titular'))
+        datos = (tarjeta.ultimos_4_digitos, tarjeta.cvc, tarjeta.fecha_vencimiento)
+        anterior = settings.SECRET_KEY
+
+        with override_settings(SECRET_KEY='clave-nueva', SECRET_KEY_FALLBACKS=[anterior]):
+            self.assertTrue(TarjetaCredito.objects.por_datos(*datos).exists())
+        with override_settings(SECRET_KEY='clave-nueva'):
+            self.assertFalse(TarjetaCredito.objects.por_datos(*datos).exists())
+            salida = StringIO()
+            call_command('rehash_card_lookups', stdout=salida)
+            self.assertIn('Total: 1 tarjetas recalculadas', salida.getvalue())
+            self.assertTrue(TarjetaCredito.objects.por_datos(*datos).exists())
+
+
+class ProyeccionesTests(TestCase):
+
+    def test_detalle_en_una_consulta_igual_al_armado_desde_la_instancia(self):
+        tarjeta = TarjetaCredito.objects.create(usuario=User.objects.create_user(username='titular'))
+        tarjeta.retener_credito(Decimal('99.99'))
+        tarjeta.refresh_from_db()
+
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(reverse('tarjeta_credito:consultar_tarjeta_api', args=[tarjeta.pk]))
+
+        self.assertEqual(respuesta.json()['tarjeta'], {
+            'id': tarjeta.id,
+            'numero_enmascarado': tarjeta.numero_enmascarado,
+            'marca': tarjeta.marca,
+            'marca_display': tarjeta.get_marca_display(),
+            'ultimos_4_digitos': tarjeta.ultimos_4_digitos,
+            'fecha_vencimiento': tarjeta.fecha_vencimiento.isoformat(),
+            'estado': 'ACTIVA',
+            'estado_display': 'Activa',
+            'limite_credito': str(tarjeta.limite_credito),
+            'credito_disponible': str(tarjeta.credito_disponible),
+            'credito_utilizado': str(tarjeta.credito_utilizado),
+            'esta_vencida': False,
+            'fecha_creacion': tarjeta.fecha_creacion.isoformat(),
+            'usuario': 'titular',
+        })
+        self.assertNotIn('cvc', TARJETA_DETALLE.lookups)
+
+
+class VistasAsincronasTests(VistasAsincronasMixin, TestCase):
+    """Las versiones async de las consultas (API_ASINCRONA) responden igual que las sincrónicas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.transaccion = crear_transaccion()
+        cls.tarjeta = cls.transaccion.tarjeta
+
+    async def test_consultas_de_tarjeta_y_transaccion(self):
+        for tarjeta_id in (self.tarjeta.pk, 0):
+            await self.comparar(views.consultar_tarjeta_api, views.consultar_tarjeta_api_async,
+                                f'/tarjeta-credito/api/consultar/{tarjeta_id}/', tarjeta_id=tarjeta_id)
+        id_transaccion = self.transaccion.id_transaccion
+        await self.comparar(views.consultar_transaccion, views.consultar_transaccion_async,
+                            f'/tarjeta-credito/transaccion/{id_transaccion}/', id_transaccion=id_transaccion)
+        username = self.tarjeta.usuario.username
+        for consulta in (f'username={username}', 'username=nadie', ''):
+            await self.comparar(views.listar_tarjetas_usuario_api, views.listar_tarjetas_usuario_api_async,
+                                f'/tarjeta-credito/api/tarjetas/?{consulta}')
+
+
+class SolicitarTarjetasLoteApiTests(TestCase):
+
+    def test_emite_una_tarjeta_por_item_valido(self):
+        for username in ('ana', 'beto'):
+            User.objects.create_user(username=username)
+
+        respuesta = self.client.post(
+            reverse('tarjeta_credito:solicitar_tarjetas_lote_api'),
+            json.dumps({'tarjetas': [
+                {'username': 'ana'},
+                {'username': 'nadie'},
+                {'username': 'beto', 'marca': 'CREDICARD', 'limite_credito': 20000},
+                {'username': 'ana', 'marca': 'VISA'},
+            ]}),
+            content_type='application/json',
+        )
+
+        datos = respuesta.json()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([r['success'] for r in datos['resultados']], [True, False, True, False])
+        tarjetas = list(TarjetaCredito.objects.order_by('pk'))
+        self.assertEqual([t.usuario.username for t in tarjetas], ['ana', 'beto'])
+        self.assertIn(tarjetas[1].numero_tarjeta[:6], ('636368', '636297'))
+        self.assertEqual(tarjetas[1].credito_disponible, Decimal('20000.00'))
+        for tarjeta in tarjetas:
+            self.assertEqual(digito_luhn(tarjeta.numero_tarjeta[:-1]), int(tarjeta.numero_tarjeta[-1]))
+            self.assertEqual(TarjetaCredito.buscar_por_datos(
+                tarjeta.ultimos_4_digitos, tarjeta.cvc, tarjeta.fecha_vencimiento
+            ).get(), tarjeta)
+
+    def test_saltea_los_numeros_de_tarjetas_anteriores_a_la_secuencia(self):
+        siguiente = SecuenciaIdentificador.objects.get(nombre='numero_tarjeta').siguiente
+        anterior = TarjetaCredito.objects.create(
+            usuario=User.objects.create_user(username='ana'), numero_tarjeta=formatear_numero_tarjeta('627170', siguiente)
+        )
+
+        self.assertEqual(numeros_tarjeta_en_uso([siguiente, siguiente + 1]), {siguiente})
+        emitidas = emitir_tarjetas([(anterior.usuario_id, 'CABAL', Decimal('1000'))] * 3)
+
+        numeros = [int(tarjeta.numero_tarjeta[6:-1]) for tarjeta in emitidas]
+        self.assertEqual(numeros, [siguiente + 1, siguiente + 2, siguiente + 3])
+        for tarjeta in emitidas:
+            self.assertIn(tarjeta.numero_tarjeta[:6], ('627170', '589657'))
+            self.assertEqual(digito_luhn(tarjeta.numero_tarjeta[:-1]), int(tarjeta.numero_tarjeta[-1]))
+
+    def test_un_error_interno_responde_500_en_json(self):
+        User.objects.create_user(username='ana')
+
+        with mock.patch.object(views, 'emitir_tarjetas', side_effect=OperationalError('database is locked')):
+            respuesta = self.client.post(
+                reverse('tarjeta_credito:solicitar_tarjetas_lote_api'),
+                json.dumps({'tarjetas': [{'username': 'ana'}]}), content_type='application/json',
+            )
+
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertFalse(respuesta.json()['success'])
+
+
+class EstadoEfectivoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='titular', password='clave')
+        self.tarjeta = TarjetaCredito.objects.create(usuario=self.usuario)
+        TarjetaCredito.objects.filter(pk=self.tarjeta.pk).update(
+            fecha_vencimiento=timezone.localdate() - timedelta(days=1)
+        )
+        self.tarjeta.refresh_from_db()
+
+    def test_las_lecturas_muestran_vencida_sin_escribir(self):
+        self.client.force_login(self.usuario)
+        url = reverse('tarjeta_credito:consultar_tarjeta_api', args=[self.tarjeta.pk])
+
+        respuesta = self.client.get(url)
+        detalle = self.client.get(reverse('tarjeta_credito:detalle_tarjeta', args=[self.tarjeta.pk]))
+        listado = self.client.get(reverse('tarjeta_credito:mis_tarjetas'))
+
+        self.assertEqual(respuesta.json()['tarjeta']['estado'], 'VENCIDA')
+        self.assertContains(detalle, 'Vencida')
+        self.assertContains(listado, 'Vencida')
+        self.tarjeta.refresh_from_db()
+        self.assertEqual(self.tarjeta.estado, 'ACTIVA')
+
+    def test_no_se_retiene_credito_de_una_tarjeta_vencida(self):
+        self.assertFalse(self.tarjeta.retener_credito(Decimal('10.00')))
+
+    def test_el_comando_marca_las_vencidas_en_un_update(self):
+        vigente = TarjetaCredito.objects.create(usuario=User.objects.create_user(username='otro'))
+
+        with self.assertNumQueries(1):
+            call_command('expire_cards', stdout=StringIO())
+
+        self.tarjeta.refresh_from_db()
+        vigente.refresh_from_db()
+        self.assertEqual((self.tarjeta.estado, vigente.estado), ('VENCIDA', 'ACTIVA'))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -13,13 +14,21 @@ urlpatterns = [
 
     # API endpoints
     path('api/solicitar/', views.solicitar_tarjeta_api, name='solicitar_tarjeta_api'),
-    path('api/consultar/<int:tarjeta_id>/', views.consultar_tarjeta_api, name='consultar_tarjeta_api'),
+    path('api/solicitar-lote/', views.solicitar_tarjetas_lote_api, name='solicitar_tarjetas_lote_api'),
+    path('api/consultar/<int:tarjeta_id>/',
+         views.consultar_tarjeta_api_async if settings.API_ASINCRONA else views.consultar_tarjeta_api,
+         name='consultar_tarjeta_api'),
     path('api/consultar-numero/<str:numero_tarjeta>/', views.consultar_tarjeta_por_numero_api, name='consultar_tarjeta_por_numero_api'),
     path('api/consultar-datos/', views.consultar_tarjeta_por_datos_api, name='consultar_tarjeta_por_datos_api'),
-    path('api/tarjetas/', views.listar_tarjetas_usuario_api, name='listar_tarjetas_usuario_api'),
+    path('api/tarjetas/',
+         views.listar_tarjetas_usuario_api_async if settings.API_ASINCRONA else views.listar_tarjetas_usuario_api,
+         name='listar_tarjetas_usuario_api'),
     
     # Endpoints para pagos y cobros
     path('pagar/', views.pagar_con_tarjeta, name='pagar_con_tarjeta'),
     path('cobrar/', views.cobrar_transaccion, name='cobrar_transaccion'),
-    path('transaccion/<uuid:id_transaccion>/', views.consultar_transaccion, name='consultar_transaccion'),
+    path('cobrar-lote/', views.cobrar_lote_api, name='cobrar_lote_api'),
+    path('transaccion/<uuid:id_transaccion>/',
+         views.consultar_transaccion_async if settings.API_ASINCRONA else views.consultar_transaccion,
+         name='consultar_transaccion'),
 ]
@@ -19,8 +19,19 @@ from decimal import Decimal
 import json
 import uuid
 from django.contrib.auth.models import User
+from asgiref.sync import sync_to_async
 
+from cuenta.directorio import directorio
+from .emision import emitir_tarjetas
+from .lotes import cobrar_lote, pendientes_de_cuenta
 from .models import TarjetaCredito, TransaccionTarjeta
+from .serializadores import TARJETA_DETALLE, TARJETA_IDENTIFICADOR, TARJETA_POR_DATOS, TRANSACCION
+from nucleo.cache_http import cache_estado_final, marcar_final
+from nucleo.idempotencia import idempotente
+from nucleo.metricas import RETENCIONES_TARJETA
+
+LOTE_MAXIMO_COBROS = 5000
+LOTE_MAXIMO_EMISION = 5000
 
 
 @login_required
@@ -76,11 +87,8 @@ def solicitar_tarjeta_view(request):
 @login_required
 def mis_tarjetas_view(request):
     """Vista para listar las tarjetas del usuario"""
-    tarjetas = TarjetaCredito.objects.filter(usuario=request.user)
-
-    # Actualizar estados de tarjetas vencidas
-    for tarjeta in tarjetas:
-        tarjeta.actualizar_estado_si_vencida()
+    # El estado vencido se calcula en la consulta: la lectura no escribe
+    tarjetas = TarjetaCredito.objects.con_estado_efectivo().filter(usuario=request.user)
 
     context = {
         'tarjetas': tarjetas
@@ -91,8 +99,7 @@ def mis_tarjetas_view(request):
 @login_required
 def detalle_tarjeta_view(request, tarjeta_id):
     """Vista para ver el detalle de una tarjeta específica"""
-    tarjeta = get_object_or_404(TarjetaCredito, id=tarjeta_id, usuario=request.user)
-    tarjeta.actualizar_estado_si_vencida()
+    tarjeta = get_object_or_404(TarjetaCredito.objects.con_estado_efectivo(), id=tarjeta_id, usuario=request.user)
 
     context = {
         'tarjeta': tarjeta
@@ -161,9 +168,8 @@ def solicitar_tarjeta_api(request):
         }, status=400)
 
     # Buscar usuario destino
-    try:
-        usuario = User.objects.get(username=username)
-    except User.DoesNotExist:
+    entrada = directorio.buscar(username)
+    if entrada is None:
         return JsonResponse({
             'success': False, 'error': 'Usuario no encontrado',
             'message': f'No existe un usuario con username: {username}'
@@ -196,7 +202,7 @@ def solicitar_tarjeta_api(request):
 
     # Crear tarjeta
     nueva_tarjeta = TarjetaCredito.objects.create(
-        usuario=usuario, marca=marca,
+        usuario_id=entrada.usuario_id, marca=marca,
         limite_credito=limite_decimal, credito_disponible=limite_decimal
     )
 
@@ -215,57 +221,155 @@ def solicitar_tarjeta_api(request):
             'limite_credito': str(nueva_tarjeta.limite_credito),
             'credito_disponible': str(nueva_tarjeta.credito_disponible),
             'fecha_creacion': nueva_tarjeta.fecha_creacion.isoformat(),
-            'usuario': usuario.username
+            'usuario': entrada.username
         }
     }, status=201)
 
 
-@require_http_methods(["GET"])
-def consultar_tarjeta_api(request, tarjeta_id):
+def _validar_solicitud_lote(item, usuarios):
+    """Retorna (error, mensaje) si la solicitud del lote no es válida, o None"""
+    if not isinstance(item, dict):
+        return 'Formato inválido', 'Cada solicitud debe ser un objeto JSON'
+    username = str(item.get('username') or '').strip()
+    if not username:
+        return 'username requerido', 'Debe indicar el username del titular de la tarjeta'
+    if username not in usuarios:
+        return 'Usuario no encontrado', f'No existe un usuario con username: {username}'
+    marcas_validas = [choice[0] for choice in TarjetaCredito.MARCA_CHOICES]
+    if item.get('marca', 'CABAL') not in marcas_validas:
+        return 'Marca inválida', f'Las marcas válidas son: {", ".join(marcas_validas)}'
+    try:
+        limite = Decimal(str(item.get('limite_credito', 2000000)))
+    except (ArithmeticError, ValueError, TypeError):
+        return 'Límite inválido', 'El formato del límite de crédito es incorrecto'
+    if not limite.is_finite() or limite < 10000 or limite > 999999999999:
+        return 'Límite inválido', 'El límite de crédito debe estar entre $10,000 y $999,999,999,999'
+    return None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotente('tarjeta_credito.solicitar_lote')
+def solicitar_tarjetas_lote_api(request):
     """
-    API para consultar los datos de una tarjeta de crédito
+    API para emitir varias tarjetas en una sola petición (campañas de alta).
+    Recibe: tarjetas (lista de {username, marca, limite_credito})
+    Retorna: resultado por item, en el mismo orden del lote
     """
     try:
-        # En un sistema real verificarías la autenticación y autorización
-        tarjeta = TarjetaCredito.objects.get(id=tarjeta_id)
-        tarjeta.actualizar_estado_si_vencida()
+        data = json.loads(request.body or "{}")
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False, 'error': 'Formato JSON inválido',
+            'message': 'El cuerpo de la petición debe ser un JSON válido'
+        }, status=400)
 
-        # Preparar datos de respuesta (sin mostrar datos sensibles)
-        data = {
+    items = data.get('tarjetas') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse({
+            'success': False, 'error': 'Parámetros faltantes',
+            'message': 'Se requiere una lista no vacía en "tarjetas"'
+        }, status=400)
+    if len(items) > LOTE_MAXIMO_EMISION:
+        return JsonResponse({
+            'success': False, 'error': 'Lote demasiado grande',
+            'message': f'El lote admite hasta {LOTE_MAXIMO_EMISION} tarjetas'
+        }, status=400)
+
+    try:
+        resultados, emitidas = _emitir_lote(items)
+    except Exception as e:
+        return _error_interno_tarjeta(e)
+
+    return JsonResponse({
+        'success': emitidas == len(items),
+        'total': len(items),
+        'emitidas': emitidas,
+        'fallidas': len(items) - emitidas,
+        'resultados': resultados
+    }, status=200)
+
+
+def _emitir_lote(items):
+    """Emite las tarjetas de los items válidos; retorna (resultados por item, cantidad emitida)"""
+    # Resolver todos los usuarios del lote con una sola consulta
+    usernames = {str(item.get('username') or '').strip() for item in items if isinstance(item, dict)}
+    usuarios = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    resultados = [None] * len(items)
+    validas, solicitudes = [], []
+    for indice, item in enumerate(items):
+        error = _validar_solicitud_lote(item, usuarios)
+        if error:
+            resultados[indice] = {'indice': indice, 'success': False, 'error': error[0], 'message': error[1]}
+            continue
+        username = str(item['username']).strip()
+        validas.append((indice, username))
+        solicitudes.append((
+            usuarios[username], item.get('marca', 'CABAL'), Decimal(str(item.get('limite_credito', 2000000)))
+        ))
+
+    for (indice, username), tarjeta in zip(validas, emitir_tarjetas(solicitudes)):
+        resultados[indice] = {
+            'indice': indice,
             'success': True,
             'tarjeta': {
                 'id': tarjeta.id,
-                'numero_enmascarado': tarjeta.numero_enmascarado,
+                'identificador_unico': str(tarjeta.identificador_unico),
+                'numero_tarjeta': tarjeta.numero_tarjeta,
                 'marca': tarjeta.marca,
-                'marca_display': tarjeta.get_marca_display(),
                 'ultimos_4_digitos': tarjeta.ultimos_4_digitos,
                 'fecha_vencimiento': tarjeta.fecha_vencimiento.isoformat(),
                 'estado': tarjeta.estado,
-                'estado_display': tarjeta.get_estado_display(),
                 'limite_credito': str(tarjeta.limite_credito),
                 'credito_disponible': str(tarjeta.credito_disponible),
-                'credito_utilizado': str(tarjeta.credito_utilizado),
-                'esta_vencida': tarjeta.esta_vencida,
-                'fecha_creacion': tarjeta.fecha_creacion.isoformat(),
-                'usuario': tarjeta.usuario.username
+                'usuario': username
             }
         }
 
-        return JsonResponse(data, status=200)
+    return resultados, len(validas)
 
-    except TarjetaCredito.DoesNotExist:
+
+@require_http_methods(["GET"])
+def consultar_tarjeta_api(request, tarjeta_id):
+    """
+    API para consultar los datos de una tarjeta de crédito
+    """
+    try:
+        # En un sistema real verificarías la autenticación y autorización
+        # Solo las columnas de la respuesta (sin datos sensibles)
+        tarjeta = TARJETA_DETALLE.primera(TarjetaCredito.objects.filter(id=tarjeta_id))
+    except Exception as e:
+        return _error_interno_tarjeta(e)
+    return _respuesta_consulta_tarjeta(tarjeta_id, tarjeta)
+
+
+@require_http_methods(["GET"])
+async def consultar_tarjeta_api_async(request, tarjeta_id):
+    """consultar_tarjeta_api con el ORM asíncrono (API_ASINCRONA)"""
+    try:
+        tarjeta = await TARJETA_DETALLE.aprimera(TarjetaCredito.objects.filter(id=tarjeta_id))
+    except Exception as e:
+        return _error_interno_tarjeta(e)
+    return _respuesta_consulta_tarjeta(tarjeta_id, tarjeta)
+
+
+def _respuesta_consulta_tarjeta(tarjeta_id, tarjeta):
+    if tarjeta is None:
         return JsonResponse({
             'success': False,
             'error': 'Tarjeta no encontrada',
             'message': f'No existe una tarjeta con el ID: {tarjeta_id}'
         }, status=404)
+    return JsonResponse({'success': True, 'tarjeta': tarjeta}, status=200)
 
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': 'Error interno del servidor',
-            'message': str(e)
-        }, status=500)
+
+def _error_interno_tarjeta(e):
+    return JsonResponse({
+        'success': False,
+        'error': 'Error interno del servidor',
+        'message': str(e)
+    }, status=500)
 
 
 @require_http_methods(["GET"])
@@ -276,22 +380,16 @@ def consultar_tarjeta_por_numero_api(request, numero_tarjeta):
     """
     try:
         # Buscar la tarjeta por número
-        tarjeta = TarjetaCredito.objects.get(numero_tarjeta=numero_tarjeta)
+        tarjeta = TARJETA_IDENTIFICADOR.primera(TarjetaCredito.objects.filter(numero_tarjeta=numero_tarjeta))
+        if tarjeta is None:
+            raise TarjetaCredito.DoesNotExist
 
         # Preparar datos de respuesta con identificador único
         data = {
             'success': True,
             'encontrada': True,
             'message': 'Tarjeta encontrada exitosamente',
-            'tarjeta': {
-                'identificador_unico': str(tarjeta.identificador_unico),
-                'numero_enmascarado': tarjeta.numero_enmascarado,
-                'marca': tarjeta.marca,
-                'marca_display': tarjeta.get_marca_display(),
-                'estado': tarjeta.estado,
-                'estado_display': tarjeta.get_estado_display(),
-                'usuario': tarjeta.usuario.username
-            }
+            'tarjeta': tarjeta
         }
 
         return JsonResponse(data, status=200)
@@ -369,35 +467,17 @@ def consultar_tarjeta_por_datos_api(request):
             }, status=400)
 
         # Buscar la tarjeta por los criterios especificados
-        tarjeta = TarjetaCredito.objects.filter(
-            ultimos_4_digitos=ultimos_4_digitos,
-            cvc=cvc,
-            fecha_vencimiento=fecha_vencimiento
-        ).first()
+        tarjeta = TARJETA_POR_DATOS.primera(
+            TarjetaCredito.objects.por_datos(ultimos_4_digitos, cvc, fecha_vencimiento)
+        )
 
         if tarjeta:
-            # Actualizar estado si está vencida
-            tarjeta.actualizar_estado_si_vencida()
-
             # Preparar datos de respuesta completos
             data = {
                 'success': True,
                 'encontrada': True,
                 'message': 'Tarjeta encontrada exitosamente',
-                'tarjeta': {
-                    'identificador_unico': str(tarjeta.identificador_unico),
-                    'numero_enmascarado': tarjeta.numero_enmascarado,
-                    'ultimos_4_digitos': tarjeta.ultimos_4_digitos,
-                    'marca': tarjeta.marca,
-                    'marca_display': tarjeta.get_marca_display(),
-                    'fecha_vencimiento': tarjeta.fecha_vencimiento.isoformat(),
-                    'estado': tarjeta.estado,
-                    'estado_display': tarjeta.get_estado_display(),
-                    'limite_credito': float(tarjeta.limite_credito),
-                    'credito_disponible': float(tarjeta.credito_disponible),
-                    'fecha_creacion': tarjeta.fecha_creacion.isoformat(),
-                    'usuario': tarjeta.usuario.username
-                }
+                'tarjeta': tarjeta
             }
 
             return JsonResponse(data, status=200)
@@ -429,10 +509,11 @@ def consultar_tarjeta_por_datos_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotente('tarjeta_credito.pagar')
 def pagar_con_tarjeta(request):
     """
     Endpoint para realizar un pago con tarjeta de crédito.
-    Recibe: id_tarjeta, monto
+    Recibe: id_tarjeta, monto, numero_cuenta_destino (opcional, cuenta del comercio)
     Retorna: éxito/error, datos de la tarjeta, id de transacción
     """
     try:
@@ -440,6 +521,7 @@ def pagar_con_tarjeta(request):
         id_tarjeta = data.get('id_tarjeta')
         monto = data.get('monto')
         descripcion = data.get('descripcion', '')
+        numero_cuenta_destino = data.get('numero_cuenta_destino') or None
 
         # Validaciones básicas
         if not id_tarjeta:
@@ -473,7 +555,9 @@ def pagar_con_tarjeta(request):
 
         # Buscar la tarjeta
         try:
-            tarjeta = TarjetaCredito.objects.get(identificador_unico=id_tarjeta, estado='ACTIVA')
+            tarjeta = TarjetaCredito.objects.get(
+                identificador_unico=id_tarjeta, estado='ACTIVA', fecha_vencimiento__gte=timezone.localdate()
+            )
         except TarjetaCredito.DoesNotExist:
             return JsonResponse({
                 'success': False,
@@ -481,8 +565,9 @@ def pagar_con_tarjeta(request):
                 'message': 'La tarjeta especificada no existe o está inactiva'
             }, status=404)
 
-        # Validar saldo disponible
+        # Validar saldo disponible con lo ya leído: el rechazo no cuesta otra consulta
         if tarjeta.credito_disponible < monto_decimal:
+            RETENCIONES_TARJETA.inc('rechazada', 'credito_insuficiente')
             return JsonResponse({
                 'success': False,
                 'error': 'Saldo insuficiente',
@@ -490,20 +575,26 @@ def pagar_con_tarjeta(request):
                 'saldo_disponible': float(tarjeta.credito_disponible)
             }, status=400)
 
-        # Crear transacción y actualizar saldo
+        # Retener el crédito (UPDATE condicional) y crear la transacción
         with transaction.atomic():
-            # Crear la transacción
+            if not tarjeta.retener_credito(monto_decimal):
+                # Otro pago simultáneo consumió el crédito (o la tarjeta dejó de estar activa)
+                RETENCIONES_TARJETA.inc('rechazada', 'credito_insuficiente')
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Saldo insuficiente',
+                    'message': f'El crédito disponible ya no alcanza para el monto solicitado: ${monto_decimal}'
+                }, status=400)
+
             nueva_transaccion = TransaccionTarjeta.objects.create(
                 tarjeta=tarjeta,
                 monto=monto_decimal,
                 descripcion=descripcion,
+                numero_cuenta_destino=numero_cuenta_destino,
                 estado='pendiente'
             )
 
-            # Actualizar saldo disponible
-            tarjeta.credito_disponible -= monto_decimal
-            tarjeta.save()
-
+        RETENCIONES_TARJETA.inc('aprobada', 'ninguno')
         return JsonResponse({
             'success': True,
             'message': 'Pago realizado exitosamente',
@@ -520,7 +611,8 @@ def pagar_con_tarjeta(request):
                     'monto': float(monto_decimal),
                     'fecha': nueva_transaccion.fecha_pago.isoformat(),
                     'estado': nueva_transaccion.estado,
-                    'descripcion': descripcion
+                    'descripcion': descripcion,
+                    'numero_cuenta_destino': numero_cuenta_destino
                 }
             }
         }, status=201)
@@ -542,6 +634,7 @@ def pagar_con_tarjeta(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotente('tarjeta_credito.cobrar')
 def cobrar_transaccion(request):
     """
     Endpoint para cobrar una transacción pendiente.
@@ -570,7 +663,7 @@ def cobrar_transaccion(request):
 
         # Buscar la transacción
         try:
-            transaccion = TransaccionTarjeta.objects.get(id_transaccion=id_transaccion)
+            transaccion = TransaccionTarjeta.objects.select_related('tarjeta').get(id_transaccion=id_transaccion)
         except TransaccionTarjeta.DoesNotExist:
             return JsonResponse({
                 'success': False,
@@ -578,14 +671,12 @@ def cobrar_transaccion(request):
                 'message': 'La transacción especificada no existe'
             }, status=404)
 
-        # Validar que la transacción esté pendiente
+        # Validar que la transacción esté pendiente (o ya cobrada en esta misma cuenta)
         if transaccion.estado != 'pendiente':
-            return JsonResponse({
-                'success': False,
-                'error': 'Transacción no válida',
-                'message': f'La transacción ya está en estado: {transaccion.estado}',
-                'estado_actual': transaccion.estado
-            }, status=400)
+            return _respuesta_ya_cobrada(transaccion, numero_cuenta_destino)
+
+        if transaccion.registrada_para_otra_cuenta(numero_cuenta_destino):
+            return _respuesta_otra_cuenta()
 
         # Validar que la cuenta destino exista
         try:
@@ -596,36 +687,17 @@ def cobrar_transaccion(request):
                 'error': 'Cuenta destino no encontrada',
                 'message': 'La cuenta destino especificada no existe o está inactiva'
             }, status=404)
-        
-        # Actualizar la transacción
-        with transaction.atomic():
-            transaccion.estado = 'cobrada'
-            transaccion.fecha_cobro = timezone.now()
-            transaccion.numero_cuenta_destino = numero_cuenta_destino
-            transaccion.save()
 
-            # Acreditar a cuenta destino
-            cuenta_destino.saldo_disponible += transaccion.monto
-            cuenta_destino.save()
+        # Cobrar: de varias llamadas simultáneas solo una pasa de pendiente a cobrada
+        if not transaccion.cobrar(cuenta_destino):
+            if transaccion.estado == 'pendiente':
+                return _respuesta_otra_cuenta()
+            return _respuesta_ya_cobrada(transaccion, numero_cuenta_destino)
 
         return JsonResponse({
             'success': True,
             'message': 'Transacción cobrada exitosamente',
-            'data': {
-                'transaccion': {
-                    'id': str(transaccion.id_transaccion),
-                    'monto': float(transaccion.monto),
-                    'estado': transaccion.estado,
-                    'fecha_pago': transaccion.fecha_pago.isoformat(),
-                    'fecha_cobro': transaccion.fecha_cobro.isoformat() if transaccion.fecha_cobro else None,
-                    'numero_cuenta_destino': transaccion.numero_cuenta_destino,
-                    'descripcion': transaccion.descripcion
-                },
-                'tarjeta': {
-                    'marca': transaccion.tarjeta.marca,
-                    'ultimos_4_digitos': transaccion.tarjeta.ultimos_4_digitos
-                }
-            }
+            'data': _datos_cobro(transaccion)
         }, status=200)
 
     except json.JSONDecodeError:
@@ -643,90 +715,270 @@ def cobrar_transaccion(request):
         }, status=500)
 
 
-@require_http_methods(["GET"])
-def consultar_transaccion(request, id_transaccion):
+def _datos_cobro(transaccion):
+    return {
+        'transaccion': {
+            'id': str(transaccion.id_transaccion),
+            'monto': float(transaccion.monto),
+            'estado': transaccion.estado,
+            'fecha_pago': transaccion.fecha_pago.isoformat(),
+            'fecha_cobro': transaccion.fecha_cobro.isoformat() if transaccion.fecha_cobro else None,
+            'numero_cuenta_destino': transaccion.numero_cuenta_destino,
+            'descripcion': transaccion.descripcion
+        },
+        'tarjeta': {
+            'marca': transaccion.tarjeta.marca,
+            'ultimos_4_digitos': transaccion.tarjeta.ultimos_4_digitos
+        }
+    }
+
+
+def _respuesta_ya_cobrada(transaccion, numero_cuenta_destino):
     """
-    Endpoint para consultar el estado de una transacción.
+    Respuesta para quien no ganó el cobro: si la transacción ya se cobró en
+    la misma cuenta se devuelve ese resultado; si no, el error de estado.
+    """
+    if transaccion.estado == 'cobrada' and transaccion.numero_cuenta_destino == numero_cuenta_destino:
+        return JsonResponse({
+            'success': True,
+            'message': 'La transacción ya había sido cobrada en esta cuenta',
+            'data': _datos_cobro(transaccion)
+        }, status=200)
+
+    return JsonResponse({
+        'success': False,
+        'error': 'Transacción no válida',
+        'message': f'La transacción ya está en estado: {transaccion.estado}',
+        'estado_actual': transaccion.estado
+    }, status=400)
+
+
+def _respuesta_otra_cuenta():
+    return JsonResponse({
+        'success': False,
+        'error': 'Cuenta destino no válida',
+        'message': 'La transacción está registrada para otra cuenta destino'
+    }, status=400)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotente('tarjeta_credito.cobrar_lote')
+def cobrar_lote_api(request):
+    """
+    Endpoint para cobrar muchas transacciones en una sola petición.
+    Recibe: numero_cuenta_destino y ids (lista de id_transaccion); sin ids se
+    cobran todas las pendientes registradas para esa cuenta. También acepta
+    transacciones (lista de {id_transaccion, numero_cuenta_destino}).
+    Retorna: resultado por item, en el mismo orden del lote
     """
     try:
-        transaccion = TransaccionTarjeta.objects.get(id_transaccion=id_transaccion)
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            data = {}
+        numero_cuenta_destino = data.get('numero_cuenta_destino')
+        transacciones = data.get('transacciones')
+        ids = data.get('ids')
+        hay_mas = False
 
-        data = {
-            'success': True,
-            'data': {
-                'transaccion': {
-                    'id': str(transaccion.id_transaccion),
-                    'monto': float(transaccion.monto),
-                    'estado': transaccion.estado,
-                    'fecha_pago': transaccion.fecha_pago.isoformat(),
-                    'fecha_cobro': transaccion.fecha_cobro.isoformat() if transaccion.fecha_cobro else None,
-                    'numero_cuenta_destino': transaccion.numero_cuenta_destino,
-                    'descripcion': transaccion.descripcion
-                },
-                'tarjeta': {
-                    'marca': transaccion.tarjeta.marca,
-                    'ultimos_4_digitos': transaccion.tarjeta.ultimos_4_digitos
-                }
-            }
-        }
+        if transacciones is not None:
+            if not isinstance(transacciones, list) or not all(isinstance(item, dict) for item in transacciones):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Parámetros inválidos',
+                    'message': '"transacciones" debe ser una lista de {id_transaccion, numero_cuenta_destino}'
+                }, status=400)
+            items = [
+                (item.get('id_transaccion'), item.get('numero_cuenta_destino') or numero_cuenta_destino)
+                for item in transacciones
+            ]
+        elif not numero_cuenta_destino:
+            return JsonResponse({
+                'success': False,
+                'error': 'Número de cuenta requerido',
+                'message': 'Debe proporcionar el número de cuenta destino'
+            }, status=400)
+        elif ids is not None:
+            if not isinstance(ids, list):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Parámetros inválidos',
+                    'message': '"ids" debe ser una lista de id_transaccion'
+                }, status=400)
+            items = [(id_transaccion, numero_cuenta_destino) for id_transaccion in ids]
+        else:
+            pendientes = pendientes_de_cuenta(numero_cuenta_destino, limite=LOTE_MAXIMO_COBROS + 1)
+            hay_mas = len(pendientes) > LOTE_MAXIMO_COBROS
+            items = [(id_transaccion, numero_cuenta_destino) for id_transaccion in pendientes[:LOTE_MAXIMO_COBROS]]
 
-        return JsonResponse(data, status=200)
+        if len(items) > LOTE_MAXIMO_COBROS:
+            return JsonResponse({
+                'success': False,
+                'error': 'Lote demasiado grande',
+                'message': f'El lote admite hasta {LOTE_MAXIMO_COBROS} transacciones'
+            }, status=400)
+
+        resultados = cobrar_lote(items)
+        cobradas = sum(1 for resultado in resultados if resultado['success'])
+        total = sum(
+            (resultado['monto'] for resultado in resultados if resultado['success'] and not resultado.get('ya_cobrada')),
+            Decimal('0')
+        )
+        for indice, resultado in enumerate(resultados):
+            resultado['indice'] = indice
+            if 'monto' in resultado:
+                resultado['monto'] = str(resultado['monto'])
 
-    except TransaccionTarjeta.DoesNotExist:
+        return JsonResponse({
+            'success': cobradas == len(items),
+            'total': len(items),
+            'cobradas': cobradas,
+            'fallidas': len(items) - cobradas,
+            'monto_acreditado': str(total),
+            'hay_mas': hay_mas,
+            'resultados': resultados
+        }, status=200)
+
+    except json.JSONDecodeError:
         return JsonResponse({
             'success': False,
-            'error': 'Transacción no encontrada',
-            'message': 'La transacción especificada no existe'
-        }, status=404)
+            'error': 'JSON inválido',
+            'message': 'El formato de los datos enviados es incorrecto'
+        }, status=400)
 
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': 'Error interno',
-            'message': 'Ocurrió un error al consultar la transacción'
+            'message': 'Ocurrió un error al procesar el cobro'
         }, status=500)
 
+
 @require_http_methods(["GET"])
-def listar_tarjetas_usuario_api(request):
-    username = (request.GET.get('username') or '').strip()
-    if not username:
-        return JsonResponse({
-            'success': False,
-            'error': 'username requerido',
-            'message': 'Debe indicar ?username='
-        }, status=400)
+@cache_estado_final('tarjeta_credito.consultar', 'id_transaccion')
+def consultar_transaccion(request, id_transaccion):
+    """
+    Endpoint para consultar el estado de una transacción.
+    Responde con ETag; las transacciones cobradas o canceladas se cachean.
+    """
+    try:
+        transaccion = TRANSACCION.primera(TransaccionTarjeta.objects.filter(id_transaccion=id_transaccion))
+    except Exception:
+        return _error_consulta_transaccion()
+    return _respuesta_consulta_transaccion(transaccion)
+
 
+@require_http_methods(["GET"])
+@cache_estado_final('tarjeta_credito.consultar', 'id_transaccion')
+async def consultar_transaccion_async(request, id_transaccion):
+    """consultar_transaccion con el ORM asíncrono (API_ASINCRONA)"""
     try:
-        user = User.objects.get(username=username)
-    except User.DoesNotExist:
+        transaccion = await TRANSACCION.aprimera(TransaccionTarjeta.objects.filter(id_transaccion=id_transaccion))
+    except Exception:
+        return _error_consulta_transaccion()
+    return _respuesta_consulta_transaccion(transaccion)
+
+
+def _respuesta_consulta_transaccion(transaccion):
+    if transaccion is None:
         return JsonResponse({
             'success': False,
-            'error': 'Usuario no encontrado',
-            'message': f'No existe un usuario con username: {username}'
+            'error': 'Transacción no encontrada',
+            'message': 'La transacción especificada no existe'
         }, status=404)
 
-    tarjetas = TarjetaCredito.objects.filter(usuario=user).order_by('-fecha_creacion')
+    respuesta = JsonResponse({'success': True, 'data': transaccion}, status=200)
+    if transaccion['transaccion']['estado'] in ('cobrada', 'cancelada'):
+        marcar_final(respuesta)
+    return respuesta
 
-    resultados = []
-    for t in tarjetas:
-        # Actualizar estado si está vencida (si tu modelo lo soporta)
-        try:
-            t.actualizar_estado_si_vencida()
-        except Exception:
-            pass
 
+def _error_consulta_transaccion():
+    return JsonResponse({
+        'success': False,
+        'error': 'Error interno',
+        'message': 'Ocurrió un error al consultar la transacción'
+    }, status=500)
+
+@require_http_methods(["GET"])
+def listar_tarjetas_usuario_api(request):
+    username = (request.GET.get('username') or '').strip()
+    if not username:
+        return _falta_username()
+
+    entrada = directorio.buscar(username)
+    if entrada is None:
+        return _usuario_no_encontrado(username)
+
+    # Los datos fijos salen del directorio; límite y crédito se leen siempre de la base
+    creditos = {pk: (limite, disponible) for pk, limite, disponible in _creditos_de(entrada)}
+    if set(creditos) != {t.id for t in entrada.tarjetas}:
+        # Otro proceso emitió o eliminó tarjetas: se relee la entrada
+        directorio.invalidar(usuario_ids=[entrada.usuario_id])
+        entrada = directorio.buscar(username) or entrada
+
+    return _respuesta_tarjetas_usuario(entrada, creditos)
+
+
+@require_http_methods(["GET"])
+async def listar_tarjetas_usuario_api_async(request):
+    """listar_tarjetas_usuario_api con el ORM asíncrono (API_ASINCRONA)"""
+    username = (request.GET.get('username') or '').strip()
+    if not username:
+        return _falta_username()
+
+    entrada = await directorio.abuscar(username)
+    if entrada is None:
+        return _usuario_no_encontrado(username)
+
+    creditos = {pk: (limite, disponible) async for pk, limite, disponible in _creditos_de(entrada)}
+    if set(creditos) != {t.id for t in entrada.tarjetas}:
+        await sync_to_async(directorio.invalidar)(usuario_ids=[entrada.usuario_id])
+        entrada = await directorio.abuscar(username) or entrada
+
+    return _respuesta_tarjetas_usuario(entrada, creditos)
+
+
+def _creditos_de(entrada):
+    return TarjetaCredito.objects.filter(usuario_id=entrada.usuario_id).values_list(
+        'pk', 'limite_credito', 'credito_disponible'
+    )
+
+
+def _falta_username():
+    return JsonResponse({
+        'success': False,
+        'error': 'username requerido',
+        'message': 'Debe indicar ?username='
+    }, status=400)
+
+
+def _usuario_no_encontrado(username):
+    return JsonResponse({
+        'success': False,
+        'error': 'Usuario no encontrado',
+        'message': f'No existe un usuario con username: {username}'
+    }, status=404)
+
+
+def _respuesta_tarjetas_usuario(entrada, creditos):
+    resultados = []
+    for t in entrada.tarjetas:
+        if t.id not in creditos:
+            continue
+        limite, disponible = creditos[t.id]
         resultados.append({
-            'identificador_unico': str(getattr(t, 'identificador_unico', t.id)),
+            'identificador_unico': str(t.identificador_unico),
             'numero_tarjeta': t.numero_tarjeta,
             'marca': t.marca,
             'fecha_vencimiento': t.fecha_vencimiento.isoformat(),
-            'limite_credito': float(t.limite_credito),
-            'credito_disponible': float(t.credito_disponible),
+            'limite_credito': float(limite),
+            'credito_disponible': float(disponible),
         })
 
     return JsonResponse({
         'success': True,
-        'usuario': user.username,
+        'usuario': entrada.username,
         'count': len(resultados),
         'results': resultados
-    }, status=200)
\ No newline at end of file
+    }, status=200)
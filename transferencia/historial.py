@@ -0,0 +1,53 @@
+"""
+Historial de transferencias de una cuenta, por páginas.
+
+Cada página se obtiene con una cantidad fija de consultas: las cuentas
+origen/destino y sus usuarios vienen en la misma consulta (select_related),
+así las plantillas pueden mostrar la contraparte sin consultas por fila.
+"""
+from django.core.paginator import Paginator
+
+from .models import Transferencia
+
+TAMANO_PAGINA = 50
+RELACIONADAS = ('cuenta_origen__usuario', 'cuenta_destino__usuario')
+
+
+def enviadas(cuenta):
+    return Transferencia.objects.filter(cuenta_origen=cuenta).select_related(*RELACIONADAS)
+
+
+def recibidas(cuenta):
+    return Transferencia.objects.filter(cuenta_destino=cuenta).select_related(*RELACIONADAS)
+
+
+def todas(cuenta):
+    """
+    Enviadas y recibidas, de la más nueva a la más vieja. UNION ALL en lugar
+    de OR: cada mitad recorre su índice (cuenta, -fecha_creacion) ya ordenado
+    y la base las mezcla sin ordenar todo el historial.
+    """
+    return enviadas(cuenta).order_by().union(recibidas(cuenta).order_by(), all=True).order_by('-fecha_creacion')
+
+
+def ultimas(queryset, cantidad=5):
+    """Las `cantidad` transferencias más recientes de un queryset del historial"""
+    return list(queryset[:cantidad])
+
+
+def pagina(queryset, numero, tamano=TAMANO_PAGINA):
+    """Página `numero` (1 si no es válida) de un queryset del historial"""
+    return Paginator(queryset, tamano).get_page(numero)
+
+
+def con_contraparte(transferencias, cuenta):
+    """Agrega a cada transferencia si fue enviada por `cuenta` y la cuenta del otro lado"""
+    filas = []
+    for transferencia in transferencias:
+        es_enviada = transferencia.cuenta_origen_id == cuenta.id
+        filas.append({
+            'transferencia': transferencia,
+            'es_enviada': es_enviada,
+            'cuenta_relacionada': transferencia.cuenta_destino if es_enviada else transferencia.cuenta_origen,
+        })
+    return filas
@@ -0,0 +1,63 @@
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from nucleo.metricas import iniciar_publicador, publicar
+from transferencia.motor import ReclamoPerdido, SaldoInsuficiente, procesar_reclamadas, reclamar_en_cola
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa las transferencias encoladas (PENDIENTE con en_cola) por lotes. "
+        "Pueden ejecutarse varios procesos en paralelo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=500,
+                            help='Transferencias reclamadas por lote')
+        parser.add_argument('--intervalo', type=float, default=0.5,
+                            help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--vencimiento-reclamo', type=int, default=60,
+                            help='Segundos tras los cuales un reclamo abandonado puede retomarse')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Vaciar la cola y terminar en lugar de quedar esperando')
+
+    def handle(self, *args, **options):
+        trabajador = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        vencimiento = timedelta(seconds=options['vencimiento_reclamo'])
+        total_completadas = total_fallidas = 0
+
+        self.stdout.write(f"Worker {trabajador} procesando la cola de transferencias")
+        # Las transferencias completadas y fallidas acá se ven en /metrics
+        iniciar_publicador()
+        try:
+            while True:
+                try:
+                    reclamadas = reclamar_en_cola(trabajador, options['tamano_lote'], vencimiento)
+                    completadas, fallidas = procesar_reclamadas(reclamadas, trabajador)
+                except (SaldoInsuficiente, ReclamoPerdido, OperationalError) as e:
+                    # El lote se revirtió completo; se vuelve a reclamar y recalcular
+                    self.stderr.write(f"Lote reintentado: {e.__class__.__name__} {e}")
+                    time.sleep(options['intervalo'])
+                    continue
+
+                total_completadas += completadas
+                total_fallidas += fallidas
+                if reclamadas:
+                    self.stdout.write(f"Lote procesado: {completadas} completadas, {fallidas} fallidas")
+                    continue
+
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            publicar()
+
+        self.stdout.write(f"Total: {total_completadas} completadas, {total_fallidas} fallidas")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuenta', '0001_initial'),
+        ('transferencia', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transferencia',
+            name='en_cola',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='transferencia',
+            name='reclamada_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transferencia',
+            name='reclamada_por',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(condition=models.Q(('en_cola', True), ('estado', 'PENDIENTE')), fields=['id'], name='transferencia_en_cola_idx'),
+        ),
+    ]
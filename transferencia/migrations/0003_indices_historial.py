@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuenta', '0001_initial'),
+        ('transferencia', '0002_cola_asincrona'),
+    ]
+
+    operations = [
+        # Los índices compuestos se crean antes de eliminar los de las FK
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['cuenta_origen', '-fecha_creacion'], name='transf_origen_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['cuenta_destino', '-fecha_creacion'], name='transf_destino_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['cuenta_origen', '-id'], name='transf_origen_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['cuenta_destino', '-id'], name='transf_destino_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='transferencia',
+            name='cuenta_destino',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transferencias_recibidas', to='cuenta.cuenta'),
+        ),
+        migrations.AlterField(
+            model_name='transferencia',
+            name='cuenta_origen',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transferencias_enviadas', to='cuenta.cuenta'),
+        ),
+    ]
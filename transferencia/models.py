@@ -2,6 +2,11 @@ from django.db import models
 from django.contrib.auth.models import User
 from cuenta.models import Cuenta
 from django.core.validators import MinValueValidator
+from nucleo.identificadores import AsignadorIdentificadores, con_digito_luhn
+
+# Las referencias aleatorias anteriores tienen 8 caracteres y las nuevas 11:
+# no pueden coincidir, así que no hace falta descartar números en uso.
+asignador_referencias = AsignadorIdentificadores('referencia_transferencia')
 
 class Transferencia(models.Model):
     ESTADO_CHOICES = [
@@ -11,15 +16,19 @@ class Transferencia(models.Model):
         ('CANCELADA', 'Cancelada'),
     ]
 
+    # Sin índice propio: los índices compuestos de Meta.indexes empiezan por
+    # estas columnas y cubren también las búsquedas por la FK
     cuenta_origen = models.ForeignKey(
         Cuenta,
         on_delete=models.CASCADE,
-        related_name='transferencias_enviadas'
+        related_name='transferencias_enviadas',
+        db_index=False
     )
     cuenta_destino = models.ForeignKey(
         Cuenta,
         on_delete=models.CASCADE,
-        related_name='transferencias_recibidas'
+        related_name='transferencias_recibidas',
+        db_index=False
     )
     monto = models.DecimalField(
         max_digits=15,
@@ -32,6 +41,11 @@ class Transferencia(models.Model):
     fecha_procesamiento = models.DateTimeField(blank=True, null=True)
     referencia = models.CharField(max_length=50, unique=True, editable=False)
 
+    # Cola asíncrona: transferencias que procesa el comando process_transfers
+    en_cola = models.BooleanField(default=False)
+    reclamada_por = models.CharField(max_length=64, blank=True, null=True, editable=False)
+    reclamada_en = models.DateTimeField(blank=True, null=True, editable=False)
+
     def save(self, *args, **kwargs):
         if not self.referencia:
             self.referencia = self.generar_referencia()
@@ -39,49 +53,27 @@ class Transferencia(models.Model):
 
     def generar_referencia(self):
         """Genera una referencia única para la transferencia"""
-        import random
-        import string
+        return self.generar_referencias(1)[0]
+
+    @staticmethod
+    def generar_referencias(cantidad):
+        """Genera `cantidad` referencias únicas sin consultar la tabla de transferencias"""
         from datetime import datetime
 
         fecha = datetime.now().strftime("%Y%m%d")
-        codigo = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-        return f"TRF{fecha}{codigo}"
+        return [
+            f"TRF{fecha}{con_digito_luhn(f'{numero:010d}')}"
+            for numero in asignador_referencias.reservar(cantidad)
+        ]
 
     def procesar_transferencia(self):
         """Procesa la transferencia actualizando los saldos de las cuentas"""
-        from django.utils import timezone
-        from django.db import transaction
+        from .motor import ejecutar_transferencia
 
         if self.estado != 'PENDIENTE':
             return False, "La transferencia ya fue procesada"
 
-        if self.cuenta_origen.saldo_disponible < self.monto:
-            self.estado = 'FALLIDA'
-            self.fecha_procesamiento = timezone.now()
-            self.save()
-            return False, "Saldo insuficiente"
-
-        try:
-            with transaction.atomic():
-                # Debitar de cuenta origen
-                self.cuenta_origen.saldo_disponible -= self.monto
-                self.cuenta_origen.save()
-
-                # Acreditar a cuenta destino
-                self.cuenta_destino.saldo_disponible += self.monto
-                self.cuenta_destino.save()
-
-                # Actualizar estado de transferencia
-                self.estado = 'COMPLETADA'
-                self.fecha_procesamiento = timezone.now()
-                self.save()
-
-                return True, "Transferencia completada exitosamente"
-        except Exception as e:
-            self.estado = 'FALLIDA'
-            self.fecha_procesamiento = timezone.now()
-            self.save()
-            return False, f"Error al procesar la transferencia: {str(e)}"
+        return ejecutar_transferencia(self)
 
     def __str__(self):
         return f"{self.referencia} - {self.cuenta_origen} → {self.cuenta_destino} - ${self.monto}"
@@ -90,3 +82,15 @@ class Transferencia(models.Model):
         verbose_name = "Transferencia"
         verbose_name_plural = "Transferencias"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Historial por cuenta: vistas web (-fecha_creacion) y APIs (-id, cursor)
+            models.Index(fields=['cuenta_origen', '-fecha_creacion'], name='transf_origen_fecha_idx'),
+            models.Index(fields=['cuenta_destino', '-fecha_creacion'], name='transf_destino_fecha_idx'),
+            models.Index(fields=['cuenta_origen', '-id'], name='transf_origen_id_idx'),
+            models.Index(fields=['cuenta_destino', '-id'], name='transf_destino_id_idx'),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(estado='PENDIENTE', en_cola=True),
+                name='transferencia_en_cola_idx',
+            ),
+        ]
@@ -0,0 +1,278 @@
+"""
+Motor de transferencias.
+
+Aplica débitos y créditos sobre Cuenta como UPDATE condicionales en la base de
+datos (nunca leer-modificar-guardar en Python), de modo que varios workers
+puedan mover saldo de las mismas cuentas sin perder actualizaciones.
+
+Las cuentas se actualizan siempre en orden ascendente de id: dos
+transferencias en sentidos opuestos entre las mismas cuentas toman los
+bloqueos de fila en el mismo orden y no pueden entrar en deadlock.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from cuenta.libro import registrar_transferencias
+from cuenta.models import Cuenta
+from nucleo.metricas import TRANSFERENCIAS
+
+
+class SaldoInsuficiente(Exception):
+    """El débito condicional no encontró saldo suficiente en la cuenta origen"""
+
+
+def debitar(cuenta_id, monto):
+    """Debita el monto solo si el saldo alcanza. Retorna True si se aplicó"""
+    actualizadas = Cuenta.objects.filter(
+        pk=cuenta_id, saldo_disponible__gte=monto
+    ).update(saldo_disponible=F('saldo_disponible') - monto)
+    return actualizadas == 1
+
+
+def acreditar(cuenta_id, monto):
+    """Acredita el monto con un incremento atómico"""
+    actualizadas = Cuenta.objects.filter(pk=cuenta_id).update(
+        saldo_disponible=F('saldo_disponible') + monto
+    )
+    return actualizadas == 1
+
+
+def mover_saldo(cuenta_origen_id, cuenta_destino_id, monto):
+    """
+    Debita la cuenta origen y acredita la destino en orden de id.
+    Debe llamarse dentro de transaction.atomic(): si el débito falla se lanza
+    SaldoInsuficiente y el crédito ya aplicado se revierte con la transacción.
+    """
+    aplicar_deltas({cuenta_origen_id: -monto, cuenta_destino_id: monto})
+
+
+def aplicar_deltas(deltas):
+    """
+    Aplica un delta neto por cuenta ({cuenta_id: Decimal}) en orden de id.
+    Debe llamarse dentro de transaction.atomic(); los deltas negativos van
+    con guarda de saldo y si alguno no alcanza se lanza SaldoInsuficiente.
+    """
+    for cuenta_id in sorted(deltas):
+        delta = deltas[cuenta_id]
+        if delta < 0:
+            if not debitar(cuenta_id, -delta):
+                raise SaldoInsuficiente(cuenta_id)
+        elif delta > 0:
+            acreditar(cuenta_id, delta)
+
+
+def ejecutar_transferencia(transferencia):
+    """
+    Procesa una transferencia PENDIENTE.
+
+    La transferencia se reclama con un cambio de estado condicional
+    (PENDIENTE -> COMPLETADA) dentro de la misma transacción que mueve el
+    saldo, así que aunque dos workers la procesen a la vez solo uno la aplica.
+    Retorna (exito, mensaje) como Transferencia.procesar_transferencia.
+    """
+    from .models import Transferencia
+
+    ahora = timezone.now()
+    try:
+        with transaction.atomic():
+            reclamada = Transferencia.objects.filter(
+                pk=transferencia.pk, estado='PENDIENTE'
+            ).update(estado='COMPLETADA', fecha_procesamiento=ahora)
+            if not reclamada:
+                transferencia.refresh_from_db(fields=['estado', 'fecha_procesamiento'])
+                return False, "La transferencia ya fue procesada"
+
+            mover_saldo(transferencia.cuenta_origen_id, transferencia.cuenta_destino_id, transferencia.monto)
+            transferencia.estado = 'COMPLETADA'
+            registrar_transferencias([transferencia], ahora)
+    except SaldoInsuficiente:
+        _marcar_fallida(transferencia, ahora)
+        TRANSFERENCIAS.inc('fallida', 'saldo_insuficiente')
+        return False, "Saldo insuficiente"
+    except Exception as e:
+        _marcar_fallida(transferencia, ahora)
+        TRANSFERENCIAS.inc('fallida', 'error')
+        return False, f"Error al procesar la transferencia: {str(e)}"
+
+    TRANSFERENCIAS.inc('completada', 'ninguno')
+    transferencia.fecha_procesamiento = ahora
+    _refrescar_saldos(transferencia)
+    return True, "Transferencia completada exitosamente"
+
+
+def _marcar_fallida(transferencia, ahora):
+    from .models import Transferencia
+
+    Transferencia.objects.filter(pk=transferencia.pk, estado='PENDIENTE').update(
+        estado='FALLIDA', fecha_procesamiento=ahora
+    )
+    transferencia.refresh_from_db(fields=['estado', 'fecha_procesamiento'])
+
+
+def _refrescar_saldos(transferencia):
+    """Recarga en memoria los saldos de las cuentas ya cargadas en la instancia"""
+    for campo in ('cuenta_origen', 'cuenta_destino'):
+        if transferencia._meta.get_field(campo).is_cached(transferencia):
+            getattr(transferencia, campo).refresh_from_db(fields=['saldo_disponible'])
+
+
+def ejecutar_lote(transferencias, tamano_bloque=500, reintentos=3):
+    """
+    Procesa una lista de transferencias nuevas (instancias sin guardar con
+    cuenta_origen_id, cuenta_destino_id, monto y concepto ya validados).
+
+    Cada bloque se aplica en una sola transacción: se leen los saldos de
+    todas las cuentas involucradas con una consulta, se simulan las
+    transferencias en orden, se aplica un único UPDATE por cuenta con el
+    delta neto y las filas, junto con sus movimientos en el libro de la
+    cuenta, se insertan con bulk_create. Las que no tienen saldo quedan FALLIDA, como en procesar_transferencia.
+
+    Retorna una lista paralela a `transferencias` con None si el bloque se
+    aplicó o el mensaje de error si el bloque completo no pudo procesarse.
+    """
+    from .models import Transferencia
+
+    sin_referencia = [t for t in transferencias if not t.referencia]
+    for transferencia, referencia in zip(sin_referencia, Transferencia.generar_referencias(len(sin_referencia))):
+        transferencia.referencia = referencia
+
+    errores = []
+    for inicio in range(0, len(transferencias), tamano_bloque):
+        bloque = transferencias[inicio:inicio + tamano_bloque]
+        error = None
+        for intento in range(reintentos):
+            try:
+                with transaction.atomic():
+                    ahora = _aplicar_bloque(bloque)
+                    Transferencia.objects.bulk_create(bloque)
+                    registrar_transferencias(bloque, ahora)
+                error = None
+                break
+            except SaldoInsuficiente:
+                # Otro worker movió saldo entre la lectura y el UPDATE: se recalcula
+                error = "Saldo modificado concurrentemente, reintente el lote"
+            except Exception as e:
+                error = f"Error al procesar la transferencia: {str(e)}"
+                break
+        if error:
+            for transferencia in bloque:
+                transferencia.estado = 'PENDIENTE'
+                transferencia.fecha_procesamiento = None
+            TRANSFERENCIAS.inc('rechazada', 'lote_no_aplicado', cantidad=len(bloque))
+        else:
+            _contar_resueltas(bloque)
+        errores.extend([error] * len(bloque))
+    return errores
+
+
+def _contar_resueltas(transferencias):
+    """Cuenta en las métricas las transferencias resueltas por _simular_bloque"""
+    completadas = sum(1 for t in transferencias if t.estado == 'COMPLETADA')
+    if completadas:
+        TRANSFERENCIAS.inc('completada', 'ninguno', cantidad=completadas)
+    if completadas < len(transferencias):
+        TRANSFERENCIAS.inc('fallida', 'saldo_insuficiente', cantidad=len(transferencias) - completadas)
+    return completadas
+
+
+def _aplicar_bloque(bloque):
+    """Simula el bloque sobre los saldos actuales, aplica los deltas netos y retorna la fecha de procesamiento"""
+    ahora = timezone.now()
+    aplicar_deltas(_simular_bloque(bloque, ahora))
+    return ahora
+
+
+def _simular_bloque(bloque, ahora):
+    """
+    Lee con una consulta los saldos de las cuentas del bloque, resuelve cada
+    transferencia en orden (COMPLETADA o FALLIDA por saldo) y retorna el
+    delta neto por cuenta.
+    """
+    cuentas_ids = set()
+    for transferencia in bloque:
+        cuentas_ids.update((transferencia.cuenta_origen_id, transferencia.cuenta_destino_id))
+
+    saldos = dict(
+        Cuenta.objects.select_for_update()
+        .filter(pk__in=cuentas_ids)
+        .order_by('pk')
+        .values_list('pk', 'saldo_disponible')
+    )
+
+    deltas = defaultdict(Decimal)
+    for transferencia in bloque:
+        origen, destino, monto = transferencia.cuenta_origen_id, transferencia.cuenta_destino_id, transferencia.monto
+        if saldos[origen] >= monto:
+            saldos[origen] -= monto
+            saldos[destino] += monto
+            deltas[origen] -= monto
+            deltas[destino] += monto
+            transferencia.estado = 'COMPLETADA'
+        else:
+            transferencia.estado = 'FALLIDA'
+        transferencia.fecha_procesamiento = ahora
+    return deltas
+
+
+class ReclamoPerdido(Exception):
+    """Otro worker tomó transferencias de este lote (reclamo vencido)"""
+
+
+def reclamar_en_cola(trabajador, limite, vencimiento_reclamo):
+    """
+    Reclama hasta `limite` transferencias encoladas para `trabajador`.
+
+    El reclamo es un UPDATE condicional, así que varios procesos pueden
+    llamarlo a la vez sin tomar la misma fila. Un reclamo más viejo que
+    `vencimiento_reclamo` se considera abandonado y puede volver a tomarse.
+    """
+    from django.db.models import Q
+    from .models import Transferencia
+
+    ahora = timezone.now()
+    libres = Q(reclamada_por__isnull=True) | Q(reclamada_en__lt=ahora - vencimiento_reclamo)
+    encoladas = Transferencia.objects.filter(libres, estado='PENDIENTE', en_cola=True)
+    candidatas = encoladas.order_by('pk').values('pk')[:limite]
+    encoladas.filter(pk__in=candidatas).update(reclamada_por=trabajador, reclamada_en=ahora)
+
+    return list(
+        Transferencia.objects.filter(estado='PENDIENTE', en_cola=True, reclamada_por=trabajador)
+        .order_by('pk')
+        .only('id', 'cuenta_origen_id', 'cuenta_destino_id', 'monto', 'estado', 'referencia')
+    )
+
+
+def procesar_reclamadas(transferencias, trabajador):
+    """
+    Procesa en una transacción las transferencias reclamadas por `trabajador`.
+
+    Las transferencias se resuelven en orden de llegada y los saldos se
+    aplican agrupados por cuenta (un UPDATE por cuenta en orden de id), así
+    un lote de cientos de transferencias toma cada fila de Cuenta una vez.
+    Retorna (completadas, fallidas).
+    """
+    from .models import Transferencia
+
+    if not transferencias:
+        return 0, 0
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        aplicar_deltas(_simular_bloque(transferencias, ahora))
+        for estado in ('COMPLETADA', 'FALLIDA'):
+            ids = [t.pk for t in transferencias if t.estado == estado]
+            if not ids:
+                continue
+            actualizadas = Transferencia.objects.filter(
+                pk__in=ids, estado='PENDIENTE', reclamada_por=trabajador
+            ).update(estado=estado, fecha_procesamiento=ahora)
+            if actualizadas != len(ids):
+                raise ReclamoPerdido()
+        registrar_transferencias(transferencias, ahora)
+
+    completadas = _contar_resueltas(transferencias)
+    return completadas, len(transferencias) - completadas
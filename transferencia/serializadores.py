@@ -0,0 +1,25 @@
+"""Proyecciones de las respuestas JSON de transferencias (ver nucleo.proyecciones)"""
+from cuenta.models import Cuenta
+from nucleo.proyecciones import Proyeccion, como_display, como_iso, como_texto
+from .models import Transferencia
+
+
+def _cuenta(lado):
+    return {
+        'numero_cuenta': f'{lado}__numero_cuenta',
+        'usuario': f'{lado}__usuario__username',
+        'tipo_cuenta': (f'{lado}__tipo_cuenta', como_display(Cuenta.TIPO_CUENTA_CHOICES)),
+    }
+
+
+TRANSFERENCIA = Proyeccion({
+    'referencia': 'referencia',
+    'monto': ('monto', como_texto),
+    'concepto': 'concepto',
+    'estado': 'estado',
+    'estado_display': ('estado', como_display(Transferencia.ESTADO_CHOICES)),
+    'fecha_creacion': ('fecha_creacion', como_iso),
+    'fecha_procesamiento': ('fecha_procesamiento', como_iso),
+    'cuenta_origen': _cuenta('cuenta_origen'),
+    'cuenta_destino': _cuenta('cuenta_destino'),
+})
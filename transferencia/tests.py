@@ -1,3 +1,464 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cuenta import views as vistas_cuenta
+from cuenta.libro import saldo_segun_libro
+from cuenta.models import Cuenta
+from home_banking import settings_produccion
+from nucleo import metricas
+from nucleo.pruebas import VistasAsincronasMixin, restaurar_secuencias, valor_metrica
+from . import views
+from .models import Transferencia
+from . import motor
+from .motor import ReclamoPerdido, SaldoInsuficiente, ejecutar_lote, procesar_reclamadas, reclamar_en_cola
+
+TABLA = Transferencia._meta.db_table
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es específico de SQLite')
+class PlanesDeConsultaHistorialTests(TestCase):
+    """
+    Las consultas de historial sobre Transferencia deben resolverse con
+    índices: ningún SCAN completo de la tabla ni ordenamiento en un B-tree
+    temporal, sin importar cuánto crezca el historial.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='karen', password='secreto')
+        cls.cuenta = Cuenta.objects.create(usuario=cls.usuario, saldo_disponible=1000)
+        otro = User.objects.create_user(username='otro', password='secreto')
+        cls.otra_cuenta = Cuenta.objects.create(usuario=otro, saldo_disponible=1000)
+        for i in range(5):
+            Transferencia.objects.create(cuenta_origen=cls.cuenta, cuenta_destino=cls.otra_cuenta, monto=10)
+            Transferencia.objects.create(cuenta_origen=cls.otra_cuenta, cuenta_destino=cls.cuenta, monto=10)
+        cls.transferencia = Transferencia.objects.filter(cuenta_origen=cls.cuenta).first()
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def planes(self, consultas):
+        """EXPLAIN QUERY PLAN de cada SELECT capturado que lee Transferencia"""
+        planes = []
+        with connection.cursor() as cursor:
+            for consulta in consultas:
+                sql = consulta['sql']
+                if not sql.startswith('SELECT') or TABLA not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                planes.append((sql, [fila[-1] for fila in cursor.fetchall()]))
+        return planes
+
+    def assertUsaIndices(self, consultas, indices_parciales=()):
+        """
+        `indices_parciales`: índices con condición cuyo recorrido completo es
+        aceptable porque solo contienen las filas buscadas (p. ej. la cola).
+        """
+        planes = self.planes(consultas)
+        self.assertTrue(planes, 'No se capturó ninguna consulta sobre Transferencia')
+        for sql, plan in planes:
+            for detalle in plan:
+                escaneo_completo = (
+                    detalle.startswith('SCAN') and TABLA in detalle
+                    and not any(f'INDEX {indice}' in detalle for indice in indices_parciales)
+                )
+                if escaneo_completo or 'TEMP B-TREE' in detalle:
+                    self.fail(f'Consulta sin índice adecuado:\n{sql}\nPlan:\n' + '\n'.join(plan))
+
+    def capturar_get(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return contexto.captured_queries
+
+    def test_dashboard(self):
+        self.assertUsaIndices(self.capturar_get(reverse('dashboard')))
+
+    def test_listar_transferencias(self):
+        self.assertUsaIndices(self.capturar_get(reverse('listar_transferencias')))
+
+    def test_detalle_transferencia(self):
+        url = reverse('detalle_transferencia', args=[self.transferencia.referencia])
+        self.assertUsaIndices(self.capturar_get(url))
+
+    def test_api_transferencias_enviadas_y_recibidas(self):
+        for nombre in ('api_transferencias_enviadas', 'api_transferencias_recibidas'):
+            url = reverse(nombre)
+            self.assertUsaIndices(self.capturar_get(f'{url}?username=karen&limit=3'))
+            self.assertUsaIndices(self.capturar_get(f'{url}?username=karen&limit=3&cursor={self.transferencia.pk}'))
+
+    def test_reclamo_de_la_cola_asincrona(self):
+        Transferencia.objects.create(
+            cuenta_origen=self.cuenta, cuenta_destino=self.otra_cuenta, monto=10, en_cola=True
+        )
+        with CaptureQueriesContext(connection) as contexto:
+            reclamadas = reclamar_en_cola('test', 10, timedelta(seconds=60))
+        self.assertEqual(len(reclamadas), 1)
+        self.assertUsaIndices(contexto.captured_queries, indices_parciales=['transferencia_en_cola_idx'])
+
+
+class ConsultasHistorialTests(TestCase):
+    """
+    Las vistas de historial deben ejecutar la misma cantidad de consultas
+    sin importar cuántas transferencias tenga el usuario (sin N+1).
+    """
+
+    VISTAS = ('dashboard', 'historial', 'listar_transferencias')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='karen', password='secreto')
+        cls.cuenta = Cuenta.objects.create(usuario=cls.usuario, saldo_disponible=1000)
+        cls.contrapartes = [
+            Cuenta.objects.create(usuario=User.objects.create_user(username=f'otro{i}'), saldo_disponible=1000)
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def crear_transferencias(self, cantidad):
+        for contraparte in self.contrapartes[:cantidad]:
+            Transferencia.objects.create(cuenta_origen=self.cuenta, cuenta_destino=contraparte, monto=1)
+            Transferencia.objects.create(cuenta_origen=contraparte, cuenta_destino=self.cuenta, monto=1)
+
+    def contar_consultas(self, nombre):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(reverse(nombre))
+        self.assertEqual(respuesta.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def test_consultas_constantes_al_crecer_el_historial(self):
+        self.crear_transferencias(2)
+        iniciales = {nombre: self.contar_consultas(nombre) for nombre in self.VISTAS}
+
+        self.crear_transferencias(30)
+        for nombre in self.VISTAS:
+            with self.subTest(vista=nombre):
+                with self.assertNumQueries(iniciales[nombre]):
+                    respuesta = self.client.get(reverse(nombre))
+                self.assertContains(respuesta, self.contrapartes[-1].numero_cuenta)
+
+
+class VistasAsincronasTests(VistasAsincronasMixin, TestCase):
+    """Las versiones async de las consultas (API_ASINCRONA) responden igual que las sincrónicas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.origen = Cuenta.objects.create(usuario=User.objects.create_user(username='karen'), saldo_disponible=1000)
+        cls.destino = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=1000)
+        cls.referencias = []
+        for _ in range(3):
+            transferencia = Transferencia.objects.create(cuenta_origen=cls.origen, cuenta_destino=cls.destino, monto=5)
+            transferencia.procesar_transferencia()
+            cls.referencias.append(transferencia.referencia)
+
+    async def test_consulta_de_transferencia(self):
+        for referencia in (self.referencias[0], 'NO-EXISTE'):
+            with self.subTest(referencia=referencia):
+                respuesta = await self.comparar(
+                    views.consultar_transferencia_api, views.consultar_transferencia_api_async,
+                    f'/transferencia/api/consultar/{referencia}/', referencia=referencia,
+                )
+                self.assertTrue(respuesta.has_header('ETag'))
+
+    async def test_listados_de_transferencias(self):
+        for consulta in ('username=karen&limit=2', 'username=karen&stream=1', 'username=nadie', 'limit=2'):
+            with self.subTest(consulta=consulta):
+                await self.comparar(
+                    vistas_cuenta.api_transferencias_enviadas, vistas_cuenta.api_transferencias_enviadas_async,
+                    f'/cuenta/api/transferencias/enviadas/?{consulta}',
+                )
+        await self.comparar(
+            vistas_cuenta.api_transferencias_recibidas, vistas_cuenta.api_transferencias_recibidas_async,
+            '/cuenta/api/transferencias/recibidas/?username=otro',
+        )
+
+
+class ColaTransferenciasTests(TestCase):
+
+    VENCIMIENTO = timedelta(seconds=60)
+
+    def setUp(self):
+        self.origen = Cuenta.objects.create(usuario=User.objects.create_user(username='karen'), saldo_disponible=100)
+        self.destino = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=0)
+
+    def encolar(self, cantidad, monto=10):
+        return [
+            Transferencia.objects.create(cuenta_origen=self.origen, cuenta_destino=self.destino, monto=monto, en_cola=True)
+            for _ in range(cantidad)
+        ]
+
+    def test_asincrona_solo_acepta_un_booleano(self):
+        for valor, estado in (('false', 400), ('0', 400), (0, 400), (1, 400), (False, 201), (True, 202)):
+            with self.subTest(asincrona=valor):
+                respuesta = self.client.post(reverse('realizar_transferencia_api'), json.dumps({
+                    'cuenta_origen': self.origen.numero_cuenta, 'cuenta_destino': self.destino.numero_cuenta,
+                    'monto': 1, 'asincrona': valor,
+                }), content_type='application/json')
+                self.assertEqual(respuesta.status_code, estado)
+        self.assertEqual(Transferencia.objects.filter(en_cola=True).count(), 1)
+
+    def test_dos_trabajadores_no_reclaman_la_misma_transferencia(self):
+        self.encolar(5)
+
+        primero = reclamar_en_cola('uno', 3, self.VENCIMIENTO)
+        segundo = reclamar_en_cola('dos', 10, self.VENCIMIENTO)
+
+        self.assertEqual((len(primero), len(segundo)), (3, 2))
+        self.assertFalse({t.pk for t in primero} & {t.pk for t in segundo})
+        self.assertEqual(procesar_reclamadas(primero, 'uno'), (3, 0))
+        self.assertEqual(procesar_reclamadas(segundo, 'dos'), (2, 0))
+        self.assertEqual(reclamar_en_cola('tres', 10, self.VENCIMIENTO), [])
+        self.destino.refresh_from_db()
+        self.assertEqual(self.destino.saldo_disponible, 50)
+
+    def test_un_reclamo_vencido_se_retoma(self):
+        self.encolar(2)
+        abandonadas = reclamar_en_cola('caido', 10, self.VENCIMIENTO)
+        self.assertEqual(reclamar_en_cola('otro', 10, self.VENCIMIENTO), [])
+
+        Transferencia.objects.update(reclamada_en=timezone.now() - 2 * self.VENCIMIENTO)
+        salida = StringIO()
+        call_command('process_transfers', una_vez=True, vencimiento_reclamo=60, stdout=salida)
+
+        self.assertIn('Total: 2 completadas, 0 fallidas', salida.getvalue())
+        self.assertEqual(
+            set(Transferencia.objects.filter(pk__in=[t.pk for t in abandonadas]).values_list('estado', flat=True)),
+            {'COMPLETADA'},
+        )
+
+    def test_reclamo_perdido_revierte_el_lote(self):
+        self.encolar(2)
+        lento = reclamar_en_cola('lento', 10, self.VENCIMIENTO)
+        Transferencia.objects.update(reclamada_en=timezone.now() - 2 * self.VENCIMIENTO)
+        retomadas = reclamar_en_cola('rapido', 10, self.VENCIMIENTO)
+
+        with self.assertRaises(ReclamoPerdido):
+            procesar_reclamadas(lento, 'lento')
+
+        self.origen.refresh_from_db()
+        self.assertEqual(self.origen.saldo_disponible, 100)
+        self.assertEqual(saldo_segun_libro(self.origen.pk), 100)
+        self.assertEqual(procesar_reclamadas(retomadas, 'rapido'), (2, 0))
+        self.origen.refresh_from_db()
+        self.assertEqual(self.origen.saldo_disponible, 80)
+
+
+class MetricasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.origen = Cuenta.objects.create(usuario=User.objects.create_user(username='karen'), saldo_disponible=100)
+        cls.destino = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=0)
+
+    def metricas(self):
+        respuesta = self.client.get('/metrics')
+        self.assertEqual(respuesta['Content-Type'], metricas.TIPO_CONTENIDO)
+        return respuesta.content.decode()
+
+    def transferir(self, monto):
+        return self.client.post(
+            reverse('realizar_transferencia_api'),
+            json.dumps({'cuenta_origen': self.origen.numero_cuenta, 'cuenta_destino': self.destino.numero_cuenta,
+                        'monto': monto}),
+            content_type='application/json',
+        )
+
+    def test_mide_las_peticiones_por_ruta(self):
+        ruta = 'ruta="realizar_transferencia_api"'
+        antes = self.metricas()
+        self.transferir(10)
+        despues = self.metricas()
+
+        for serie in (f'homebanking_http_peticiones_total{{{ruta},metodo="POST",estado="201"}}',
+                      f'homebanking_http_duracion_segundos_count{{{ruta},metodo="POST"}}',
+                      f'homebanking_http_duracion_segundos_bucket{{{ruta},metodo="POST",le="+Inf"}}'):
+            self.assertEqual(valor_metrica(despues, serie) - valor_metrica(antes, serie), 1, serie)
+        consultas = f'homebanking_http_consultas_bd_total{{{ruta}}}'
+        self.assertGreater(valor_metrica(despues, consultas), valor_metrica(antes, consultas))
+        self.assertEqual(valor_metrica(despues, 'homebanking_http_en_curso'), 1)
+
+    def test_cuenta_transferencias_por_resultado_y_motivo(self):
+        completadas = 'homebanking_transferencias_total{resultado="completada",motivo="ninguno"}'
+        sin_saldo = 'homebanking_transferencias_total{resultado="rechazada",motivo="saldo_insuficiente"}'
+        fallidas = 'homebanking_transferencias_total{resultado="fallida",motivo="saldo_insuficiente"}'
+        antes = self.metricas()
+        self.transferir(60)
+        self.transferir(60)
+        # Validada con saldo, pero otro débito se adelantó: la rechaza el motor
+        Transferencia.objects.create(cuenta_origen=self.origen, cuenta_destino=self.destino,
+                                     monto=50).procesar_transferencia()
+        despues = self.metricas()
+
+        for serie in (completadas, sin_saldo, fallidas):
+            self.assertEqual(valor_metrica(despues, serie) - valor_metrica(antes, serie), 1, serie)
+
+    def test_suma_los_procesos_y_conserva_los_terminados(self):
+        terminado = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                   capture_output=True, text=True).stdout.strip()
+        instantanea = {
+            'homebanking_transferencias_total': {
+                'tipo': 'counter', 'ayuda': '', 'etiquetas': ['resultado', 'motivo'],
+                'valores': [[['completada', 'ninguno'], 1000]],
+            },
+            'homebanking_http_en_curso': {'tipo': 'gauge', 'ayuda': '', 'etiquetas': [], 'valores': [[[], 7]]},
+        }
+        serie = 'homebanking_transferencias_total{resultado="completada",motivo="ninguno"}'
+        local = valor_metrica(metricas.formatear(metricas.instantanea()), serie)
+
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIRECTORIO=directorio):
+            with open(os.path.join(directorio, f'{terminado}.json'), 'w') as archivo:
+                json.dump(instantanea, archivo)
+            for _ in range(2):
+                texto = self.metricas()
+                self.assertEqual(valor_metrica(texto, serie), local + 1000)
+                self.assertEqual(valor_metrica(texto, 'homebanking_http_en_curso'), 1)
+            self.assertEqual(sorted(n for n in os.listdir(directorio) if n.endswith('.json')),
+                             [f'{os.getpid()}.json', metricas.ACUMULADO])
+
+    def test_el_worker_de_la_cola_publica_sus_transferencias(self):
+        serie = 'homebanking_transferencias_total{resultado="completada",motivo="ninguno"}'
+        for _ in range(2):
+            Transferencia.objects.create(cuenta_origen=self.origen, cuenta_destino=self.destino, monto=10, en_cola=True)
+        antes = valor_metrica(metricas.formatear(metricas.instantanea()), serie)
+
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS_DIRECTORIO=directorio):
+            call_command('process_transfers', '--una-vez', stdout=StringIO())
+            # /metrics lo atiende otro proceso, que no publica los valores de este
+            with mock.patch.object(metricas, 'publicar'):
+                total = metricas.formatear(metricas.agregadas())
+
+        self.assertEqual(valor_metrica(total, serie) - antes, 2)
+
+
+class LoteTransferenciasTests(TestCase):
+
+    def setUp(self):
+        self.a, self.b, self.c = (
+            Cuenta.objects.create(usuario=User.objects.create_user(username=nombre), saldo_disponible=saldo)
+            for nombre, saldo in (('ana', 100), ('beto', 0), ('carla', 0))
+        )
+
+    def lote(self, *movimientos):
+        return [
+            Transferencia(cuenta_origen=origen, cuenta_destino=destino, monto=Decimal(monto))
+            for origen, destino, monto in movimientos
+        ]
+
+    def saldos(self):
+        for cuenta in (self.a, self.b, self.c):
+            cuenta.refresh_from_db()
+            self.assertEqual(saldo_segun_libro(cuenta.pk), cuenta.saldo_disponible)
+        return [cuenta.saldo_disponible for cuenta in (self.a, self.b, self.c)]
+
+    def test_sobregiro_dentro_del_lote(self):
+        respuesta = self.client.post(reverse('realizar_transferencias_lote_api'), json.dumps({'transferencias': [
+            {'cuenta_origen': self.a.numero_cuenta, 'cuenta_destino': self.b.numero_cuenta, 'monto': 60},
+            {'cuenta_origen': self.a.numero_cuenta, 'cuenta_destino': self.c.numero_cuenta, 'monto': 60},
+            {'cuenta_origen': self.a.numero_cuenta, 'cuenta_destino': self.c.numero_cuenta, 'monto': 40},
+        ]}), content_type='application/json')
+
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['success'] for r in resultados], [True, False, True])
+        self.assertEqual((resultados[1]['error'], resultados[1]['estado']), ('Saldo insuficiente', 'FALLIDA'))
+        self.assertEqual(self.saldos(), [0, 60, 40])
+
+    def test_cuentas_repetidas_en_un_bloque_se_resuelven_en_orden(self):
+        # beto solo puede pagarle a carla con lo que recibe antes en el mismo bloque
+        lote = self.lote((self.a, self.b, 50), (self.b, self.c, 30), (self.b, self.a, 30), (self.a, self.b, 50))
+
+        self.assertEqual(ejecutar_lote(lote), [None] * 4)
+
+        self.assertEqual([t.estado for t in lote], ['COMPLETADA', 'COMPLETADA', 'FALLIDA', 'COMPLETADA'])
+        self.assertEqual(self.saldos(), [0, 70, 30])
+
+    def test_un_bloque_que_falla_no_aplica_nada(self):
+        registrar = motor.registrar_transferencias
+        bloques = []
+
+        def falla_el_segundo_bloque(bloque, ahora):
+            bloques.append(bloque)
+            if len(bloques) == 2:
+                raise Exception('disco lleno')
+            registrar(bloque, ahora)
+
+        lote = self.lote(*[(self.a, self.b, 10)] * 6)
+        with mock.patch.object(motor, 'registrar_transferencias', side_effect=falla_el_segundo_bloque):
+            errores = ejecutar_lote(lote, tamano_bloque=2)
+
+        self.assertEqual(errores[:2], [None, None])
+        self.assertTrue(errores[2].startswith('Error al procesar la transferencia'))
+        self.assertEqual(errores[3], errores[2])
+        self.assertEqual(errores[4:], [None, None])
+        self.assertEqual([t.estado for t in lote[2:4]], ['PENDIENTE', 'PENDIENTE'])
+        self.assertEqual(Transferencia.objects.count(), 4)
+        self.assertEqual(self.saldos(), [60, 40, 0])
+
+    def test_reintenta_el_bloque_si_el_saldo_cambio_entre_la_lectura_y_el_update(self):
+        aplicar = motor.aplicar_deltas
+        intentos = []
+
+        def saldo_cambiado(deltas):
+            intentos.append(deltas)
+            if len(intentos) == 1:
+                raise SaldoInsuficiente(self.a.pk)
+            aplicar(deltas)
+
+        lote = self.lote((self.a, self.b, 10), (self.a, self.c, 20))
+        with mock.patch.object(motor, 'aplicar_deltas', side_effect=saldo_cambiado):
+            self.assertEqual(ejecutar_lote(lote), [None, None])
+        self.assertEqual(len(intentos), 2)
+        self.assertEqual(self.saldos(), [70, 10, 20])
+
+        lote = self.lote((self.a, self.b, 10))
+        with mock.patch.object(motor, 'aplicar_deltas', side_effect=SaldoInsuficiente(self.a.pk)) as siempre:
+            self.assertEqual(ejecutar_lote(lote, reintentos=3), ['Saldo modificado concurrentemente, reintente el lote'])
+        self.assertEqual(siempre.call_count, 3)
+        self.assertEqual(lote[0].estado, 'PENDIENTE')
+        self.assertEqual(Transferencia.objects.count(), 2)
+        self.assertEqual(self.saldos(), [70, 10, 20])
+
+
+class PerfilProduccionTests(TransactionTestCase):
+    """Las escrituras funcionan con las transacciones BEGIN IMMEDIATE del perfil de producción"""
+
+    def setUp(self):
+        restaurar_secuencias()
+        connection.ensure_connection()
+        self.addCleanup(setattr, connection, 'transaction_mode', connection.transaction_mode)
+        connection.transaction_mode = settings_produccion.DATABASES['default']['OPTIONS']['transaction_mode']
+        self.origen = Cuenta.objects.create(usuario=User.objects.create_user(username='karen'), saldo_disponible=100)
+        self.destino = Cuenta.objects.create(usuario=User.objects.create_user(username='otro'), saldo_disponible=0)
+
+    def post(self, nombre, datos):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(reverse(nombre), json.dumps(datos), content_type='application/json')
+        self.assertIn('BEGIN IMMEDIATE', [consulta['sql'] for consulta in consultas])
+        return respuesta
+
+    def test_transferencia_y_lote(self):
+        item = {'cuenta_origen': self.origen.numero_cuenta, 'cuenta_destino': self.destino.numero_cuenta, 'monto': 10}
+
+        individual = self.post('realizar_transferencia_api', item)
+        lote = self.post('realizar_transferencias_lote_api', {'transferencias': [item, item]})
+
+        self.assertEqual(individual.status_code, 201, individual.content)
+        self.assertTrue(lote.json()['success'])
+        self.origen.refresh_from_db()
+        self.assertEqual(self.origen.saldo_disponible, 70)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -5,6 +6,9 @@ urlpatterns = [
     path('enviar/', views.enviar_transferencia_view, name='enviar_transferencia'),
     path('lista/', views.listar_transferencias_view, name='listar_transferencias'),
     path('detalle/<str:referencia>/', views.detalle_transferencia_view, name='detalle_transferencia'),
-    path('api/consultar/<str:referencia>/', views.consultar_transferencia_api, name='consultar_transferencia_api'),
+    path('api/consultar/<str:referencia>/',
+         views.consultar_transferencia_api_async if settings.API_ASINCRONA else views.consultar_transferencia_api,
+         name='consultar_transferencia_api'),
     path('api/realizar/', views.realizar_transferencia_api, name='realizar_transferencia_api'),
+    path('api/realizar-lote/', views.realizar_transferencias_lote_api, name='realizar_transferencias_lote_api'),
 ]
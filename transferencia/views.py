@@ -1,15 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from .models import Transferencia
+from . import historial
+from .motor import ejecutar_lote
+from .serializadores import TRANSFERENCIA
 from cuenta.models import Cuenta
+from nucleo.cache_http import cache_estado_final, marcar_final
+from nucleo.idempotencia import idempotente
+from nucleo.metricas import TRANSFERENCIAS
 from decimal import Decimal
 import json
 
+# Cantidad máxima de transferencias aceptadas por realizar_transferencias_lote_api
+LOTE_MAXIMO_TRANSFERENCIAS = 5000
+
 @login_required
 def enviar_transferencia_view(request):
     """Vista para enviar una transferencia"""
@@ -42,6 +52,7 @@ def enviar_transferencia_view(request):
 
         # Verificar saldo suficiente
         if cuenta_origen.saldo_disponible < monto_decimal:
+            TRANSFERENCIAS.inc('rechazada', 'saldo_insuficiente')
             messages.error(request, 'Saldo insuficiente para realizar la transferencia')
             return render(request, 'transferencia/enviar.html')
 
@@ -88,67 +99,44 @@ def detalle_transferencia_view(request, referencia):
 
 @login_required
 def listar_transferencias_view(request):
-    """Vista para listar todas las transferencias del usuario"""
+    """Vista para listar todas las transferencias del usuario, por páginas"""
     cuenta_usuario = request.user.cuenta
-
-    # Obtener todas las transferencias donde el usuario participe
-    transferencias = Transferencia.objects.filter(
-        Q(cuenta_origen=cuenta_usuario) | Q(cuenta_destino=cuenta_usuario)
-    ).order_by('-fecha_creacion')
-
-    # Agregar información adicional a cada transferencia
-    transferencias_con_info = []
-    for transferencia in transferencias:
-        es_enviada = transferencia.cuenta_origen == cuenta_usuario
-        transferencias_con_info.append({
-            'transferencia': transferencia,
-            'es_enviada': es_enviada,
-            'cuenta_relacionada': transferencia.cuenta_destino if es_enviada else transferencia.cuenta_origen
-        })
+    pagina = historial.pagina(historial.todas(cuenta_usuario), request.GET.get('pagina'))
 
     context = {
-        'transferencias_con_info': transferencias_con_info,
+        'pagina': pagina,
+        'transferencias_con_info': historial.con_contraparte(pagina, cuenta_usuario),
     }
 
     return render(request, 'transferencia/lista.html', context)
 
 @require_http_methods(["GET"])
+@cache_estado_final('transferencia.consultar', 'referencia')
 def consultar_transferencia_api(request, referencia):
     """
     API para consultar los datos de una transferencia por su número de referencia
-    Retorna los datos en formato JSON
+    Retorna los datos en formato JSON (con ETag; las COMPLETADA/FALLIDA se cachean)
     """
     try:
-        transferencia = Transferencia.objects.get(referencia=referencia)
+        transferencia = TRANSFERENCIA.primera(Transferencia.objects.filter(referencia=referencia))
+    except Exception as e:
+        return _error_interno(e)
+    return _respuesta_consulta(referencia, transferencia)
 
-        # Preparar los datos de respuesta
-        data = {
-            'success': True,
-            'tipo': 'transferencia',
-            'transferencia': {
-                'referencia': transferencia.referencia,
-                'monto': str(transferencia.monto),
-                'concepto': transferencia.concepto,
-                'estado': transferencia.estado,
-                'estado_display': transferencia.get_estado_display(),
-                'fecha_creacion': transferencia.fecha_creacion.isoformat(),
-                'fecha_procesamiento': transferencia.fecha_procesamiento.isoformat() if transferencia.fecha_procesamiento else None,
-                'cuenta_origen': {
-                    'numero_cuenta': transferencia.cuenta_origen.numero_cuenta,
-                    'usuario': transferencia.cuenta_origen.usuario.username,
-                    'tipo_cuenta': transferencia.cuenta_origen.get_tipo_cuenta_display()
-                },
-                'cuenta_destino': {
-                    'numero_cuenta': transferencia.cuenta_destino.numero_cuenta,
-                    'usuario': transferencia.cuenta_destino.usuario.username,
-                    'tipo_cuenta': transferencia.cuenta_destino.get_tipo_cuenta_display()
-                }
-            }
-        }
 
-        return JsonResponse(data, status=200)
+@require_http_methods(["GET"])
+@cache_estado_final('transferencia.consultar', 'referencia')
+async def consultar_transferencia_api_async(request, referencia):
+    """consultar_transferencia_api con el ORM asíncrono (API_ASINCRONA)"""
+    try:
+        transferencia = await TRANSFERENCIA.aprimera(Transferencia.objects.filter(referencia=referencia))
+    except Exception as e:
+        return _error_interno(e)
+    return _respuesta_consulta(referencia, transferencia)
+
 
-    except Transferencia.DoesNotExist:
+def _respuesta_consulta(referencia, transferencia):
+    if transferencia is None:
         return JsonResponse({
             'success': False,
             'error': 'Transferencia no encontrada',
@@ -159,20 +147,35 @@ def consultar_transferencia_api(request, referencia):
             }
         }, status=200)
 
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': 'Error interno del servidor',
-            'message': str(e)
-        }, status=500)
+    # Preparar los datos de respuesta
+    data = {
+        'success': True,
+        'tipo': 'transferencia',
+        'transferencia': transferencia
+    }
+
+    respuesta = JsonResponse(data, status=200)
+    if transferencia['estado'] in ('COMPLETADA', 'FALLIDA'):
+        marcar_final(respuesta)
+    return respuesta
+
+
+def _error_interno(e):
+    return JsonResponse({
+        'success': False,
+        'error': 'Error interno del servidor',
+        'message': str(e)
+    }, status=500)
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotente('transferencia.realizar')
 def realizar_transferencia_api(request):
     """
     API para realizar una transferencia entre cuentas
-    Recibe: cuenta_origen, cuenta_destino, monto, motivo
+    Recibe: cuenta_origen, cuenta_destino, monto, motivo, asincrona (opcional)
     Retorna: datos de la transferencia creada en formato JSON
+    (202 con la referencia PENDIENTE si se procesa de forma asíncrona)
     """
     try:
         # Parsear datos JSON del request
@@ -208,6 +211,17 @@ def realizar_transferencia_api(request):
                 'message': 'El formato del monto es incorrecto'
             }, status=400)
 
+        # Solo un booleano JSON: "false" o 0 no deben encolar por accidente
+        asincrona = data.get('asincrona')
+        if asincrona is None:
+            asincrona = getattr(settings, 'TRANSFERENCIAS_ASINCRONAS', False)
+        elif not isinstance(asincrona, bool):
+            return JsonResponse({
+                'success': False,
+                'error': 'Parámetro inválido',
+                'message': 'asincrona debe ser true o false'
+            }, status=400)
+
         # Verificar que las cuentas existen y están activas
         try:
             cuenta_origen = Cuenta.objects.get(numero_cuenta=numero_cuenta_origen, activa=True)
@@ -237,12 +251,35 @@ def realizar_transferencia_api(request):
 
         # Verificar saldo suficiente
         if cuenta_origen.saldo_disponible < monto_decimal:
+            TRANSFERENCIAS.inc('rechazada', 'saldo_insuficiente')
             return JsonResponse({
                 'success': False,
                 'error': 'Saldo insuficiente',
                 'message': f'Saldo disponible: {cuenta_origen.saldo_disponible}, Monto solicitado: {monto_decimal}'
             }, status=400)
 
+        # Modo asíncrono: se encola y la procesa el comando process_transfers
+        if asincrona:
+            transferencia = Transferencia.objects.create(
+                cuenta_origen=cuenta_origen,
+                cuenta_destino=cuenta_destino,
+                monto=monto_decimal,
+                concepto=motivo,
+                en_cola=True
+            )
+            return JsonResponse({
+                'success': True,
+                'message': 'Transferencia encolada para su procesamiento',
+                'transferencia': {
+                    'referencia': transferencia.referencia,
+                    'monto': str(transferencia.monto),
+                    'concepto': transferencia.concepto,
+                    'estado': transferencia.estado,
+                    'estado_display': transferencia.get_estado_display(),
+                    'fecha_creacion': transferencia.fecha_creacion.isoformat()
+                }
+            }, status=202)
+
         # Crear la transferencia
         transferencia = Transferencia.objects.create(
             cuenta_origen=cuenta_origen,
@@ -304,3 +341,132 @@ def realizar_transferencia_api(request):
             'error': 'Error interno del servidor',
             'message': str(e)
         }, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotente('transferencia.realizar_lote')
+def realizar_transferencias_lote_api(request):
+    """
+    API para realizar varias transferencias en una sola petición
+    Recibe: transferencias (lista de {cuenta_origen, cuenta_destino, monto, motivo})
+    Retorna: resultado por item, en el mismo orden del lote
+    """
+    try:
+        data = json.loads(request.body)
+        items = data.get('transferencias') if isinstance(data, dict) else None
+
+        if not isinstance(items, list) or not items:
+            return JsonResponse({
+                'success': False,
+                'error': 'Parámetros faltantes',
+                'message': 'Se requiere una lista no vacía en "transferencias"'
+            }, status=400)
+
+        if len(items) > LOTE_MAXIMO_TRANSFERENCIAS:
+            return JsonResponse({
+                'success': False,
+                'error': 'Lote demasiado grande',
+                'message': f'El lote admite hasta {LOTE_MAXIMO_TRANSFERENCIAS} transferencias'
+            }, status=400)
+
+        # Resolver todas las cuentas del lote con una sola consulta
+        numeros = set()
+        for item in items:
+            if isinstance(item, dict):
+                numeros.update(str(item.get(campo)) for campo in ('cuenta_origen', 'cuenta_destino') if item.get(campo))
+        cuentas = {
+            cuenta.numero_cuenta: cuenta
+            for cuenta in Cuenta.objects.filter(numero_cuenta__in=numeros, activa=True).only('id', 'numero_cuenta')
+        }
+
+        resultados = [None] * len(items)
+        validas = []
+        for indice, item in enumerate(items):
+            error = _validar_item_lote(item, cuentas)
+            if error:
+                resultados[indice] = {'indice': indice, 'success': False, 'error': error[0], 'message': error[1]}
+                continue
+            transferencia = Transferencia(
+                cuenta_origen=cuentas[str(item['cuenta_origen'])],
+                cuenta_destino=cuentas[str(item['cuenta_destino'])],
+                monto=Decimal(str(item['monto'])),
+                concepto=item.get('motivo', '')
+            )
+            validas.append((indice, transferencia))
+
+        errores = ejecutar_lote([transferencia for _, transferencia in validas])
+
+        for (indice, transferencia), error in zip(validas, errores):
+            if error:
+                resultados[indice] = {
+                    'indice': indice, 'success': False,
+                    'error': 'Error al procesar transferencia', 'message': error
+                }
+            elif transferencia.estado == 'COMPLETADA':
+                resultados[indice] = {
+                    'indice': indice, 'success': True,
+                    'referencia': transferencia.referencia,
+                    'estado': transferencia.estado,
+                    'monto': str(transferencia.monto)
+                }
+            else:
+                resultados[indice] = {
+                    'indice': indice, 'success': False,
+                    'error': 'Saldo insuficiente',
+                    'message': 'Saldo insuficiente',
+                    'referencia': transferencia.referencia,
+                    'estado': transferencia.estado
+                }
+
+        completadas = sum(1 for resultado in resultados if resultado['success'])
+        return JsonResponse({
+            'success': completadas == len(items),
+            'total': len(items),
+            'completadas': completadas,
+            'fallidas': len(items) - completadas,
+            'resultados': resultados
+        }, status=200)
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Formato JSON inválido',
+            'message': 'El cuerpo de la petición debe ser un JSON válido'
+        }, status=400)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'Error interno del servidor',
+            'message': str(e)
+        }, status=500)
+
+
+def _validar_item_lote(item, cuentas):
+    """Aplica a un item del lote las mismas validaciones que realizar_transferencia_api"""
+    if not isinstance(item, dict):
+        return 'Item inválido', 'Cada transferencia debe ser un objeto JSON'
+
+    numero_cuenta_origen = item.get('cuenta_origen')
+    numero_cuenta_destino = item.get('cuenta_destino')
+    monto = item.get('monto')
+
+    if not all([numero_cuenta_origen, numero_cuenta_destino, monto]):
+        return 'Parámetros faltantes', 'Se requieren: cuenta_origen, cuenta_destino y monto'
+
+    try:
+        monto_decimal = Decimal(str(monto))
+        if not monto_decimal.is_finite() or monto_decimal <= 0:
+            return 'Monto inválido', 'El monto debe ser mayor a cero'
+    except (ValueError, TypeError, ArithmeticError):
+        return 'Monto inválido', 'El formato del monto es incorrecto'
+
+    if str(numero_cuenta_origen) not in cuentas:
+        return 'Cuenta origen no encontrada', f'No existe una cuenta activa con el número: {numero_cuenta_origen}'
+    if str(numero_cuenta_destino) not in cuentas:
+        return 'Cuenta destino no encontrada', f'No existe una cuenta activa con el número: {numero_cuenta_destino}'
+
+    if str(numero_cuenta_origen) == str(numero_cuenta_destino):
+        return 'Transferencia inválida', 'No se puede transferir a la misma cuenta'
+
+    return None